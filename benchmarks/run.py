@@ -0,0 +1,327 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from src.database.db_manger import DatabaseManager
+from src.engine.link import open_link
+from src.engine.lis_server import LISServer
+from src.engine.messages import astm_result_records, hl7_result_message
+from src.engine.session import AnalyzerSession
+from src.utils.astm import ASTMFrameParser, encode_records
+from src.utils.hl7 import MLLPFramer, wrap
+
+# Reproducible throughput/latency benchmarks for the communication stack.
+# Every case builds its workload from a fixed seed, times each operation
+# and reports operations per second with p50/p95/p99 latency:
+#
+#   python -m benchmarks.run                      # run everything
+#   python -m benchmarks.run astm_parse --save    # record a baseline
+#   python -m benchmarks.run --compare            # fail on regressions
+#
+# Baselines are plain JSON (benchmarks/baseline.json by default), one entry
+# per case, so they can be kept per machine and diffed between runs.
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+TESTS = [
+    (1, "GLU", "mmol/l", 3.9, 6.1),
+    (2, "UREA", "mmol/l", 2.5, 7.8),
+    (3, "CREA", "umol/l", 60.0, 110.0),
+    (4, "ALT", "U/l", 5.0, 40.0),
+    (5, "NA", "mmol/l", 135.0, 145.0),
+    (6, "K", "mmol/l", 3.5, 5.1),
+]
+
+# Loopback segment size used to cut the byte streams into reads
+CHUNK = 1460
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(name, unit, latencies, elapsed, items=None):
+    # latencies are seconds per operation; items counts the units processed
+    # when an operation handles more than one (e.g. rows per batch)
+    ordered = sorted(latencies)
+    count = items if items is not None else len(latencies)
+    return {
+        "name": name,
+        "unit": unit,
+        "count": count,
+        "per_sec": round(count / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_us": round(percentile(ordered, 0.50) * 1e6, 1),
+        "p95_us": round(percentile(ordered, 0.95) * 1e6, 1),
+        "p99_us": round(percentile(ordered, 0.99) * 1e6, 1),
+    }
+
+
+def timed(operations):
+    # Runs each zero-argument callable, returning per-call latencies and the
+    # total wall time
+    latencies = []
+    clock = time.perf_counter
+    started = clock()
+    for operation in operations:
+        start = clock()
+        operation()
+        latencies.append(clock() - start)
+    return latencies, clock() - started
+
+
+def sample_messages(count, seed):
+    rng = random.Random(seed)
+    messages = []
+    for index in range(count):
+        sample = (f"S{index:07d}", f"P{index:07d}", f"Patient^{index}")
+        tests = rng.sample(TESTS, rng.randint(1, len(TESTS)))
+        results = [(test, round(rng.uniform(test[3] * 0.8, test[4] * 1.2), 3)) for test in tests]
+        messages.append((sample, results))
+    return messages
+
+
+def astm_messages(count, seed):
+    return [astm_result_records("Bench", sample, results, "20240101000000")
+            for sample, results in sample_messages(count, seed)]
+
+
+def hl7_messages(count, seed):
+    return [hl7_result_message("Bench", sample, results, str(index), "20240101000000")
+            for index, (sample, results) in enumerate(sample_messages(count, seed))]
+
+
+def chunks(data):
+    return [data[start:start + CHUNK] for start in range(0, len(data), CHUNK)]
+
+
+# Cases; each takes (size, seed) and returns a summary
+
+def bench_astm_encode(size, seed):
+    messages = astm_messages(size, seed)
+    latencies, elapsed = timed(lambda records=records: encode_records(records)
+                               for records in messages)
+    return summarize("astm_encode", "messages", latencies, elapsed)
+
+
+def bench_astm_parse(size, seed):
+    # One message's frames at a time, cut into TCP-sized reads
+    streams = [chunks(b"\x05" + b"".join(encode_records(records)) + b"\x04")
+               for records in astm_messages(size, seed)]
+    parser = ASTMFrameParser()
+
+    def parse(reads):
+        for data in reads:
+            parser.feed(data)
+    latencies, elapsed = timed(lambda reads=reads: parse(reads) for reads in streams)
+    return summarize("astm_parse", "messages", latencies, elapsed)
+
+
+def bench_hl7_framing(size, seed):
+    streams = [chunks(wrap(message)) for message in hl7_messages(size, seed)]
+    received = []
+    framer = MLLPFramer(received.append)
+
+    def frame(reads):
+        for data in reads:
+            framer.feed(data)
+    latencies, elapsed = timed(lambda reads=reads: frame(reads) for reads in streams)
+    assert len(received) == size
+    return summarize("hl7_framing", "messages", latencies, elapsed)
+
+
+def _database(directory):
+    db = DatabaseManager(os.path.join(directory, "bench.db"))
+    db.create_database()
+    db.save_tests(1, [test[1:] for test in TESTS])
+    tests = db.query("SELECT id, test_code, unit, lower_range, upper_range FROM tests "
+                     "WHERE analyzer_id = 1 ORDER BY id")
+    return db, tests
+
+
+def bench_db_samples(size, seed, batch=1000):
+    # Latency is per batch of upserts, throughput in rows
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        db, _ = _database(directory)
+        batches = [[(f"S{start + index:07d}", f"P{rng.randrange(10 ** 6):07d}", f"Patient^{index}")
+                    for index in range(min(batch, size - start))]
+                   for start in range(0, size, batch)]
+        latencies, elapsed = timed(lambda rows=rows: db.store_samples(rows) for rows in batches)
+        db.close()
+    return summarize("db_samples", "rows", latencies, elapsed, size)
+
+
+def bench_db_results(size, seed, batch=1000):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        db, tests = _database(directory)
+        numbers = [f"S{index:07d}" for index in range(size)]
+        db.store_samples((number, "P", "Patient") for number in numbers)
+        values = [[round(rng.uniform(test[3], test[4]), 3) for test in tests] for _ in numbers]
+        batches = [(numbers[start:start + batch], values[start:start + batch])
+                   for start in range(0, size, batch)]
+        latencies, elapsed = timed(lambda part=part: db.store_results(part[0], tests, part[1])
+                                   for part in batches)
+        db.close()
+    return summarize("db_results", "rows", latencies, elapsed, size * len(tests))
+
+
+async def _loopback(protocol, messages, connections):
+    # Send-to-ACK latency of whole messages against the LIS stand-in, with
+    # connections analyzers sending concurrently
+    latencies = []
+    clock = time.perf_counter
+    async with LISServer() as server:
+        sessions = []
+        for _ in range(connections):
+            link = await open_link(protocol, "TCP/IP",
+                                   {"mode": "Client", "host": server.host, "port": server.port})
+            sessions.append(AnalyzerSession(link, protocol))
+
+        async def run(session, share):
+            send = session.send_astm if protocol == "ASTM" else session.send_hl7
+            for message in share:
+                start = clock()
+                await send(message)
+                latencies.append(clock() - start)
+
+        started = clock()
+        await asyncio.gather(*(run(session, messages[index::connections])
+                               for index, session in enumerate(sessions)))
+        elapsed = clock() - started
+        for session in sessions:
+            await session.close()
+    return latencies, elapsed
+
+
+def bench_loopback_astm(size, seed, connections=8):
+    latencies, elapsed = asyncio.run(_loopback("ASTM", astm_messages(size, seed), connections))
+    return summarize("loopback_astm", "messages", latencies, elapsed)
+
+
+def bench_loopback_hl7(size, seed, connections=8):
+    latencies, elapsed = asyncio.run(_loopback("HL7", hl7_messages(size, seed), connections))
+    return summarize("loopback_hl7", "messages", latencies, elapsed)
+
+
+# name: (function, default workload size)
+CASES = {
+    "astm_encode": (bench_astm_encode, 20000),
+    "astm_parse": (bench_astm_parse, 20000),
+    "hl7_framing": (bench_hl7_framing, 20000),
+    "db_samples": (bench_db_samples, 50000),
+    "db_results": (bench_db_results, 20000),
+    "loopback_astm": (bench_loopback_astm, 2000),
+    "loopback_hl7": (bench_loopback_hl7, 2000),
+}
+
+
+def compare(results, baseline, tolerance):
+    # A case regresses when its throughput drops, or its p95 latency grows,
+    # by more than tolerance (a fraction) against the baseline
+    regressions = []
+    lines = []
+    for result in results:
+        base = baseline.get(result["name"])
+        if not base:
+            lines.append(f"  {result['name']:<14} no baseline")
+            continue
+        rate = result["per_sec"] / base["per_sec"] - 1 if base["per_sec"] else 0.0
+        p95 = result["p95_us"] / base["p95_us"] - 1 if base["p95_us"] else 0.0
+        regressed = rate < -tolerance or p95 > tolerance
+        if regressed:
+            regressions.append(result["name"])
+        lines.append(f"  {result['name']:<14} throughput {rate:+7.1%}  p95 {p95:+7.1%}"
+                     f"{'  REGRESSION' if regressed else ''}")
+    return regressions, lines
+
+
+def format_result(result):
+    return (f"{result['name']:<14} {result['per_sec']:>12,.1f} {result['unit']}/s  "
+            f"p50 {result['p50_us']:>9.1f}us  p95 {result['p95_us']:>9.1f}us  "
+            f"p99 {result['p99_us']:>9.1f}us  ({result['count']} {result['unit']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmarks")
+    parser.add_argument("cases", nargs="*", help=f"cases to run (default: all of {', '.join(CASES)})")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiplier for every workload size, e.g. 0.1 for a quick run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per case; the fastest is reported (default 3)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="write the results as the baseline")
+    parser.add_argument("--compare", action="store_true",
+                        help="compare against the baseline and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed slowdown as a fraction (default 0.10)")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    results = []
+    for name in args.cases or CASES:
+        function, size = CASES[name]
+        # Best of several runs, which filters out scheduler and cache noise
+        runs = [function(max(1, int(size * args.scale)), args.seed)
+                for _ in range(max(1, args.repeat))]
+        result = max(runs, key=lambda run: run["per_sec"])
+        results.append(result)
+        print(format_result(result), flush=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": {result["name"]: result for result in results},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save first")
+            status = 1
+        else:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            if baseline.get("scale") != args.scale:
+                print(f"Note: baseline was recorded with --scale {baseline.get('scale')}")
+            regressions, lines = compare(results, baseline["results"], args.tolerance)
+            print(f"Compared with {args.baseline} ({baseline.get('created')}):")
+            print("\n".join(lines))
+            if regressions:
+                print(f"Regressed: {', '.join(regressions)}")
+                status = 1
+
+    if args.save:
+        # Cases not run this time keep their previous baseline entries
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                previous = json.load(f)
+            report["results"] = dict(previous.get("results", {}), **report["results"])
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
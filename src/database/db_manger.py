@@ -1,94 +1,95 @@
+import csv
+import json
+import os
 import sqlite3
+import threading
+import weakref
+import zlib
 from datetime import datetime
-import random
+from src.database.migrations import migrate
+
+class _ThreadConnection:
+    # One thread's connection. Only the thread's threading.local refers to
+    # it, so it is dropped, and the connection closed, when the thread exits.
+    def __init__(self, conn):
+        self.conn = conn
+
+    def close(self):
+        try:
+            self.conn.close()
+        except sqlite3.Error:
+            pass
+
+    def __del__(self):
+        self.close()
+
 
 class DatabaseManager:
-    def __init__(self, db_path='analyzersim.db'):
+    # Every thread (GUI, engine loop, to_thread workers) gets one long-lived
+    # connection in WAL mode, so readers don't block the writer and calls
+    # don't pay for a connect per query. Each connection keeps sqlite3's
+    # prepared statement cache warm for the queries below, and is closed
+    # when its thread exits.
+    def __init__(self, db_path='analyzersim.db', cache_size_kb=20000, cached_statements=256):
         self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        # Open connections, for close(); entries go when their thread does
+        self._connections = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    @property
+    def open_connections(self):
+        return len(self._connections)
+
+    def connection(self):
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   cached_statements=self.cached_statements,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            # NORMAL only skips the fsync per commit, which WAL makes safe
+            # against corruption
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            holder = self._local.holder = _ThreadConnection(conn)
+            with self._lock:
+                self._connections.add(holder)
+        return holder.conn
+
+    def query(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchone()
+
+    def execute(self, sql, params=()):
+        conn = self.connection()
+        with conn:
+            return conn.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        conn = self.connection()
+        with conn:
+            return conn.executemany(sql, rows)
+
+    def close(self):
+        # Closes the connections of every thread, on application exit
+        with self._lock:
+            holders, self._connections = list(self._connections), weakref.WeakSet()
+        self._local = threading.local()
+        for holder in holders:
+            holder.close()
 
     def create_database(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connection()
         cursor = conn.cursor()
         
-        # Create analyzer table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS analyzers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE
-        )
-        ''')
-        
-        # Create connection settings table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS connection_settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            analyzer_id INTEGER,
-            connection_type TEXT,
-            socket_type TEXT,
-            analyzer_address TEXT,
-            analyzer_port TEXT,
-            lis_address TEXT,
-            lis_port TEXT,
-            serial_port TEXT,
-            baud_rate TEXT,
-            data_bits TEXT,
-            stop_bits TEXT,
-            parity TEXT,
-            auto_result_sending INTEGER,
-            request_sample_info INTEGER,
-            sample_id_delay INTEGER,
-            result_sending_delay INTEGER,
-            FOREIGN KEY (analyzer_id) REFERENCES analyzers(id)
-        )
-        ''')
-        
-        # Create ASTM message templates table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS astm_templates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            analyzer_id INTEGER,
-            template_type TEXT,
-            template_content TEXT,
-            FOREIGN KEY (analyzer_id) REFERENCES analyzers(id)
-        )
-        ''')
-        
-        # Create tests table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            analyzer_id INTEGER,
-            test_code TEXT,
-            unit TEXT,
-            lower_range REAL,
-            upper_range REAL,
-            FOREIGN KEY (analyzer_id) REFERENCES analyzers(id)
-        )
-        ''')
-        
-        # Create samples table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS samples (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sample_number TEXT,
-            patient_id TEXT,
-            patient_name TEXT,
-            date_time TEXT
-        )
-        ''')
-        
-        # Create results table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sample_id INTEGER,
-            test_id INTEGER,
-            result_value REAL,
-            sent INTEGER DEFAULT 0,
-            FOREIGN KEY (sample_id) REFERENCES samples(id),
-            FOREIGN KEY (test_id) REFERENCES tests(id)
-        )
-        ''')
+        # Bring the schema up to date before touching any data
+        migrate(conn)
         
         # Insert some initial data if needed
         cursor.execute("SELECT COUNT(*) FROM analyzers")
@@ -111,4 +112,346 @@ class DatabaseManager:
                 ''', (analyzer_id, test[0], test[1], test[2], test[3]))
         
         conn.commit()
-        conn.close()        
\ No newline at end of file
+
+    def get_analyzers(self):
+        return self.query("SELECT id, name FROM analyzers")
+
+    def get_analyzer_config(self, analyzer_id):
+        # Row access is set on the cursor only, the connection is shared
+        cursor = self.connection().cursor()
+        cursor.row_factory = sqlite3.Row
+
+        cursor.execute("SELECT id, name FROM analyzers WHERE id = ?", (analyzer_id,))
+        analyzer = cursor.fetchone()
+        if not analyzer:
+            return None
+
+        cursor.execute("""
+            SELECT connection_type, socket_type, analyzer_address, analyzer_port,
+                   lis_address, lis_port, serial_port, baud_rate, data_bits,
+                   stop_bits, parity, auto_result_sending, request_sample_info,
+                   sample_id_delay, result_sending_delay, protocol
+            FROM connection_settings
+            WHERE analyzer_id = ?
+        """, (analyzer_id,))
+        settings = cursor.fetchone()
+
+        cursor.execute("""
+            SELECT template_type, template_content
+            FROM astm_templates
+            WHERE analyzer_id = ?
+        """, (analyzer_id,))
+        templates = {row[0]: row[1] for row in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT id, test_code, unit, lower_range, upper_range
+            FROM tests
+            WHERE analyzer_id = ?
+        """, (analyzer_id,))
+        tests = [tuple(row) for row in cursor.fetchall()]
+
+        return {
+            "id": analyzer["id"],
+            "name": analyzer["name"],
+            "settings": dict(settings) if settings else None,
+            "templates": templates,
+            "tests": tests,
+        }
+
+    def save_connection_settings(self, analyzer_id, settings):
+        # settings maps connection_settings columns to values; upserts on
+        # the one-row-per-analyzer index
+        columns = list(settings)
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        assignments = ", ".join(f"{column} = excluded.{column}" for column in columns)
+
+        self.execute(f"""
+            INSERT INTO connection_settings (analyzer_id, {', '.join(columns)})
+            VALUES ({placeholders})
+            ON CONFLICT(analyzer_id) DO UPDATE SET {assignments}
+        """, [analyzer_id] + [settings[column] for column in columns])
+
+    def save_tests(self, analyzer_id, tests):
+        # tests are (test_code, unit, lower_range, upper_range) rows
+        conn = self.connection()
+        with conn:
+            self._save_tests(conn, analyzer_id, tests)
+
+    def save_analyzer_setup(self, analyzer_id, templates, tests):
+        # save_templates and save_tests in one transaction: both or neither
+        conn = self.connection()
+        with conn:
+            self._save_templates(conn, analyzer_id, templates)
+            self._save_tests(conn, analyzer_id, tests)
+
+    def _save_tests(self, conn, analyzer_id, tests):
+        conn.execute("DELETE FROM tests WHERE analyzer_id = ?", (analyzer_id,))
+        conn.executemany("""
+            INSERT INTO tests (analyzer_id, test_code, unit, lower_range, upper_range)
+            VALUES (?, ?, ?, ?, ?)
+        """, ((analyzer_id,) + tuple(test) for test in tests))
+        self._changed(conn, "orders")
+
+    def _changed(self, conn, name):
+        # Bumps a change counter inside the caller's transaction, so it only
+        # moves if the write commits
+        conn.execute("UPDATE change_counters SET value = value + 1 WHERE name = ?", (name,))
+
+    def change_counter(self, name):
+        row = self.query_one("SELECT value FROM change_counters WHERE name = ?", (name,))
+        return row[0] if row else 0
+
+    def save_templates(self, analyzer_id, templates):
+        # templates maps template_type to its text; one row per type
+        conn = self.connection()
+        with conn:
+            self._save_templates(conn, analyzer_id, templates)
+
+    def _save_templates(self, conn, analyzer_id, templates):
+        conn.executemany("""
+            INSERT INTO astm_templates (analyzer_id, template_type, template_content)
+            VALUES (?, ?, ?)
+            ON CONFLICT(analyzer_id, template_type) DO UPDATE SET
+            template_content = excluded.template_content
+        """, ((analyzer_id, template_type, content) for template_type, content in templates.items()))
+
+    def store_samples(self, samples, progress=None, chunk_size=5000):
+        # samples are (sample_number, patient_id, patient_name) rows; batched
+        # upserts keyed on the unique sample_number index, in one transaction.
+        # progress(done, total) is called after every chunk and may raise to
+        # cancel, which rolls the whole batch back
+        samples = list(samples)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = self.connection()
+        with conn:
+            for start in range(0, len(samples), chunk_size):
+                conn.executemany("""
+                    INSERT INTO samples (sample_number, patient_id, patient_name, date_time)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(sample_number) DO UPDATE SET
+                    patient_id = excluded.patient_id,
+                    patient_name = excluded.patient_name,
+                    date_time = excluded.date_time
+                """, ((sample_number, patient_id, patient_name, now)
+                      for sample_number, patient_id, patient_name
+                      in samples[start:start + chunk_size]))
+                if progress:
+                    progress(min(start + chunk_size, len(samples)), len(samples))
+            self._changed(conn, "orders")
+
+    def store_results(self, sample_numbers, tests, values, progress=None, chunk_size=5000):
+        # values holds one row per sample number, in the order of tests.
+        # Sample ids are resolved with one query and the results are written
+        # by batched upserts keyed on (sample_id, test_id); progress works as
+        # in store_samples, counting samples
+        conn = self.connection()
+        sample_numbers = list(sample_numbers)
+        cursor = conn.execute("""
+            SELECT sample_number, id FROM samples
+            WHERE sample_number IN (SELECT value FROM json_each(?))
+        """, (json.dumps(sample_numbers),))
+        sample_db_ids = dict(cursor.fetchall())
+        test_ids = [test[0] for test in tests]
+
+        values = list(values)
+        with conn:
+            for start in range(0, len(sample_numbers), chunk_size):
+                end = start + chunk_size
+                conn.executemany("""
+                    INSERT INTO results (sample_id, test_id, result_value, sent)
+                    VALUES (?, ?, ?, 0)
+                    ON CONFLICT(sample_id, test_id) DO UPDATE SET
+                    result_value = excluded.result_value,
+                    sent = 0
+                """, ((sample_db_ids[sample_number], test_id, result_value)
+                      for sample_number, row in zip(sample_numbers[start:end], values[start:end])
+                      for test_id, result_value in zip(test_ids, row)))
+                if progress:
+                    progress(min(end, len(sample_numbers)), len(sample_numbers))
+            self._changed(conn, "orders")
+
+    def get_samples_page(self, after=None, limit=200):
+        # Newest first, keyset-paginated on (date_time, id): after is the
+        # (date_time, id) of the last row of the previous page, so every page
+        # is one range scan of idx_samples_date_time however deep it is
+        if after is None:
+            return self.query("""
+                SELECT id, sample_number, patient_id, patient_name, date_time
+                FROM samples
+                ORDER BY date_time DESC, id DESC
+                LIMIT ?
+            """, (limit,))
+        return self.query("""
+            SELECT id, sample_number, patient_id, patient_name, date_time
+            FROM samples
+            WHERE (date_time, id) < (?, ?)
+            ORDER BY date_time DESC, id DESC
+            LIMIT ?
+        """, (after[0], after[1], limit))
+
+    def get_sample_results(self, sample_db_id):
+        cursor = self.connection().cursor()
+
+        cursor.execute("""
+            SELECT patient_id, patient_name
+            FROM samples
+            WHERE id = ?
+        """, (sample_db_id,))
+        patient = cursor.fetchone()
+
+        cursor.execute("""
+            SELECT r.id, t.test_code, r.result_value, t.unit, t.lower_range, t.upper_range, r.sent
+            FROM results r
+            JOIN tests t ON r.test_id = t.id
+            WHERE r.sample_id = ?
+        """, (sample_db_id,))
+        results = cursor.fetchall()
+
+        return patient, results
+
+    def get_sample_orders(self, sample_numbers):
+        # What a LIS knows about each sample, for answering host queries:
+        # sample number -> (patient_id, patient_name, test_codes), the tests
+        # being those the sample has results for. Unknown samples are left
+        # out. One query for the whole batch
+        orders = {}
+        for sample_number, patient_id, patient_name, test_code in self.query("""
+            SELECT s.sample_number, s.patient_id, s.patient_name, t.test_code
+            FROM samples s
+            LEFT JOIN results r ON r.sample_id = s.id
+            LEFT JOIN tests t ON r.test_id = t.id
+            WHERE s.sample_number IN (SELECT value FROM json_each(?))
+            ORDER BY s.id, r.test_id
+        """, (json.dumps(list(sample_numbers)),)):
+            order = orders.setdefault(sample_number, (patient_id or "", patient_name or "", []))
+            if test_code:
+                order[2].append(test_code)
+        return orders
+
+    def get_results_to_send(self, result_ids):
+        # One row per result with its sample, patient and test, grouped by
+        # sample in result order
+        return self.query("""
+            SELECT r.id, s.sample_number, s.patient_id, s.patient_name,
+                   t.id, t.test_code, t.unit, t.lower_range, t.upper_range, r.result_value
+            FROM results r
+            JOIN samples s ON r.sample_id = s.id
+            JOIN tests t ON r.test_id = t.id
+            WHERE r.id IN (SELECT value FROM json_each(?))
+            ORDER BY r.sample_id, r.id
+        """, (json.dumps(list(result_ids)),))
+
+    def mark_results_sent(self, result_ids):
+        # One statement for the whole batch
+        self.execute("""
+            UPDATE results SET sent = 1
+            WHERE id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(list(result_ids)),))
+
+    def export_results(self, path, progress=None, chunk_size=5000):
+        # Streams every result to a CSV file. The file is written under a
+        # temporary name and only replaces path once complete, so a cancelled
+        # or failed export leaves nothing half-written behind
+        total = self.query_one("SELECT COUNT(*) FROM results")[0]
+        cursor = self.connection().execute("""
+            SELECT s.sample_number, s.patient_id, s.patient_name, t.test_code,
+                   r.result_value, t.unit, t.lower_range, t.upper_range, r.sent
+            FROM results r
+            JOIN samples s ON r.sample_id = s.id
+            JOIN tests t ON r.test_id = t.id
+            ORDER BY r.sample_id, r.test_id
+        """)
+        temp_path = path + ".part"
+        done = 0
+        try:
+            with open(temp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["Sample No.", "Patient ID", "Patient Name", "Test Code",
+                                 "Result", "Unit", "Lower Range", "Upper Range", "Sent"])
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    done += len(rows)
+                    if progress:
+                        progress(done, total)
+            os.replace(temp_path, path)
+        except BaseException:
+            cursor.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return done
+
+    def store_messages(self, rows):
+        # rows are (logged_at, analyzer, direction, protocol, control_id,
+        # compressed, body, text, sample_numbers) from MessageLog, written in
+        # one transaction. Ids are assigned here so the sample and full-text
+        # rows can reference them without a query per message
+        conn = self.connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            first = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM message_log").fetchone()[0]
+            conn.executemany("""
+                INSERT INTO message_log (id, logged_at, analyzer, direction, protocol,
+                                         control_id, compressed, body)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, ((first + index,) + tuple(row[:7]) for index, row in enumerate(rows)))
+            conn.executemany("INSERT INTO message_samples (message_id, sample_number) VALUES (?, ?)",
+                             ((first + index, sample_number)
+                              for index, row in enumerate(rows) for sample_number in row[8]))
+            if self.has_message_search():
+                conn.executemany("INSERT INTO message_log_fts (rowid, text) VALUES (?, ?)",
+                                 ((first + index, row[7]) for index, row in enumerate(rows)))
+
+    def has_message_search(self):
+        # False when SQLite was built without FTS5 and the table is missing
+        if not hasattr(self, "_message_search"):
+            self._message_search = self.query_one(
+                "SELECT 1 FROM sqlite_master WHERE name = 'message_log_fts'") is not None
+        return self._message_search
+
+    def get_messages(self, sample_number=None, control_id=None, analyzer=None, search=None,
+                     limit=200):
+        # Newest logged messages matching every filter given, as (id,
+        # logged_at, analyzer, direction, protocol, control_id, text) rows.
+        # Each filter is answered from an index: sample numbers from
+        # message_samples, text from the FTS5 table (a phrase search, read
+        # newest first), so a lookup costs the same with millions of
+        # messages logged
+        source = "message_log m"
+        order = "m.id"
+        conditions = []
+        params = []
+        if search:
+            if self.has_message_search():
+                source = "message_log_fts f JOIN message_log m ON m.id = f.rowid"
+                order = "f.rowid"
+                conditions.append("message_log_fts MATCH ?")
+                params.append('"' + search.replace('"', '""') + '"')
+            else:
+                # Only uncompressed bodies can be matched without FTS5
+                conditions.append("m.compressed = 0 AND CAST(m.body AS TEXT) LIKE ?")
+                params.append(f"%{search}%")
+        if sample_number:
+            source += " JOIN message_samples ms ON ms.message_id = m.id"
+            conditions.append("ms.sample_number = ?")
+            params.append(sample_number)
+        if control_id:
+            conditions.append("m.control_id = ?")
+            params.append(control_id)
+        if analyzer:
+            conditions.append("m.analyzer = ?")
+            params.append(analyzer)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.query(f"""
+            SELECT m.id, m.logged_at, m.analyzer, m.direction, m.protocol, m.control_id,
+                   m.compressed, m.body
+            FROM {source}
+            {where}
+            ORDER BY {order} DESC
+            LIMIT ?
+        """, params + [limit])
+        return [row[:6] + ((zlib.decompress(row[7]) if row[6] else row[7]).decode("latin-1"),)
+                for row in rows]
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+
+# Persistent log of every message sent or received, searchable by sample
+# number, control id, analyzer, time and text. Callers on the I/O paths
+# only put the raw message on a queue; a writer thread extracts the ids,
+# compresses the body and stores whole batches in one transaction each.
+
+
+def _field(fields, index):
+    # First component of a field, or "" when the record is shorter
+    return fields[index].split(b"^")[0] if index < len(fields) else b""
+
+
+def astm_ids(records):
+    # (control id, sample numbers) of an ASTM message: H-3 is the message
+    # control id, O-3 (specimen id) or Q-3 (queried ids, repeats split on
+    # "\") name the samples
+    control_id = b""
+    samples = []
+    for record in records:
+        kind = record[:1]
+        if kind == b"H":
+            control_id = _field(record.split(b"|"), 2)
+        elif kind == b"O":
+            samples.append(_field(record.split(b"|"), 2))
+        elif kind == b"Q":
+            fields = record.split(b"|")
+            if len(fields) > 2:
+                for repeat in fields[2].split(b"\\"):
+                    components = [c for c in repeat.split(b"^") if c]
+                    if components:
+                        samples.append(components[0])
+    return control_id, samples
+
+
+def hl7_ids(message):
+    # (control id, sample numbers) of an HL7 message: MSH-10, then the
+    # placer/filler numbers of OBR and ORC (fields 2 and 3), SPM-2 and QRD-8
+    segments = message.split(b"\r")
+    separator = message[3:4] or b"|"
+    control_id = b""
+    samples = []
+    for segment in segments:
+        name = segment[:3]
+        if name == b"MSH":
+            control_id = _field(segment.split(separator), 9)
+        elif name in (b"OBR", b"ORC"):
+            fields = segment.split(separator)
+            samples.append(_field(fields, 3) or _field(fields, 2))
+        elif name == b"SPM":
+            samples.append(_field(segment.split(separator), 2))
+        elif name == b"QRD":
+            fields = segment.split(separator)
+            if len(fields) > 8:
+                samples.extend(repeat.split(b"^")[0] for repeat in fields[8].split(b"~"))
+    return control_id, samples
+
+
+class MessageLog:
+    """Batched, non-blocking writer for the message_log table.
+
+    log() returns straight away; start() runs the writer thread and stop()
+    flushes what is queued. Messages are ASTM record lists, raw ASTM
+    message bytes or HL7 messages. With compress, bodies are stored
+    zlib-compressed whenever that makes them smaller.
+    """
+
+    def __init__(self, db_manager, compress=False, batch_size=500, interval=0.2):
+        self.db = db_manager
+        self.compress = compress
+        self.batch_size = batch_size
+        self.interval = interval
+        self.logged = 0
+        self.dropped = 0
+        self.last_error = None
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    def log(self, direction, protocol, message, analyzer=""):
+        # direction is "sent" or "received"
+        self._queue.put((time.time(), direction, protocol, message, analyzer))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="message-log", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                entry = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while entry is not None:
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            if entry is None:
+                return
+
+    def _write(self, batch):
+        rows = []
+        for logged_at, direction, protocol, message, analyzer in batch:
+            if isinstance(message, list):
+                control_id, samples = astm_ids(message)
+                message = b"\r".join(message)
+            elif protocol == "ASTM":
+                control_id, samples = astm_ids(message.replace(b"\n", b"\r").split(b"\r"))
+            else:
+                control_id, samples = hl7_ids(message)
+            text = message.decode("latin-1")
+            body, compressed = message, 0
+            if self.compress:
+                packed = zlib.compress(message)
+                if len(packed) < len(message):
+                    body, compressed = packed, 1
+            rows.append((datetime.fromtimestamp(logged_at).isoformat(" ", "milliseconds"),
+                         analyzer, direction, protocol, control_id.decode("latin-1"), compressed,
+                         body, text, {sample.decode("latin-1") for sample in samples if sample}))
+        try:
+            self.db.store_messages(rows)
+            self.logged += len(rows)
+        except Exception as e:
+            # Logging must never take the link down; keep count instead
+            self.dropped += len(rows)
+            self.last_error = e
@@ -0,0 +1,230 @@
+# Schema migrations. Each function upgrades the database by one version and
+# PRAGMA user_version records how many have been applied, so existing
+# analyzersim.db files are upgraded in place on startup. Append new
+# migrations to MIGRATIONS; never edit one that has shipped.
+
+import sqlite3
+
+
+def initial_schema(cursor):
+    # Create analyzer table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS analyzers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE
+    )
+    ''')
+    
+    # Create connection settings table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS connection_settings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        analyzer_id INTEGER,
+        connection_type TEXT,
+        socket_type TEXT,
+        analyzer_address TEXT,
+        analyzer_port TEXT,
+        lis_address TEXT,
+        lis_port TEXT,
+        serial_port TEXT,
+        baud_rate TEXT,
+        data_bits TEXT,
+        stop_bits TEXT,
+        parity TEXT,
+        auto_result_sending INTEGER,
+        request_sample_info INTEGER,
+        sample_id_delay INTEGER,
+        result_sending_delay INTEGER,
+        FOREIGN KEY (analyzer_id) REFERENCES analyzers(id)
+    )
+    ''')
+    
+    # Create ASTM message templates table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS astm_templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        analyzer_id INTEGER,
+        template_type TEXT,
+        template_content TEXT,
+        FOREIGN KEY (analyzer_id) REFERENCES analyzers(id)
+    )
+    ''')
+    
+    # Create tests table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        analyzer_id INTEGER,
+        test_code TEXT,
+        unit TEXT,
+        lower_range REAL,
+        upper_range REAL,
+        FOREIGN KEY (analyzer_id) REFERENCES analyzers(id)
+    )
+    ''')
+    
+    # Create samples table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS samples (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sample_number TEXT,
+        patient_id TEXT,
+        patient_name TEXT,
+        date_time TEXT
+    )
+    ''')
+    
+    # Create results table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sample_id INTEGER,
+        test_id INTEGER,
+        result_value REAL,
+        sent INTEGER DEFAULT 0,
+        FOREIGN KEY (sample_id) REFERENCES samples(id),
+        FOREIGN KEY (test_id) REFERENCES tests(id)
+    )
+    ''')
+
+
+def unique_samples_and_results(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_samples_sample_number'")
+    if not cursor.fetchone():
+        # Older databases may hold duplicate sample numbers; keep the
+        # first row of each and move the duplicates' results onto it
+        cursor.execute("""
+            UPDATE results SET sample_id = (
+                SELECT MIN(s2.id) FROM samples s1
+                JOIN samples s2 ON s2.sample_number = s1.sample_number
+                WHERE s1.id = results.sample_id
+            )
+            WHERE sample_id IN (
+                SELECT id FROM samples
+                WHERE id NOT IN (SELECT MIN(id) FROM samples GROUP BY sample_number)
+            )
+        """)
+        cursor.execute("""
+            DELETE FROM samples
+            WHERE id NOT IN (SELECT MIN(id) FROM samples GROUP BY sample_number)
+        """)
+        cursor.execute("CREATE UNIQUE INDEX idx_samples_sample_number ON samples(sample_number)")
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_results_sample_test'")
+    if not cursor.fetchone():
+        # Keep the newest result for each sample/test pair
+        cursor.execute("""
+            DELETE FROM results
+            WHERE id NOT IN (SELECT MAX(id) FROM results GROUP BY sample_id, test_id)
+        """)
+        cursor.execute("CREATE UNIQUE INDEX idx_results_sample_test ON results(sample_id, test_id)")
+
+
+def lookup_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tests_analyzer ON tests(analyzer_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_samples_date_time ON samples(date_time, id)")
+
+    # One connection settings row per analyzer, keeping the latest one saved
+    cursor.execute("""
+        DELETE FROM connection_settings
+        WHERE id NOT IN (SELECT MAX(id) FROM connection_settings GROUP BY analyzer_id)
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_connection_settings_analyzer
+        ON connection_settings(analyzer_id)
+    """)
+
+    # One template of each type per analyzer
+    cursor.execute("""
+        DELETE FROM astm_templates
+        WHERE id NOT IN (SELECT MAX(id) FROM astm_templates GROUP BY analyzer_id, template_type)
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_astm_templates_analyzer_type
+        ON astm_templates(analyzer_id, template_type)
+    """)
+
+
+def connection_protocol(cursor):
+    # Message protocol spoken over the connection, ASTM or HL7
+    cursor.execute("ALTER TABLE connection_settings ADD COLUMN protocol TEXT DEFAULT 'ASTM'")
+
+
+def message_log(cursor):
+    # Every message sent or received. body may be zlib-compressed
+    # (compressed = 1); the text stays searchable through the contentless
+    # FTS5 table, whose rowids are message_log ids. One transfer can carry
+    # several samples, so sample numbers live in their own table.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS message_log (
+        id INTEGER PRIMARY KEY,
+        logged_at TEXT,
+        analyzer TEXT,
+        direction TEXT,
+        protocol TEXT,
+        control_id TEXT,
+        compressed INTEGER DEFAULT 0,
+        body BLOB
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS message_samples (
+        message_id INTEGER,
+        sample_number TEXT,
+        FOREIGN KEY (message_id) REFERENCES message_log(id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_log_logged_at ON message_log(logged_at)")
+    # Single-column indexes end in the rowid, so "newest first" for an
+    # analyzer or control id is a backwards scan with no sort
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_log_analyzer ON message_log(analyzer)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_log_control_id ON message_log(control_id)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_message_samples_sample
+        ON message_samples(sample_number, message_id)
+    """)
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS message_log_fts USING fts5(text, content='')")
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5; searching falls back to LIKE
+        pass
+
+
+def change_counters(cursor):
+    # Counters bumped by the writes that change a kind of data, so readers
+    # in any process can tell whether what they cached is stale. "orders"
+    # covers samples, results and tests (the answers to host queries).
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO change_counters (name, value) VALUES ('orders', 0)")
+
+
+MIGRATIONS = [
+    initial_schema,
+    unique_samples_and_results,
+    lookup_indexes,
+    connection_protocol,
+    message_log,
+    change_counters,
+]
+
+
+def migrate(conn):
+    # Apply pending migrations, each in its own transaction; returns the
+    # version the database was at before
+    cursor = conn.cursor()
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        cursor.execute("BEGIN")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return version
@@ -0,0 +1,89 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SampleInfoCache:
+    """LRU cache of host query answers in front of the samples/tests tables.
+
+    lookup() can be passed to LISServer as its answer function. Lookups
+    that arrive together, such as a fleet's query storm, share one trip to
+    SQLite: a read of the "orders" change counter, which store_samples,
+    store_results and save_tests bump from any connection or process and
+    which empties the cache when it moved, then one query for every sample
+    not cached. Writes to other tables, such as the message log, leave the
+    cache alone. Unknown samples are cached too. All reads happen on one
+    thread of the cache's own, so the LRU needs no lock.
+    """
+
+    def __init__(self, db_manager, size=10000):
+        self.db = db_manager
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.invalidations = 0
+        self._orders = OrderedDict()
+        self._version = None
+        self._requests = []
+        self._drain_task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sample-info")
+
+    def get(self, sample_numbers):
+        # Blocking lookup for callers outside an event loop
+        return self._executor.submit(self._answer, list(sample_numbers)).result()
+
+    async def lookup(self, sample_numbers):
+        future = asyncio.get_running_loop().create_future()
+        self._requests.append((sample_numbers, future))
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.get_running_loop().create_task(self._drain())
+        return await future
+
+    async def _drain(self):
+        # Requests queued while a batch is being read go in the next one,
+        # which checks the version again
+        loop = asyncio.get_running_loop()
+        while self._requests:
+            requests, self._requests = self._requests, []
+            wanted = list(dict.fromkeys(number for numbers, _ in requests for number in numbers))
+            try:
+                orders = await loop.run_in_executor(self._executor, self._answer, wanted)
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for numbers, future in requests:
+                if not future.done():
+                    future.set_result({number: orders[number] for number in numbers})
+
+    def _answer(self, sample_numbers):
+        # Runs on the cache's thread only
+        version = self.db.change_counter("orders")
+        if version != self._version:
+            if self._orders:
+                self.invalidations += 1
+            self._orders.clear()
+            self._version = version
+        orders = {}
+        missing = []
+        for number in sample_numbers:
+            if number in self._orders:
+                self._orders.move_to_end(number)
+                orders[number] = self._orders[number]
+                self.hits += 1
+            else:
+                missing.append(number)
+        if missing:
+            self.misses += len(missing)
+            self.queries += 1
+            found = self.db.get_sample_orders(missing)
+            for number in missing:
+                orders[number] = self._orders[number] = found.get(number)
+            while len(self._orders) > self.size:
+                self._orders.popitem(last=False)
+        return orders
+
+    def close(self):
+        self._executor.shutdown(wait=True)
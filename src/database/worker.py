@@ -0,0 +1,121 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    # One queued database call. The caller keeps the job to cancel it or to
+    # wait on job.future; on_done/on_error/on_progress are dispatched by the
+    # worker's listener (on the GUI thread in the UI) or called directly.
+    def __init__(self, func, args, kwargs, on_done=None, on_error=None, on_progress=None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.future = Future()
+        self.done = 0
+        self.total = 0
+        self._cancel = threading.Event()
+        self._listener = None
+
+    @property
+    def name(self):
+        return getattr(self.func, "__name__", "job")
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        # Jobs still queued are skipped; a running job stops at its next
+        # progress report and rolls back its transaction
+        self._cancel.set()
+
+    def progress(self, done, total):
+        # Passed to long-running calls as progress=; raising here unwinds
+        # the call from inside its transaction
+        if self._cancel.is_set():
+            raise JobCancelled(f"{self.name} cancelled")
+        self.done = done
+        self.total = total
+        self._notify("progress")
+
+    def _notify(self, event):
+        if self._listener:
+            self._listener(event, self)
+        else:
+            self.dispatch(event)
+
+    def dispatch(self, event):
+        if event == "progress":
+            if self.on_progress:
+                self.on_progress(self.done, self.total)
+        elif event == "finished":
+            if self.future.cancelled():
+                return
+            error = self.future.exception()
+            if error is None:
+                if self.on_done:
+                    self.on_done(self.future.result())
+            elif self.on_error:
+                self.on_error(error)
+
+
+class DatabaseWorker(threading.Thread):
+    """Dedicated thread that runs every database call in submission order.
+
+    submit() queues a call and returns its Job straight away, so the caller
+    (the GUI thread, or the engine's event loop via asyncio.wrap_future)
+    never waits on SQLite. Writes are serialized on this one thread and its
+    connection, so they never contend for the write lock with each other.
+    """
+
+    def __init__(self, db_manager, listener=None):
+        super().__init__(name="database-worker", daemon=True)
+        self.db = db_manager
+        self.listener = listener
+        self._queue = queue.Queue()
+
+    def submit(self, func, *args, on_done=None, on_error=None, on_progress=None, **kwargs):
+        job = Job(func, args, kwargs, on_done, on_error, on_progress)
+        job._listener = self.listener
+        self._queue.put(job)
+        return job
+
+    def submit_job(self, func, *args, on_done=None, on_error=None, on_progress=None, **kwargs):
+        # Like submit(), for calls that take a progress= callback; reports
+        # progress and honours cancellation
+        job = Job(func, args, kwargs, on_done, on_error, on_progress)
+        job._listener = self.listener
+        job.kwargs["progress"] = job.progress
+        self._queue.put(job)
+        return job
+
+    def run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            if not job.future.set_running_or_notify_cancel():
+                # Cancelled through its future before it started: skipped
+                continue
+            if job.cancelled:
+                job.future.set_exception(JobCancelled(f"{job.name} cancelled"))
+            else:
+                try:
+                    job.future.set_result(job.func(*job.args, **job.kwargs))
+                except Exception as e:
+                    job.future.set_exception(e)
+            job._notify("finished")
+
+    def stop(self, timeout=5):
+        # Finishes the jobs already queued, then exits
+        if self.is_alive():
+            self._queue.put(None)
+            self.join(timeout)
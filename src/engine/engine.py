@@ -0,0 +1,326 @@
+import asyncio
+import itertools
+import time
+from src.database.worker import DatabaseWorker, JobCancelled
+from src.engine.link import open_link, link_settings
+from src.engine.results import ResultGenerator
+from src.engine.messages import (astm_result_records, hl7_result_message, astm_query_records,
+                                 hl7_query_message, astm_orders, hl7_orders, merge_astm_messages)
+from src.engine.session import AnalyzerSession, SessionError
+from src.engine.workload import Workload, VirtualClock
+from src.utils.templates import TemplateCache, TemplateError
+
+
+class SimulationEngine:
+    """Qt-free core of the simulator.
+
+    Owns the selected analyzer's configuration, its LIS connection and the
+    sample/result workflow. Progress is reported through listener(event,
+    data); the UI subscribes to it but the engine runs the same without one.
+    Database calls are queued on a DatabaseWorker (shared with the UI when
+    one is passed in) so the event loop stays free for network traffic.
+    Messages in both directions go to message_log (a MessageLog) if given.
+    """
+
+    def __init__(self, db_manager, listener=None, seed=None, db_worker=None, message_log=None):
+        self.db = db_manager
+        self.listener = listener
+        self.message_log = message_log
+        self.generator = ResultGenerator(seed)
+        self.analyzer = None
+        self.session = None
+        self.templates = TemplateCache()
+        self.plans = {}
+        # HL7 message control ids, unique across restarts
+        self._control_ids = itertools.count(int(time.time() * 1000))
+        self.db_worker = db_worker
+        self._owns_worker = db_worker is None
+        self._analysis_job = None
+        self._analysis_cancelled = False
+        # Set while a host query waits for the LIS's orders
+        self._query_reply = None
+
+    def _submit(self, func, *args, long=False, **kwargs):
+        if self.db_worker is None:
+            self.db_worker = DatabaseWorker(self.db)
+        if not self.db_worker.is_alive():
+            self.db_worker.start()
+        submit = self.db_worker.submit_job if long else self.db_worker.submit
+        return submit(func, *args, **kwargs)
+
+    async def _db(self, func, *args, **kwargs):
+        return await asyncio.wrap_future(self._submit(func, *args, **kwargs).future)
+
+    def emit(self, event, data=None):
+        if self.listener:
+            self.listener(event, data)
+
+    @property
+    def protocol(self):
+        settings = self.analyzer and self.analyzer["settings"]
+        return (settings and settings["protocol"]) or "ASTM"
+
+    async def set_analyzer(self, analyzer_id):
+        config = await self._db(self.db.get_analyzer_config, analyzer_id)
+        if config is None:
+            raise ValueError("Please select an analyzer first")
+        if self.session and (self.analyzer is None or self.analyzer["id"] != analyzer_id):
+            await self.disconnect()
+        self.analyzer = config
+        self._compile_templates()
+        self.emit("analyzer_set", config)
+        return config
+
+    async def reload_analyzer(self):
+        # Pick up settings saved after the analyzer was selected
+        if self.analyzer:
+            protocol = self.protocol
+            self.analyzer = await self._db(self.db.get_analyzer_config, self.analyzer["id"])
+            self._compile_templates()
+            if self.session and self.protocol != protocol:
+                await self.disconnect()
+
+    def _compile_templates(self):
+        # Unchanged templates come straight from the cache
+        self.plans = {}
+        for template_type, content in self.analyzer["templates"].items():
+            try:
+                self.plans[template_type] = self.templates.get(self.analyzer["id"], template_type, content)
+            except TemplateError as e:
+                self.emit("log", f"Template '{template_type}' not usable: {e}")
+
+    def template_records(self, template_type, sample, results, timestamp=None):
+        # Record texts for one sample from the analyzer's compiled template,
+        # or None without one. sample is a (sample_number, patient_id,
+        # patient_name) row and results (test, value) pairs
+        plan = self.plans.get(template_type)
+        if plan is None:
+            return None
+        sample_number, patient_id, patient_name = sample
+        context = {"analyzer": self.analyzer["name"], "timestamp": timestamp,
+                   "sample_id": sample_number, "patient_id": patient_id,
+                   "patient_name": patient_name}
+        return plan.records(context, results)
+
+    async def connect(self):
+        if self.analyzer is None:
+            raise ValueError("Please select an analyzer first")
+        settings = self.analyzer["settings"]
+        if settings is None:
+            raise ValueError("Please save connection settings for this analyzer first")
+        if self.session and self.session.connected:
+            return self.session
+
+        connection_type, options = link_settings(settings)
+        mode = f" ({options['mode']})" if "mode" in options else ""
+        self.emit("log", f"Connecting to LIS via {connection_type}{mode}...")
+        link = await open_link(self.protocol, connection_type, options)
+        self.session = AnalyzerSession(link, self.protocol, on_message=self._message_received,
+                                       name=self.analyzer["name"])
+        self.emit("connected", link.peer)
+        self.emit("log", f"Connected to {link.peer}")
+        return self.session
+
+    async def disconnect(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+            self.emit("disconnected")
+            self.emit("log", "Connection closed")
+
+    def _log_message(self, direction, message):
+        if self.message_log:
+            self.message_log.log(direction, self.protocol, message, self.analyzer["name"])
+
+    def _message_received(self, message):
+        self._log_message("received", message)
+        reply = self._query_reply
+        if reply is not None and not reply.done():
+            reply.set_result(astm_orders(message) if self.protocol == "ASTM" else hl7_orders(message))
+        self.emit("message_received", message)
+
+    async def _store(self, stage, func, *args):
+        # Runs a bulk write as a cancellable job, reporting
+        # "store_progress" (stage, done, total) after every chunk
+        job = self._submit(func, *args, long=True,
+                           on_progress=lambda done, total: self.emit("store_progress", (stage, done, total)))
+        self._analysis_job = job
+        try:
+            return await asyncio.wrap_future(job.future)
+        finally:
+            self._analysis_job = None
+
+    def cancel_analysis(self):
+        # Thread-safe: stops the bulk write in progress (rolling it back) or
+        # the remaining progress steps
+        self._analysis_cancelled = True
+        job = self._analysis_job
+        if job:
+            job.cancel()
+
+    async def request_sample_info(self, sample_numbers, timeout=10.0):
+        # Host query for every sample in one exchange: ASTM Q records (from
+        # the sample info template when there is one) or an HL7 QRY. Returns
+        # the orders the LIS answers with, as sample number -> (patient_id,
+        # patient_name, test_codes); samples it does not know are missing
+        session = await self.connect()
+        self._query_reply = asyncio.get_running_loop().create_future()
+        try:
+            if self.protocol == "ASTM":
+                records = self._query_records(sample_numbers)
+                self._log_message("sent", records)
+                await session.send_astm(records)
+            else:
+                message = hl7_query_message(self.analyzer["name"], sample_numbers,
+                                            str(next(self._control_ids)))
+                self._log_message("sent", message)
+                await session.send_hl7(message)
+            try:
+                orders = await asyncio.wait_for(self._query_reply, timeout)
+            except asyncio.TimeoutError:
+                orders = {}
+                self.emit("log", "LIS did not answer the sample info request")
+        finally:
+            self._query_reply = None
+        self.emit("log", f"Sample info received for {len(orders)} of {len(sample_numbers)} samples")
+        self.emit("sample_info", orders)
+        return orders
+
+    async def _apply_sample_info(self, samples):
+        # Patient details from the LIS replace the ones entered, when the
+        # analyzer is set to request sample info
+        settings = self.analyzer and self.analyzer["settings"]
+        if not (settings and settings["request_sample_info"]):
+            return samples
+        delay = int(settings["sample_id_delay"] or 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        try:
+            orders = await self.request_sample_info([sample[0] for sample in samples])
+        except (SessionError, OSError) as e:
+            self.emit("log", f"Sample info request failed: {e}")
+            return samples
+        return [(number,) + tuple(orders[number][:2]) if number in orders else (number, patient_id, name)
+                for number, patient_id, name in samples]
+
+    async def run_analysis(self, samples, interval=1.0, stat=(), workload=None, speed=1.0, batch=1000):
+        # samples are (sample_number, patient_id, patient_name) rows, stat
+        # the sample numbers to run first. Processing is played out by a
+        # Workload on a virtual clock at speed (0: as fast as possible); the
+        # default one runs each test in a channel of its own for interval
+        # seconds, so a sample finishes every interval seconds. An analyzer
+        # without tests runs one step per sample, so it is paced the same.
+        # A sample's results are only stored, and so sendable, once the
+        # last of them is ready: as each sample finishes, or in batches of
+        # up to batch samples at speed 0, where nothing waits for the clock.
+        self._analysis_cancelled = False
+        samples = await self._apply_sample_info(samples)
+        sample_numbers = [sample[0] for sample in samples]
+        tests = (self.analyzer and self.analyzer["tests"]) or []
+        # Generated first, so a test without a range stores nothing
+        values = self.generator.generate(len(sample_numbers), tests) if tests else None
+        try:
+            await self._store("samples", self.db.store_samples, samples)
+        except JobCancelled:
+            self.emit("analysis_cancelled", 0)
+            return
+        self.emit("samples_stored", sample_numbers)
+
+        test_codes = [test[1] for test in tests] or [None]
+        if workload is None:
+            workload = Workload(channels=len(test_codes), default_turnaround=interval)
+        stat = set(stat)
+        for sample_number in sample_numbers:
+            workload.add_sample(sample_number, test_codes, stat=sample_number in stat)
+        rows = dict(zip(sample_numbers, values)) if tests else {}
+        ready = []
+
+        async def store_ready():
+            if ready and tests:
+                await self._db(self.db.store_results, ready, tests, [rows[number] for number in ready])
+                self.emit("results_ready", list(ready))
+            ready.clear()
+
+        done = 0
+        async for kind, now, sample_number, test in workload.run(VirtualClock(speed)):
+            if self._analysis_cancelled:
+                break
+            if kind == "sample":
+                done += 1
+                ready.append(sample_number)
+                if speed > 0 or len(ready) >= batch:
+                    await store_ready()
+                self.emit("progress", (done, len(sample_numbers), sample_number))
+        # Samples already finished keep their results when cancelled
+        await store_ready()
+        if self._analysis_cancelled:
+            self.emit("analysis_cancelled", done)
+        else:
+            self.emit("analysis_finished", len(sample_numbers))
+
+    async def send_results(self, result_ids):
+        # Encodes the results and sends them over the analyzer's connection
+        # in one go: a single ASTM transfer for every sample, or one HL7
+        # message per sample on the same connection. Results are flagged as
+        # sent in one statement once the LIS has acknowledged them.
+        if not result_ids:
+            return 0
+        rows = await self._db(self.db.get_results_to_send, result_ids)
+        if not rows:
+            return 0
+        samples = []
+        for row in rows:
+            sample = (row[1], row[2], row[3])
+            if not samples or samples[-1][0] != sample:
+                samples.append((sample, [], []))
+            samples[-1][1].append((tuple(row[4:9]), row[9]))
+            samples[-1][2].append(row[0])
+
+        session = await self.connect()
+        acknowledged = []
+        try:
+            if self.protocol == "ASTM":
+                records = self._astm_records(samples)
+                self._log_message("sent", records)
+                await session.send_astm(records)
+                for _, _, ids in samples:
+                    acknowledged.extend(ids)
+            else:
+                for sample, results, ids in samples:
+                    message = hl7_result_message(self.analyzer["name"], sample, results,
+                                                 str(next(self._control_ids)))
+                    self._log_message("sent", message)
+                    await session.send_hl7(message)
+                    acknowledged.extend(ids)
+        finally:
+            # HL7 messages the LIS accepted before a failure still count as
+            # sent. The ASTM transfer is one message, which a LIS discards
+            # unless it completes, so it counts only when it all went through
+            if acknowledged:
+                await self._db(self.db.mark_results_sent, acknowledged)
+                self.emit("log", f"Sent {len(acknowledged)} results for {len(samples)} samples to LIS")
+        self.emit("results_sent", len(acknowledged))
+        return len(acknowledged)
+
+    def _astm_records(self, samples):
+        # One H ... L message carrying every sample, built from the result
+        # template when there is one
+        messages = []
+        for sample, results, _ in samples:
+            sample_records = self.template_records("result_send", sample, results)
+            if sample_records is None:
+                sample_records = astm_result_records(self.analyzer["name"], sample, results)
+            messages.append(sample_records)
+        return merge_astm_messages(messages)
+
+    def _query_records(self, sample_numbers):
+        # Q records for every sample in one message, numbered in order
+        if "sample_info" not in self.plans:
+            return astm_query_records(self.analyzer["name"], sample_numbers)
+        return merge_astm_messages([self.template_records("sample_info", (sample_number, "", ""), [])
+                                    for sample_number in sample_numbers])
+
+    async def shutdown(self):
+        await self.disconnect()
+        if self._owns_worker and self.db_worker is not None:
+            await asyncio.to_thread(self.db_worker.stop)
@@ -0,0 +1,433 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from src.database.db_manger import DatabaseManager
+from src.engine.link import open_link, link_settings
+from src.engine.messages import (astm_result_records, hl7_result_message, astm_query_records,
+                                 hl7_query_message)
+from src.engine.results import ResultGenerator
+from src.engine.session import AnalyzerSession, SessionError
+from src.utils.metrics import MetricsExporter, MetricsServer
+from src.utils.capture import CaptureWriter
+
+# Test menu for analyzers that have none configured
+DEFAULT_TESTS = [
+    (0, "GLU", "mmol/l", 3.9, 6.1),
+    (0, "UREA", "mmol/l", 2.5, 7.8),
+    (0, "CREA", "umol/l", 60.0, 110.0),
+]
+
+
+class FleetStats:
+    # Aggregate counters for every session in one fleet process
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.sessions = 0
+        self.connected = 0
+        self.messages = 0
+        self.results = 0
+        self.queries = 0
+        self.errors = 0
+        self._last_time = self.started
+        self._last_messages = 0
+
+    def snapshot(self):
+        now = time.monotonic()
+        interval = now - self._last_time
+        rate = (self.messages - self._last_messages) / interval if interval > 0 else 0.0
+        self._last_time = now
+        self._last_messages = self.messages
+        elapsed = now - self.started
+        return {
+            "elapsed": round(elapsed, 3),
+            "sessions": self.sessions,
+            "connected": self.connected,
+            "messages": self.messages,
+            "results": self.results,
+            "queries": self.queries,
+            "errors": self.errors,
+            "messages_per_sec": round(rate, 1),
+            "average_per_sec": round(self.messages / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+def format_stats(stats):
+    return (f"[{stats['elapsed']:8.1f}s] sessions {stats['connected']}/{stats['sessions']}  "
+            f"messages {stats['messages']} ({stats['messages_per_sec']}/s, "
+            f"avg {stats['average_per_sec']}/s)  results {stats['results']}  "
+            f"queries {stats['queries']}  errors {stats['errors']}")
+
+
+async def _wait(stop, timeout):
+    # Sleep for timeout seconds unless the fleet is stopped first
+    try:
+        await asyncio.wait_for(stop.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+class FleetMember:
+    """One simulated analyzer in a fleet.
+
+    Keeps its own connection, sample number sequence and send schedule, and
+    reconnects with a backoff if the LIS drops it. With request_sample_info
+    set it queries the LIS for each sample and waits for the orders before
+    sending the results.
+    """
+
+    def __init__(self, config, protocol, stats, interval, seed=None, capture=None):
+        self.config = config
+        self.capture = capture
+        self.name = config["name"]
+        # The analyzer's own protocol; protocol is for analyzers without one
+        self.protocol = config["settings"].get("protocol") or protocol
+        self.stats = stats
+        self.interval = interval
+        self.tests = config["tests"] or DEFAULT_TESTS
+        self.generator = ResultGenerator(seed)
+        self.sequence = 0
+        self.query = bool(config["settings"].get("request_sample_info"))
+        self.query_timeout = 10.0
+        self._orders = None
+
+    def next_sample(self):
+        self.sequence += 1
+        return (f"{self.config['prefix']}{self.sequence:06d}",
+                f"{self.config['prefix']}P{self.sequence:06d}",
+                f"Patient^{self.sequence}")
+
+    async def run(self, stop):
+        connection_type, options = link_settings(self.config["settings"])
+        self.stats.sessions += 1
+        backoff = 0.5
+        # Spread the first connections over one send interval
+        await _wait(stop, self.generator.random.random() * self.interval)
+
+        while not stop.is_set():
+            try:
+                link = await open_link(self.protocol, connection_type, options,
+                                       self.capture, self.config.get("index", 0))
+            except OSError:
+                self.stats.errors += 1
+                await _wait(stop, backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+
+            backoff = 0.5
+            session = AnalyzerSession(link, self.protocol, on_message=self._message_received,
+                                      name=self.name)
+            self.stats.connected += 1
+            try:
+                await self._send_loop(session, stop)
+            except (SessionError, ConnectionError):
+                self.stats.errors += 1
+            finally:
+                self.stats.connected -= 1
+                await session.close()
+
+    def _message_received(self, message):
+        # The only transfers a LIS starts are answers to our queries
+        if self._orders is not None and not self._orders.done():
+            self._orders.set_result(message)
+
+    async def _query(self, session, sample_number):
+        self._orders = asyncio.get_running_loop().create_future()
+        try:
+            if self.protocol == "ASTM":
+                await session.send_astm(astm_query_records(self.name, [sample_number]))
+            else:
+                await session.send_hl7(hl7_query_message(self.name, [sample_number],
+                                                         f"Q{sample_number}"))
+            await asyncio.wait_for(self._orders, self.query_timeout)
+            self.stats.queries += 1
+        except asyncio.TimeoutError:
+            self.stats.errors += 1
+        finally:
+            self._orders = None
+
+    async def _send_loop(self, session, stop):
+        loop = asyncio.get_running_loop()
+        due = loop.time()
+        while not stop.is_set():
+            sample = self.next_sample()
+            if self.query:
+                await self._query(session, sample[0])
+            values = self.generator.generate(1, self.tests)[0]
+            results = list(zip(self.tests, values))
+            if self.protocol == "ASTM":
+                await session.send_astm(astm_result_records(self.name, sample, results))
+            else:
+                await session.send_hl7(hl7_result_message(self.name, sample, results,
+                                                          f"{sample[0]}"))
+            self.stats.messages += 1
+            self.stats.results += len(results)
+
+            due += self.interval
+            delay = due - loop.time()
+            if delay > 0:
+                await _wait(stop, delay)
+            else:
+                # Behind schedule; carry on without bursting to catch up
+                due = loop.time()
+
+
+def load_fleet(db_manager, analyzer_ids=None, replicas=1):
+    # Connection configs for every analyzer (or the chosen ones) that has
+    # TCP/IP or serial settings saved
+    configs = []
+    for analyzer_id, name in db_manager.get_analyzers():
+        if analyzer_ids and analyzer_id not in analyzer_ids:
+            continue
+        config = db_manager.get_analyzer_config(analyzer_id)
+        if not config["settings"]:
+            continue
+        for replica in range(replicas):
+            member = dict(config, settings=dict(config["settings"]))
+            member["prefix"] = f"A{analyzer_id}R{replica}-" if replicas > 1 else f"A{analyzer_id}-"
+            if replicas > 1:
+                member["name"] = f"{name} #{replica + 1}"
+                # Listening analyzers need a port each
+                if member["settings"]["socket_type"] == "Server" and member["settings"]["analyzer_port"]:
+                    member["settings"]["analyzer_port"] = str(int(member["settings"]["analyzer_port"]) + replica)
+            member["index"] = len(configs)
+            configs.append(member)
+    return configs
+
+
+class Fleet:
+    """Runs many analyzer sessions concurrently on one event loop."""
+
+    def __init__(self, configs, protocol="ASTM", interval=1.0, seed=None, listener=None,
+                 capture=None):
+        self.stats = FleetStats()
+        self.listener = listener
+        self.stop_event = None
+        self.members = [
+            FleetMember(config, protocol, self.stats,
+                        float(config["settings"].get("result_sending_delay") or 0) / 1000 or interval,
+                        None if seed is None else seed + config.get("index", index), capture)
+            for index, config in enumerate(configs)
+        ]
+
+    async def run(self, duration=None, report_interval=1.0):
+        self.stop_event = asyncio.Event()
+        tasks = [asyncio.create_task(member.run(self.stop_event)) for member in self.members]
+        reporter = asyncio.create_task(self._report(report_interval))
+        try:
+            if duration:
+                await _wait(self.stop_event, duration)
+            else:
+                await self.stop_event.wait()
+        finally:
+            self.stop_event.set()
+            # Sessions still connecting or mid-exchange get a moment to finish
+            _, pending = await asyncio.wait(tasks, timeout=5.0)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            reporter.cancel()
+        return self.stats.snapshot()
+
+    async def _report(self, report_interval):
+        while True:
+            await asyncio.sleep(report_interval)
+            if self.listener:
+                self.listener(self.stats.snapshot())
+
+    def stop(self):
+        if self.stop_event:
+            self.stop_event.set()
+
+
+def merge_stats(snapshots):
+    # Combine per-shard snapshots into one fleet-wide view
+    merged = {"elapsed": 0.0, "sessions": 0, "connected": 0, "messages": 0, "results": 0,
+              "queries": 0, "errors": 0, "messages_per_sec": 0.0, "average_per_sec": 0.0}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            merged[key] = max(merged[key], value) if key == "elapsed" else merged[key] + value
+    merged["messages_per_sec"] = round(merged["messages_per_sec"], 1)
+    merged["average_per_sec"] = round(merged["average_per_sec"], 1)
+    return merged
+
+
+def _shard_worker(shard, configs, protocol, interval, seed, duration, reports, stop):
+    # Entry point of one worker process: runs its shard on its own loop and
+    # reports snapshots to the coordinator
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    raise_file_limit()
+    fleet = Fleet(configs, protocol, interval, seed,
+                  listener=lambda stats: reports.put(("stats", shard, stats)))
+
+    async def watch():
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        fleet.stop()
+
+    async def run():
+        watcher = asyncio.create_task(watch())
+        try:
+            return await fleet.run(duration)
+        finally:
+            watcher.cancel()
+
+    try:
+        reports.put(("done", shard, asyncio.run(run())))
+    except Exception as e:
+        reports.put(("error", shard, str(e)))
+
+
+def split_shards(configs, workers):
+    # Round-robin, so replicas of one analyzer (adjacent in configs) land in
+    # different processes; no shard is left empty
+    shards = [configs[index::workers] for index in range(workers)]
+    return [shard for shard in shards if shard]
+
+
+def run_sharded(configs, workers, protocol="ASTM", interval=1.0, seed=None, duration=None,
+                listener=None, report_interval=1.0):
+    """Split configs across worker processes, one event loop per process.
+
+    listener receives (merged, per_shard) snapshots roughly every
+    report_interval seconds. Returns the merged final snapshot.
+    """
+    context = multiprocessing.get_context("spawn")
+    reports = context.Queue()
+    stop = context.Event()
+    shards = split_shards(configs, workers)
+    processes = [
+        context.Process(target=_shard_worker, name=f"fleet-shard-{index}",
+                        args=(index, shard, protocol, interval, seed, duration, reports, stop))
+        for index, shard in enumerate(shards)
+    ]
+    for process in processes:
+        process.start()
+
+    latest = {}
+    finished = {}
+    next_report = time.monotonic() + report_interval
+    try:
+        while len(finished) < len(processes):
+            try:
+                kind, shard, payload = reports.get(timeout=0.2)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+            else:
+                if kind == "stats":
+                    latest[shard] = payload
+                elif kind == "done":
+                    finished[shard] = payload
+                else:
+                    finished[shard] = latest.get(shard, {})
+                    if listener:
+                        listener(None, {shard: payload})
+            if listener and time.monotonic() >= next_report and latest:
+                next_report += report_interval
+                listener(merge_stats(latest.values()), dict(latest))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Ask every shard to wind down its sessions, then make sure they exit
+        stop.set()
+        deadline = time.monotonic() + 10.0
+        while len(finished) < len(processes) and time.monotonic() < deadline:
+            try:
+                kind, shard, payload = reports.get(timeout=0.2)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+            if kind == "done":
+                finished[shard] = payload
+        for process in processes:
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+    return merge_stats(finished.get(shard, latest.get(shard, {})) for shard in range(len(processes)))
+
+
+def raise_file_limit():
+    # Each TCP session needs a descriptor; lift the soft limit where allowed
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run every configured analyzer as a concurrent session")
+    parser.add_argument("--db", default="analyzersim.db")
+    parser.add_argument("--analyzers", type=int, nargs="*", help="analyzer ids (default: all)")
+    parser.add_argument("--replicas", type=int, default=1, help="sessions per analyzer")
+    parser.add_argument("--protocol", choices=["ASTM", "HL7"], default="ASTM",
+                        help="protocol for analyzers with none saved")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="seconds between messages when result_sending_delay is 0")
+    parser.add_argument("--duration", type=float, help="seconds to run (default: until Ctrl+C)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes to shard analyzers over (0: one per core)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file",
+                        help="append metric snapshots to this file (.csv or JSON lines)")
+    parser.add_argument("--metrics-interval", type=float, default=10.0)
+    parser.add_argument("--capture", help="record all traffic to this capture file "
+                                          "(connection id = session index)")
+    args = parser.parse_args(argv)
+
+    raise_file_limit()
+    configs = load_fleet(DatabaseManager(args.db), args.analyzers, args.replicas)
+    if not configs:
+        parser.error("no analyzers with saved connection settings")
+
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1 and (args.metrics_port or args.metrics_file or args.capture):
+        # Each shard would have its own registry and capture file
+        parser.error("--metrics-port, --metrics-file and --capture need --workers 1")
+    if workers > 1:
+        def report(merged, shards):
+            if merged is None:
+                for shard, error in shards.items():
+                    print(f"shard {shard} failed: {error}", flush=True)
+            else:
+                print(f"{format_stats(merged)}  shards {len(shards)}", flush=True)
+
+        stats = run_sharded(configs, workers, args.protocol, args.interval, args.seed,
+                            args.duration, listener=report)
+        print(f"Finished: {format_stats(stats)}")
+        return
+
+    capture = CaptureWriter(args.capture) if args.capture else None
+    fleet = Fleet(configs, args.protocol, args.interval, args.seed,
+                  listener=lambda stats: print(format_stats(stats), flush=True), capture=capture)
+    server = MetricsServer(args.metrics_port) if args.metrics_port else None
+    exporter = MetricsExporter(args.metrics_file, args.metrics_interval) if args.metrics_file else None
+    for service in (server, exporter):
+        if service:
+            service.start()
+    try:
+        stats = asyncio.run(fleet.run(args.duration))
+    except KeyboardInterrupt:
+        stats = fleet.stats.snapshot()
+    finally:
+        for service in (server, exporter):
+            if service:
+                service.stop()
+        if capture:
+            capture.close()
+    print(f"Finished: {format_stats(stats)}")
+
+
+if __name__ == "__main__":
+    main()
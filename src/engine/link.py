@@ -0,0 +1,222 @@
+import asyncio
+import threading
+import serial
+from src.utils.astm import ASTMFrameParser
+from src.utils.hl7 import MLLPFramer
+from src.utils.capture import RECEIVED, SENT
+
+# Parity names as stored in connection_settings
+SERIAL_PARITY = {
+    "No": serial.PARITY_NONE, "None": serial.PARITY_NONE, "Even": serial.PARITY_EVEN,
+    "Odd": serial.PARITY_ODD, "Mark": serial.PARITY_MARK, "Space": serial.PARITY_SPACE,
+}
+SERIAL_STOP_BITS = {"1": serial.STOPBITS_ONE, "1.5": serial.STOPBITS_ONE_POINT_FIVE,
+                    "2": serial.STOPBITS_TWO}
+
+# Longest a serial read waits with nothing arriving, so readers notice a
+# close; data itself is returned as soon as it arrives
+SERIAL_POLL = 0.2
+
+
+class Link(asyncio.BufferedProtocol):
+    """A single analyzer connection.
+
+    Inbound bytes are received directly into the protocol framer's buffer and
+    the resulting events (ASTM frames and control characters, or complete HL7
+    messages) are queued for whoever consumes the link. None is queued when
+    the connection goes away. With a CaptureWriter, raw bytes in both
+    directions are recorded under the given connection id.
+    """
+
+    def __init__(self, protocol, capture=None, connection=0):
+        self.protocol = protocol
+        self.capture = capture
+        self.connection = connection & 0xFFFF
+        self._buffer = None
+        self.events = asyncio.Queue()
+        if protocol == "ASTM":
+            self.framer = ASTMFrameParser()
+        else:
+            self.framer = MLLPFramer(self.events.put_nowait)
+        self.transport = None
+        self.peer = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = transport.get_extra_info("peername")
+
+    def get_buffer(self, sizehint):
+        self._buffer = self.framer.get_buffer(sizehint)
+        return self._buffer
+
+    def buffer_updated(self, nbytes):
+        self.bytes_in += nbytes
+        if self.capture:
+            self.capture.write(RECEIVED, self._buffer[:nbytes], self.connection)
+        self._queue(self.framer.buffer_updated(nbytes))
+
+    def data_received(self, data):
+        # Used by transports that hand over bytes rather than filling a buffer
+        self.bytes_in += len(data)
+        if self.capture:
+            self.capture.write(RECEIVED, data, self.connection)
+        self._queue(self.framer.feed(data))
+
+    def _queue(self, events):
+        # The MLLP framer delivers through its callback and returns a count
+        if self.protocol == "ASTM":
+            for event in events:
+                self.events.put_nowait(event)
+
+    def eof_received(self):
+        return False
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.events.put_nowait(None)
+
+    @property
+    def connected(self):
+        return self.transport is not None and not self.transport.is_closing()
+
+    def write(self, data):
+        if not self.connected:
+            raise ConnectionError("Connection is closed")
+        self.bytes_out += len(data)
+        if self.capture:
+            self.capture.write(SENT, data, self.connection)
+        self.transport.write(data)
+
+    async def receive(self, timeout=None):
+        event = await asyncio.wait_for(self.events.get(), timeout)
+        if event is None:
+            # Keep the sentinel for any other waiter
+            self.events.put_nowait(None)
+            raise ConnectionError("Connection closed by peer")
+        return event
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+class SerialTransport(asyncio.Transport):
+    # Minimal transport over pyserial; a reader thread hands bytes to the loop
+
+    def __init__(self, loop, port, protocol):
+        super().__init__()
+        self._loop = loop
+        self._port = port
+        self._protocol = protocol
+        self._closing = False
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def _read_loop(self):
+        try:
+            while not self._closing:
+                data = read_available(self._port)
+                if data:
+                    self._loop.call_soon_threadsafe(self._protocol.data_received, data)
+        except Exception:
+            pass
+        if not self._closing:
+            self._loop.call_soon_threadsafe(self.close)
+
+    def get_extra_info(self, name, default=None):
+        return self._port.port if name == "peername" else default
+
+    def is_closing(self):
+        return self._closing
+
+    def write(self, data):
+        self._port.write(data)
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        if hasattr(self._port, "cancel_read"):
+            self._port.cancel_read()
+        self._port.close()
+        self._loop.call_soon(self._protocol.connection_lost, None)
+
+
+async def open_link(protocol, connection_type, settings, capture=None, connection=0):
+    # settings uses the same keys as the tester tab: mode, host, port, baudrate
+    loop = asyncio.get_running_loop()
+    if connection_type == "TCP/IP":
+        if settings.get("mode") == "Client":
+            _, link = await loop.create_connection(
+                lambda: Link(protocol, capture, connection), settings["host"], int(settings["port"]))
+            return link
+
+        accepted = loop.create_future()
+
+        def accept():
+            link = Link(protocol, capture, connection)
+            if not accepted.done():
+                accepted.set_result(link)
+            return link
+
+        server = await loop.create_server(accept, settings.get("host") or None,
+                                          int(settings["port"]))
+        try:
+            return await accepted
+        finally:
+            # One peer per analyzer connection
+            server.close()
+
+    port = await asyncio.to_thread(open_serial, settings)
+    link = Link(protocol, capture, connection)
+    link.connection_made(SerialTransport(loop, port, link))
+    return link
+
+
+def link_settings(settings):
+    # Map a connection_settings row onto open_link arguments
+    if settings["connection_type"] == "Serial":
+        return "Serial", {
+            "port": settings["serial_port"] or "COM1",
+            "baudrate": settings["baud_rate"] or "9600",
+            "data_bits": settings["data_bits"] or "8",
+            "stop_bits": settings["stop_bits"] or "1",
+            "parity": settings["parity"] or "No",
+        }
+    if settings["socket_type"] == "Server":
+        return "TCP/IP", {
+            "mode": "Server",
+            "host": settings["analyzer_address"],
+            "port": settings["analyzer_port"],
+        }
+    return "TCP/IP", {
+        "mode": "Client",
+        "host": settings["lis_address"] or "localhost",
+        "port": settings["lis_port"],
+    }
+
+
+def open_serial(settings):
+    # settings: port, baudrate and optionally data_bits, stop_bits, parity
+    # (as entered in the LIS tab)
+    return serial.Serial(
+        port=settings["port"],
+        baudrate=int(settings["baudrate"]),
+        bytesize=int(settings.get("data_bits") or 8),
+        # Unknown values come through as None, which pyserial rejects
+        stopbits=SERIAL_STOP_BITS.get(str(settings.get("stop_bits") or "1").strip()),
+        parity=SERIAL_PARITY.get(settings.get("parity") or "No"),
+        timeout=SERIAL_POLL,
+    )
+
+
+def read_available(port):
+    # Blocks until at least one byte arrives (or SERIAL_POLL passes), then
+    # returns it together with everything else already buffered, so a frame
+    # is handed on in one piece without waiting for a terminator
+    data = port.read(max(1, port.in_waiting))
+    if data and port.in_waiting:
+        data += port.read(port.in_waiting)
+    return data
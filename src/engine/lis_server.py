@@ -0,0 +1,445 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from src.database.db_manger import DatabaseManager
+from src.database.sample_info import SampleInfoCache
+from src.engine.fleet import raise_file_limit
+from src.utils.astm import ASTMFrameParser, ASTMFrame, ENQ, ACK, NAK, EOT, encode_records
+from src.utils.hl7 import MLLPFramer, VT, wrap, build_ack, msh_fields, segment_fields
+
+
+# E1381 sender limits for the LIS's answers: attempts per ENQ or frame, and
+# how long to wait for the analyzer's reply
+MAX_ATTEMPTS = 6
+REPLY_TIMEOUT = 15.0
+
+# Outcomes of sending one answer
+SENT, CONTENTION, FAILED = "sent", "contention", "failed"
+
+
+class LISStats:
+    # Counters across every connection of one server
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connections = 0
+        self.connected = 0
+        self.messages = 0
+        self.frames = 0
+        self.naks = 0
+        self.queries = 0
+        self.dropped = 0
+        self.errors = 0
+        self._last_time = self.started
+        self._last_messages = 0
+
+    def snapshot(self):
+        now = time.monotonic()
+        interval = now - self._last_time
+        rate = (self.messages - self._last_messages) / interval if interval > 0 else 0.0
+        self._last_time = now
+        self._last_messages = self.messages
+        elapsed = now - self.started
+        return {
+            "elapsed": round(elapsed, 3),
+            "connections": self.connections,
+            "connected": self.connected,
+            "messages": self.messages,
+            "frames": self.frames,
+            "naks": self.naks,
+            "queries": self.queries,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "messages_per_sec": round(rate, 1),
+            "average_per_sec": round(self.messages / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+def format_stats(stats):
+    return (f"[{stats['elapsed']:8.1f}s] analyzers {stats['connected']} ({stats['connections']} total)  "
+            f"messages {stats['messages']} ({stats['messages_per_sec']}/s, "
+            f"avg {stats['average_per_sec']}/s)  frames {stats['frames']}  "
+            f"NAKs {stats['naks']}  queries {stats['queries']}  dropped {stats['dropped']}  "
+            f"errors {stats['errors']}")
+
+
+def query_sample_ids(records):
+    # Sample ids asked for by ASTM Q records; several ids may be given as
+    # repeats (\) of the starting range id field
+    sample_ids = []
+    for record in records:
+        fields = record.split(b"|")
+        if fields[0] != b"Q" or len(fields) < 3:
+            continue
+        for repeat in fields[2].split(b"\\"):
+            components = [c for c in repeat.split(b"^") if c]
+            if components:
+                sample_ids.append(components[0].decode("latin-1"))
+    return sample_ids
+
+
+def hl7_query_sample_ids(message):
+    # Sample ids in QRD-8 (who subject filter) of a QRY message
+    fields = segment_fields(message, b"QRD")
+    if len(fields) < 9:
+        return []
+    return [repeat.split(b"^")[0].decode("latin-1") for repeat in fields[8].split(b"~") if repeat]
+
+
+def astm_order_records(orders):
+    # orders maps sample id to (patient_id, patient_name, test_codes), or
+    # None for samples the LIS knows nothing about
+    records = [b"H|\\^&|||LIS^^|||||||P"]
+    index = 0
+    for sample_id, order in orders.items():
+        if order is None:
+            continue
+        index += 1
+        patient_id, patient_name, test_codes = order
+        universal_ids = "\\".join("^^^" + code for code in test_codes)
+        records.append(f"P|{index}|{patient_id}|||{patient_name}".encode("latin-1"))
+        records.append(f"O|1|{sample_id}||{universal_ids}|R".encode("latin-1"))
+    records.append(b"L|1|N" if index else b"L|1|I")
+    return records
+
+
+def hl7_order_message(orders, control_id):
+    timestamp = time.strftime("%Y%m%d%H%M%S")
+    segments = [f"MSH|^~\\&|LIS|HOSP|||{timestamp}||ORM^O01|{control_id}|P|2.5"]
+    for sample_id, order in orders.items():
+        if order is None:
+            continue
+        patient_id, patient_name, test_codes = order
+        segments.append(f"PID|1||{patient_id}||{patient_name}")
+        # A sample with nothing ordered still gets one OBR to name it
+        for index, code in enumerate(test_codes or [""], 1):
+            segments.append(f"OBR|{index}|{sample_id}||^^^{code}" if code else f"OBR|{index}|{sample_id}")
+    return ("\r".join(segments) + "\r").encode("latin-1")
+
+
+class LISConnection:
+    """One analyzer connected to the stand-in.
+
+    The protocol is detected from the first byte (VT starts MLLP, anything
+    else is ASTM). Inbound events are queued by a reader task so the
+    handler can also act as sender when it answers a host query.
+    """
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.events = asyncio.Queue()
+
+    async def run(self):
+        first = await self.reader.read(65536)
+        if not first:
+            return
+        if first[0] == VT:
+            framer = MLLPFramer(self.events.put_nowait)
+            framer.feed(first)
+            feed = framer.feed
+            handle = self._hl7
+        else:
+            parser = ASTMFrameParser()
+            for event in parser.feed(first):
+                self.events.put_nowait(event)
+
+            def feed(data):
+                for event in parser.feed(data):
+                    self.events.put_nowait(event)
+            handle = self._astm
+
+        reader = asyncio.get_running_loop().create_task(self._read(feed))
+        try:
+            await handle()
+        finally:
+            reader.cancel()
+
+    async def _read(self, feed):
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                feed(data)
+        finally:
+            self.events.put_nowait(None)
+
+    async def _next(self):
+        event = await self.events.get()
+        if event is None:
+            raise ConnectionError("Analyzer disconnected")
+        return event
+
+    async def _reply(self, data):
+        if self.server.ack_delay:
+            await asyncio.sleep(self.server.ack_delay)
+        self.writer.write(data)
+
+    # ASTM
+
+    async def _astm(self):
+        server = self.server
+        stats = server.stats
+        records = []
+        partial = b""
+        last_number = None
+        # Answers waiting to be sent, with the attempts made so far
+        answers = []
+        while True:
+            event = await self._next()
+            if event == ENQ:
+                records, partial, last_number = [], b"", None
+                await self._reply(bytes([ACK]))
+            elif isinstance(event, ASTMFrame):
+                if not event.valid or server.reject():
+                    stats.naks += 1
+                    await self._reply(bytes([NAK]))
+                    continue
+                # A frame repeated after a lost ACK is acknowledged again
+                # but not stored twice
+                if event.number != last_number:
+                    last_number = event.number
+                    stats.frames += 1
+                    partial += event.text
+                    if event.final:
+                        records.append(partial.rstrip(b"\r"))
+                        partial = b""
+                await self._reply(bytes([ACK]))
+            elif event == EOT:
+                if records:
+                    stats.messages += 1
+                    if server.on_message:
+                        server.on_message(records)
+                    sample_ids = query_sample_ids(records)
+                    records = []
+                    if sample_ids and server.answer:
+                        stats.queries += 1
+                        answers.append([astm_order_records(await server.lookup(sample_ids)), 0])
+                if answers and await self._send_answers(answers):
+                    # The analyzer's ENQ won the line; take its transfer and
+                    # try again after it
+                    records, partial, last_number = [], b"", None
+                    await self._reply(bytes([ACK]))
+
+    async def _send_answers(self, answers):
+        # Sends queued answers in order; returns True when the analyzer
+        # claimed the line with an ENQ of its own
+        stats = self.server.stats
+        while answers:
+            answer = answers[0]
+            answer[1] += 1
+            outcome = await self._send_astm(answer[0])
+            if outcome == CONTENTION and answer[1] < MAX_ATTEMPTS:
+                return True
+            answers.pop(0)
+            if outcome != SENT:
+                stats.dropped += 1
+            if outcome == CONTENTION:
+                return True
+        return False
+
+    async def _reply_to(self, data):
+        self.writer.write(data)
+        try:
+            return await asyncio.wait_for(self._next(), REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _send_astm(self, records):
+        # LIS as sender: establish, one frame per ACK, then EOT. The
+        # analyzer has priority: an ENQ from it instead of an ACK ends the
+        # attempt (CONTENTION). A NAK means it is busy, so the ENQ is
+        # repeated a little later.
+        for attempt in range(MAX_ATTEMPTS):
+            reply = await self._reply_to(bytes([ENQ]))
+            if reply == ACK:
+                break
+            if reply == ENQ:
+                return CONTENTION
+            if reply is None:
+                break
+            await asyncio.sleep(1.0)
+        if reply != ACK:
+            self.writer.write(bytes([EOT]))
+            return FAILED
+
+        for frame in encode_records(records):
+            for attempt in range(MAX_ATTEMPTS):
+                reply = await self._reply_to(frame)
+                if reply == ACK or reply == EOT or reply is None:
+                    break
+            # EOT is the analyzer interrupting the transfer; the rest of
+            # the answer is not sent
+            if reply != ACK:
+                self.writer.write(bytes([EOT]))
+                return FAILED
+        self.writer.write(bytes([EOT]))
+        return SENT
+
+    # HL7 over MLLP
+
+    async def _hl7(self):
+        server = self.server
+        stats = server.stats
+        while True:
+            message = await self._next()
+            fields = msh_fields(message)
+            message_type = fields[9] if len(fields) > 9 else b""
+            if message_type.startswith(b"ACK"):
+                # Analyzer acknowledging an order we sent
+                continue
+            if server.reject():
+                stats.naks += 1
+                await self._reply(wrap(build_ack(message, "AE", "Rejected by LIS stand-in")))
+                continue
+            stats.messages += 1
+            await self._reply(wrap(build_ack(message)))
+            if server.on_message:
+                server.on_message(message)
+            if message_type.startswith(b"QRY") and server.answer:
+                sample_ids = hl7_query_sample_ids(message)
+                if sample_ids:
+                    stats.queries += 1
+                    orders = await server.lookup(sample_ids)
+                    self.writer.write(wrap(hl7_order_message(orders, next(server.control_ids))))
+
+
+class LISServer:
+    """Scriptable LIS stand-in for load and conformance tests.
+
+    Accepts any number of analyzer connections over TCP and speaks ASTM
+    E1381 or HL7/MLLP, detected per connection. ack_delay holds every reply
+    back by that many seconds and nak_rate rejects that fraction of frames
+    (ASTM NAK) or messages (HL7 AE). Host queries (ASTM Q records, HL7 QRY)
+    are answered through answer(sample_ids), which returns a dict of sample
+    id to (patient_id, patient_name, test_codes) or None; it may be a
+    coroutine function. Use it as "async with LISServer(...) as server" or
+    from the command line.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, ack_delay=0.0, nak_rate=0.0, answer=None,
+                 on_message=None, seed=None):
+        self.host = host
+        self.port = port
+        self.ack_delay = ack_delay
+        self.nak_rate = nak_rate
+        self.answer = answer
+        self.on_message = on_message
+        self.random = random.Random(seed)
+        self.stats = LISStats()
+        self.control_ids = itertools.count(1)
+        self._server = None
+        self._connections = {}
+
+    def reject(self):
+        return self.nak_rate > 0 and self.random.random() < self.nak_rate
+
+    async def lookup(self, sample_ids):
+        orders = self.answer(sample_ids)
+        if asyncio.iscoroutine(orders):
+            orders = await orders
+        return {sample_id: orders.get(sample_id) for sample_id in sample_ids}
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._accept, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            # Closing the sockets ends each handler through its reader; a
+            # cancelled handler task would be reported by asyncio.streams
+            for writer in self._connections.values():
+                writer.transport.abort()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _accept(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        self.stats.connections += 1
+        self.stats.connected += 1
+        try:
+            await LISConnection(self, reader, writer).run()
+        except ConnectionError:
+            pass
+        except Exception:
+            self.stats.errors += 1
+        finally:
+            self.stats.connected -= 1
+            del self._connections[task]
+            writer.close()
+
+
+def load_answers(path):
+    # JSON object of sample id to {"patient_id", "patient_name", "tests"}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    orders = {sample_id: (entry.get("patient_id", ""), entry.get("patient_name", ""),
+                          entry.get("tests", []))
+              for sample_id, entry in data.items()}
+    return lambda sample_ids: orders
+
+
+async def serve(args):
+    cache = None
+    if args.db:
+        cache = SampleInfoCache(DatabaseManager(args.db), args.cache_size)
+        answer = cache.lookup
+    else:
+        answer = load_answers(args.answers) if args.answers else None
+    server = LISServer(args.host, args.port, args.ack_delay, args.nak_rate, answer, seed=args.seed)
+    async with server:
+        print(f"LIS stand-in listening on {args.host}:{server.port}", flush=True)
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while deadline is None or time.monotonic() < deadline:
+            await asyncio.sleep(min(args.report_interval,
+                                    deadline - time.monotonic()) if deadline else args.report_interval)
+            print(format_stats(server.stats.snapshot()), flush=True)
+    if cache:
+        print(f"Sample info cache: {cache.hits} hits, {cache.misses} misses, "
+              f"{cache.queries} queries, {cache.invalidations} invalidations")
+        cache.close()
+    return server.stats.snapshot()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LIS stand-in answering ASTM and HL7 analyzers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--ack-delay", type=float, default=0.0, help="seconds before each reply")
+    parser.add_argument("--nak-rate", type=float, default=0.0,
+                        help="fraction of frames/messages to reject (0-1)")
+    answers = parser.add_mutually_exclusive_group()
+    answers.add_argument("--answers", help="JSON file of host query answers by sample id")
+    answers.add_argument("--db", help="answer host queries from this simulator database")
+    parser.add_argument("--cache-size", type=int, default=10000,
+                        help="samples kept in the --db answer cache")
+    parser.add_argument("--duration", type=float, help="seconds to run (default: until Ctrl+C)")
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    raise_file_limit()
+    try:
+        stats = asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        return
+    print(f"Finished: {format_stats(stats)}")
+
+
+if __name__ == "__main__":
+    main()
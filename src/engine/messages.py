@@ -0,0 +1,127 @@
+from datetime import datetime
+from src.utils.flags import result_flag
+
+# Builders for the messages an analyzer sends to the LIS. sample is a
+# (sample_number, patient_id, patient_name) row and results a list of
+# (test, value) pairs where test is an (id, test_code, unit, lower_range,
+# upper_range) row.
+
+
+def astm_result_records(analyzer_name, sample, results, timestamp=None):
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d%H%M%S")
+    sample_number, patient_id, patient_name = sample
+    universal_ids = "\\".join("^^^" + test[1] for test, _ in results)
+    records = [
+        f"H|\\^&|||{analyzer_name}^^|||||||P||{timestamp}",
+        f"P|1|{patient_id}|||{patient_name}",
+        f"O|1|{sample_number}||{universal_ids}|R||||||X||||||||||||F",
+    ]
+    for index, (test, value) in enumerate(results, 1):
+        records.append(f"R|{index}|^^^{test[1]}|{value}|{test[2]}|{test[3]}-{test[4]}|"
+                       f"{result_flag(value, test[3], test[4])}||F||||{timestamp}")
+    records.append("L|1|N")
+    return [record.encode("latin-1") for record in records]
+
+
+# E1394 record levels: a record's sequence number counts the records of its
+# type since the last record of a higher level
+ASTM_LEVELS = {b"H": 0, b"P": 1, b"Q": 1, b"O": 2, b"R": 3, b"L": 0}
+
+
+def merge_astm_messages(messages):
+    # Per-sample H ... L record lists joined into one message: the header
+    # comes from the first and the terminator from the last, and P, Q, O
+    # and R records are renumbered for their place in the joined message
+    records = []
+    counts = {}
+    last = len(messages) - 1
+    for position, sample_records in enumerate(messages):
+        for record in sample_records:
+            kind = record[:1]
+            if (kind == b"H" and position > 0) or (kind == b"L" and position < last):
+                continue
+            level = ASTM_LEVELS.get(kind)
+            if level:
+                number = counts.get(kind, 0) + 1
+                # A new record resets the numbering of every level below it
+                counts = {other: count for other, count in counts.items() if ASTM_LEVELS[other] <= level}
+                counts[kind] = number
+                fields = record.split(b"|", 2)
+                if len(fields) > 1:
+                    fields[1] = b"%d" % number
+                    record = b"|".join(fields)
+            records.append(record)
+    return records
+
+
+def hl7_result_message(analyzer_name, sample, results, control_id, timestamp=None):
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d%H%M%S")
+    sample_number, patient_id, patient_name = sample
+    segments = [
+        f"MSH|^~\\&|{analyzer_name}|LAB|LIS|HOSP|{timestamp}||ORU^R01|{control_id}|P|2.5",
+        f"PID|1||{patient_id}||{patient_name}",
+        f"OBR|1||{sample_number}|^{analyzer_name}|||{timestamp}",
+    ]
+    for index, (test, value) in enumerate(results, 1):
+        segments.append(f"OBX|{index}|NM|{test[1]}||{value}|{test[2]}|{test[3]}-{test[4]}|"
+                        f"{result_flag(value, test[3], test[4])}|||F")
+    return ("\r".join(segments) + "\r").encode("latin-1")
+
+
+def astm_query_records(analyzer_name, sample_numbers, timestamp=None):
+    # One host query transfer with a Q record per sample
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d%H%M%S")
+    records = [f"H|\\^&|||{analyzer_name}^^|||||||P||{timestamp}"]
+    for index, sample_number in enumerate(sample_numbers, 1):
+        records.append(f"Q|{index}|^{sample_number}^^||^^^ALL^||||||O")
+    records.append("L|1|N")
+    return [record.encode("latin-1") for record in records]
+
+
+def hl7_query_message(analyzer_name, sample_numbers, control_id, timestamp=None):
+    # QRY^Q02 asking for the orders of every sample, listed as QRD-8 repeats
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d%H%M%S")
+    segments = [
+        f"MSH|^~\\&|{analyzer_name}|LAB|LIS|HOSP|{timestamp}||QRY^Q02|{control_id}|P|2.5",
+        f"QRD|{timestamp}|R|I|{control_id}|||{len(sample_numbers)}^RD|{'~'.join(sample_numbers)}|OTH",
+    ]
+    return ("\r".join(segments) + "\r").encode("latin-1")
+
+
+# Readers for the orders a LIS sends back, as a dict of sample number to
+# (patient_id, patient_name, test_codes)
+
+def _test_code(universal_id):
+    # ^^^GLU^0.0 -> GLU
+    components = universal_id.split("^")
+    return components[3] if len(components) > 3 else components[-1]
+
+
+def astm_orders(records):
+    orders = {}
+    patient = ("", "")
+    for record in records:
+        fields = record.decode("latin-1").split("|")
+        if fields[0] == "P":
+            patient = (fields[2] if len(fields) > 2 else "", fields[5] if len(fields) > 5 else "")
+        elif fields[0] == "O" and len(fields) > 2:
+            sample_number = fields[2].split("^")[0]
+            codes = [_test_code(repeat) for repeat in fields[4].split("\\")
+                     if repeat] if len(fields) > 4 else []
+            orders[sample_number] = patient + ([code for code in codes if code],)
+    return orders
+
+
+def hl7_orders(message):
+    orders = {}
+    patient = ("", "")
+    for segment in message.decode("latin-1").split("\r"):
+        fields = segment.split("|")
+        if fields[0] == "PID":
+            patient = (fields[3] if len(fields) > 3 else "", fields[5] if len(fields) > 5 else "")
+        elif fields[0] == "OBR" and len(fields) > 2:
+            sample_number = (fields[2] or (fields[3] if len(fields) > 3 else "")).split("^")[0]
+            order = orders.setdefault(sample_number, patient + ([],))
+            if len(fields) > 4 and fields[4]:
+                order[2].append(_test_code(fields[4]))
+    return orders
@@ -0,0 +1,29 @@
+import random
+import numpy as np
+
+
+class ResultGenerator:
+    """Random results within each test's normal range.
+
+    A whole batch (samples x tests) is drawn in one vectorized call from a
+    seeded NumPy Generator, so the same seed reproduces the same batch.
+    random is a seeded random.Random for callers that need single draws.
+    """
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+
+    def generate(self, sample_count, tests):
+        # tests are (id, test_code, unit, lower_range, upper_range) rows;
+        # returns one row of values per sample, in test order
+        missing = [test[1] for test in tests if test[3] is None or test[4] is None]
+        if missing:
+            raise ValueError(f"No normal range for test {', '.join(missing)}")
+        if not tests or not sample_count:
+            return [[] for _ in range(sample_count)]
+
+        lower = np.array([test[3] for test in tests], dtype=float)
+        upper = np.array([test[4] for test in tests], dtype=float)
+        values = self.rng.uniform(lower, upper, size=(sample_count, len(tests)))
+        return np.round(values, 3).tolist()
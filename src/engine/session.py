@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+from src.utils.astm import ASTMFrame, ENQ, ACK, NAK, EOT, encode_record
+from src.utils.hl7 import wrap, build_ack, ack_code, msh_fields
+from src.utils.metrics import ExchangeMetrics
+
+# E1381 link states
+IDLE = "idle"
+ESTABLISHING = "establishing"
+TRANSFER = "transfer"
+RECEIVING = "receiving"
+
+# E1381 waits before repeating an ENQ: at least 10 s after the LIS
+# answered NAK (busy), 1 s after contention (the LIS sent its own ENQ),
+# where the analyzer has priority
+ENQ_BUSY_DELAY = 10.0
+ENQ_CONTENTION_DELAY = 1.0
+
+log = logging.getLogger(__name__)
+
+
+class SessionError(Exception):
+    pass
+
+
+class AnalyzerSession:
+    """Analyzer side of an ASTM or HL7 exchange over a Link.
+
+    A reader task owns the link: replies to an outstanding request resolve
+    the pending future, anything else is treated as an inbound transfer from
+    the LIS. Complete inbound messages are passed to on_message as a list of
+    ASTM records or a single HL7 message. Exchange latencies and counts are
+    recorded under the analyzer name in the metrics registry.
+    """
+
+    def __init__(self, link, protocol, on_message=None, reply_timeout=15.0,
+                 max_retries=6, auto_ack=True, name="", metrics=None):
+        self.link = link
+        self.protocol = protocol
+        self.on_message = on_message
+        self.reply_timeout = reply_timeout
+        self.max_retries = max_retries
+        self.auto_ack = auto_ack
+        self.metrics = ExchangeMetrics(name, protocol, metrics)
+        self.state = IDLE
+        self.frames_sent = 0
+        self.messages_sent = 0
+        self.retransmissions = 0
+        self._reply = None
+        self._send_lock = asyncio.Lock()
+        self._records = []
+        self._partial = b""
+        self._expected = 1
+        self._reader = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @property
+    def connected(self):
+        return self.link.connected
+
+    async def close(self):
+        self.link.close()
+        self._reader.cancel()
+        try:
+            await self._reader
+        except asyncio.CancelledError:
+            pass
+
+    async def _read_loop(self):
+        try:
+            while True:
+                event = await self.link.receive()
+                if self._is_reply(event):
+                    self._reply.set_result(event)
+                elif self.protocol == "ASTM":
+                    self._receive_astm(event)
+                else:
+                    self._receive_hl7(event)
+        except ConnectionError:
+            self._fail("Connection lost")
+        except Exception as e:
+            # A failing handler ends the session rather than leaving a
+            # sender waiting on a reader that is gone
+            log.exception("Session reader failed")
+            self.link.close()
+            self._fail(f"Session failed: {e}")
+
+    def _fail(self, reason):
+        self.state = IDLE
+        if self._reply is not None and not self._reply.done():
+            self._reply.set_exception(SessionError(reason))
+
+    def _is_reply(self, event):
+        if self._reply is None or self._reply.done():
+            return False
+        if self.protocol == "ASTM":
+            return self.state != RECEIVING
+        # Only ACK messages answer an outbound HL7 message
+        fields = msh_fields(event)
+        return len(fields) > 9 and fields[9].startswith(b"ACK")
+
+    async def _request(self, data):
+        if self._reader.done():
+            raise SessionError("Session is closed")
+        self._reply = asyncio.get_running_loop().create_future()
+        try:
+            self.link.write(data)
+            return await asyncio.wait_for(self._reply, self.reply_timeout)
+        except asyncio.TimeoutError:
+            self.metrics.timeouts.inc()
+            raise SessionError("Timed out waiting for a reply")
+        finally:
+            self._reply = None
+
+    # ASTM E1381 sender
+
+    async def send_astm(self, records):
+        # records are bytes without the trailing CR
+        async with self._send_lock:
+            started = time.perf_counter()
+            await self._establish()
+            try:
+                number = 1
+                for record in records:
+                    # Records over 240 characters go out as ETB frames
+                    frames, number = encode_record(number, record)
+                    for frame in frames:
+                        await self._send_frame(frame)
+                self.messages_sent += 1
+                self.metrics.messages_sent.inc()
+                self.metrics.session.observe(time.perf_counter() - started)
+            finally:
+                self.state = IDLE
+                if self.link.connected:
+                    self.link.write(bytes([EOT]))
+
+    async def _establish(self):
+        for attempt in range(self.max_retries):
+            self.state = ESTABLISHING
+            sent = time.perf_counter()
+            reply = await self._request(bytes([ENQ]))
+            if reply == ACK:
+                self.metrics.enq_ack.observe(time.perf_counter() - sent)
+                self.state = TRANSFER
+                return
+            if reply == NAK:
+                self.metrics.naks_received.inc()
+            if attempt + 1 < self.max_retries:
+                await asyncio.sleep(ENQ_BUSY_DELAY if reply == NAK else ENQ_CONTENTION_DELAY)
+        self.state = IDLE
+        raise SessionError("LIS did not accept the link")
+
+    async def _send_frame(self, frame):
+        metrics = self.metrics
+        for attempt in range(self.max_retries):
+            sent = time.perf_counter()
+            reply = await self._request(frame)
+            # EOT in place of ACK is a receiver interrupt, which still
+            # acknowledges the frame
+            if reply == ACK or reply == EOT:
+                metrics.frame_ack.observe(time.perf_counter() - sent)
+                metrics.frames_sent.inc()
+                self.frames_sent += 1
+                return
+            if reply == NAK:
+                metrics.naks_received.inc()
+            metrics.retransmissions.inc()
+            self.retransmissions += 1
+        raise SessionError("Frame rejected by LIS")
+
+    # ASTM E1381 receiver
+
+    def _receive_astm(self, event):
+        if event == ENQ:
+            if self.state == IDLE:
+                self.state = RECEIVING
+                self._records = []
+                self._partial = b""
+                self._expected = 1
+                self.link.write(bytes([ACK]))
+            else:
+                self.link.write(bytes([NAK]))
+        elif isinstance(event, ASTMFrame):
+            if self.state != RECEIVING:
+                return
+            if not event.valid:
+                self.metrics.naks_sent.inc()
+                self.link.write(bytes([NAK]))
+                return
+            if event.number == self._expected:
+                self.metrics.frames_received.inc()
+                self._partial += event.text
+                if event.final:
+                    self._records.append(self._partial.rstrip(b"\r"))
+                    self._partial = b""
+                self._expected = (self._expected + 1) % 8
+            # A repeated frame number is a retransmission of a frame whose
+            # ACK was lost, so it is acknowledged again but not stored
+            self.link.write(bytes([ACK]))
+        elif event == EOT and self.state == RECEIVING:
+            self.state = IDLE
+            if self._records:
+                self.metrics.messages_received.inc()
+            if self.on_message and self._records:
+                self.on_message(self._records)
+
+    # HL7 over MLLP
+
+    async def send_hl7(self, message):
+        async with self._send_lock:
+            sent = time.perf_counter()
+            reply = await self._request(wrap(message))
+            self.metrics.message_ack.observe(time.perf_counter() - sent)
+            code = ack_code(reply)
+            if code not in ("AA", "CA"):
+                self.metrics.naks_received.inc()
+                raise SessionError(f"LIS answered {code or 'without MSA'}")
+            self.metrics.messages_sent.inc()
+            self.messages_sent += 1
+            return reply
+
+    def _receive_hl7(self, message):
+        fields = msh_fields(message)
+        if len(fields) > 9 and fields[9].startswith(b"ACK"):
+            # Late or unsolicited acknowledgement
+            return
+        self.metrics.messages_received.inc()
+        if self.auto_ack:
+            self.link.write(wrap(build_ack(message)))
+        if self.on_message:
+            self.on_message(message)
@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+# Seconds from aspiration to result for tests with no turnaround of their own
+DEFAULT_TURNAROUND = 600.0
+
+# Event kinds, in the order they are handled when they fall on the same time
+FREE, ARRIVE, RESULT = 0, 1, 2
+
+
+class VirtualClock:
+    # Simulated seconds since the run started. speed 0 runs as fast as
+    # possible; 1.0 is real time, 60 a simulated minute per second.
+
+    def __init__(self, speed=0.0):
+        self.speed = speed
+        self.now = 0.0
+        self._origin = None
+
+    async def advance(self, when):
+        if self.speed > 0:
+            if self._origin is None:
+                self._origin = time.monotonic() - self.now / self.speed
+            delay = self._origin + when / self.speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self.now = when
+
+
+class Workload:
+    """Discrete-event model of an analyzer working through its samples.
+
+    A sample arrives at a time with its tests and a STAT flag. Each test
+    waits for one of the channels (a STAT test goes ahead of every routine
+    test waiting), holds it for cycle seconds, or its whole turnaround when
+    cycle is None, and its result is ready turnaround seconds after it
+    started. With a short cycle and a long turnaround a channel is a
+    pipelined chemistry line; with no cycle it is a slot that does one test
+    at a time.
+
+    events() yields ("result", time, sample, test) and ("sample", time,
+    sample, None) once all of a sample's results are ready, in virtual time
+    order. run(clock) yields the same from an async generator, waiting on
+    the clock in between. Nothing sleeps between events, so a day of
+    thousands of samples per hour takes seconds to run at speed 0.
+    """
+
+    def __init__(self, channels=1, cycle=None, turnarounds=None, default_turnaround=DEFAULT_TURNAROUND):
+        if channels < 1:
+            raise ValueError("channels must be at least 1")
+        self.channels = channels
+        self.cycle = cycle
+        self.turnarounds = turnarounds or {}
+        self.default_turnaround = default_turnaround
+        self._events = []
+        self._sequence = itertools.count()
+        self.samples = 0
+        self.stats = None
+
+    def turnaround(self, test):
+        return self.turnarounds.get(test, self.default_turnaround)
+
+    def add_sample(self, sample_number, tests, at=0.0, stat=False):
+        self._push(at, ARRIVE, (sample_number, list(tests), bool(stat)))
+        self.samples += 1
+
+    def _push(self, when, kind, data):
+        heapq.heappush(self._events, (when, kind, next(self._sequence), data))
+
+    def events(self):
+        stats = self.stats = WorkloadStats(self.channels)
+        # A copy, so the same workload can be played out again
+        events = list(self._events)
+        # Waiting tests, STAT first and then in arrival order
+        waiting = []
+        free = self.channels
+        # sample -> [tests still to report, arrival time, stat]
+        pending = {}
+
+        while events:
+            now, kind, _, data = heapq.heappop(events)
+            if kind == ARRIVE:
+                sample_number, tests, stat = data
+                if tests:
+                    pending[sample_number] = [len(tests), now, stat]
+                    for test in tests:
+                        heapq.heappush(waiting, (not stat, next(self._sequence), sample_number, test))
+                    stats.queued(len(waiting))
+                else:
+                    stats.sample_done(now, now, stat)
+                    yield ("sample", now, sample_number, None)
+            elif kind == FREE:
+                free += 1
+            else:
+                sample_number, test = data
+                stats.results += 1
+                stats.last = now
+                yield ("result", now, sample_number, test)
+                entry = pending[sample_number]
+                entry[0] -= 1
+                if not entry[0]:
+                    del pending[sample_number]
+                    stats.sample_done(entry[1], now, entry[2])
+                    yield ("sample", now, sample_number, None)
+
+            # Samples loaded together are all queued before any is started,
+            # so a STAT one in the rack goes first
+            if events and events[0][0] == now and events[0][1] != RESULT:
+                continue
+            while free and waiting:
+                _, _, sample_number, test = heapq.heappop(waiting)
+                free -= 1
+                turnaround = self.turnaround(test)
+                busy = turnaround if self.cycle is None else min(self.cycle, turnaround)
+                stats.busy += busy
+                heapq.heappush(events, (now + busy, FREE, next(self._sequence), None))
+                heapq.heappush(events, (now + turnaround, RESULT, next(self._sequence), (sample_number, test)))
+
+    async def run(self, clock=None, batch=1000):
+        clock = clock or VirtualClock()
+        for count, event in enumerate(self.events(), 1):
+            await clock.advance(event[1])
+            if clock.speed <= 0 and not count % batch:
+                # Let the loop serve other work during a fast run
+                await asyncio.sleep(0)
+            yield event
+
+
+class WorkloadStats:
+    # Turnaround of each finished sample (arrival to last result) by priority
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.results = 0
+        self.busy = 0.0
+        self.last = 0.0
+        self.max_waiting = 0
+        self.turnarounds = {True: [], False: []}
+
+    def queued(self, waiting):
+        if waiting > self.max_waiting:
+            self.max_waiting = waiting
+
+    def sample_done(self, arrived, now, stat):
+        self.turnarounds[stat].append(now - arrived)
+        if now > self.last:
+            self.last = now
+
+    @property
+    def samples(self):
+        return len(self.turnarounds[True]) + len(self.turnarounds[False])
+
+    def utilization(self):
+        return self.busy / (self.channels * self.last) if self.last > 0 else 0.0
+
+    def summary(self, stat):
+        values = sorted(self.turnarounds[stat])
+        if not values:
+            return None
+        return {
+            "samples": len(values),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "max": values[-1],
+        }
+
+
+def percentile(values, q):
+    # values sorted; nearest rank
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+def poisson_arrivals(per_hour, hours, stat_fraction=0.0, seed=None):
+    # (time, stat) for each sample of a Poisson arrival stream
+    rng = random.Random(seed)
+    rate = per_hour / 3600.0
+    end = hours * 3600.0
+    now = rng.expovariate(rate)
+    while now < end:
+        yield now, rng.random() < stat_fraction
+        now += rng.expovariate(rate)
+
+
+def parse_turnarounds(values):
+    turnarounds = {}
+    for value in values or []:
+        test, _, seconds = value.partition("=")
+        turnarounds[test] = float(seconds)
+    return turnarounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate an analyzer's sample throughput on a virtual clock")
+    parser.add_argument("--samples-per-hour", type=float, default=1000.0)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--tests", nargs="+", default=["GLU", "UREA", "CREA"], help="tests run on every sample")
+    parser.add_argument("--channels", type=int, default=1, help="parallel processing channels")
+    parser.add_argument("--cycle", type=float,
+                        help="seconds a test holds its channel (default: its whole turnaround)")
+    parser.add_argument("--turnaround", type=float, default=DEFAULT_TURNAROUND,
+                        help="seconds from start to result for every test")
+    parser.add_argument("--test-turnaround", nargs="*", metavar="TEST=SECONDS",
+                        help="per-test turnarounds, e.g. GLU=480 CREA=600")
+    parser.add_argument("--stat-fraction", type=float, default=0.1, help="share of STAT samples")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="simulated seconds per second (0: as fast as possible)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        workload = Workload(args.channels, args.cycle, parse_turnarounds(args.test_turnaround), args.turnaround)
+    except ValueError as e:
+        parser.error(str(e))
+    for number, (at, stat) in enumerate(poisson_arrivals(args.samples_per_hour, args.hours,
+                                                         args.stat_fraction, args.seed), 1):
+        workload.add_sample(f"S{number:07d}", args.tests, at, stat)
+
+    # Results ready per simulated hour: what the LIS has to take in
+    hourly = {}
+
+    async def run():
+        async for kind, now, _, _ in workload.run(VirtualClock(args.speed)):
+            if kind == "result":
+                hour = int(now // 3600)
+                hourly[hour] = hourly.get(hour, 0) + 1
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.perf_counter() - started
+    stats = workload.stats
+    span = stats.last / 3600
+    print(f"Simulated {span:.1f} h in {elapsed:.2f} s: {stats.samples} samples, {stats.results} results")
+    if span > 0:
+        print(f"Throughput: {stats.samples / span:.0f} samples/h, {stats.results / span:.0f} results/h "
+              f"(peak hour {max(hourly.values(), default=0)} results)")
+    print(f"Channel utilization: {stats.utilization():.1%}, most tests waiting: {stats.max_waiting}")
+    for stat, label in ((True, "STAT"), (False, "Routine")):
+        summary = stats.summary(stat)
+        if summary:
+            print(f"{label:8} {summary['samples']:7} samples  turnaround p50 {summary['p50'] / 60:.1f} min  "
+                  f"p95 {summary['p95'] / 60:.1f} min  max {summary['max'] / 60:.1f} min")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+from PySide6.QtCore import QObject, Signal
+from src.database.worker import DatabaseWorker
+
+
+class DatabaseWorkerBridge(QObject):
+    # Owns the database worker thread and runs its jobs' callbacks on the
+    # GUI thread: the worker reports through a queued signal, and each job
+    # then calls its own on_done/on_error/on_progress
+    job_event = Signal(str, object)
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.worker = DatabaseWorker(db_manager, listener=self.job_event.emit)
+        self.job_event.connect(self.dispatch)
+
+    def dispatch(self, event, job):
+        job.dispatch(event)
+
+    def submit(self, func, *args, **kwargs):
+        return self.worker.submit(func, *args, **kwargs)
+
+    def submit_job(self, func, *args, **kwargs):
+        return self.worker.submit_job(func, *args, **kwargs)
+
+    def start(self):
+        self.worker.start()
+
+    def stop(self):
+        self.worker.stop()
@@ -0,0 +1,37 @@
+import asyncio
+from PySide6.QtCore import QThread, Signal
+from src.engine.engine import SimulationEngine
+
+
+class EngineThread(QThread):
+    # Runs the simulation engine's event loop off the GUI thread and relays
+    # its events back as a queued signal
+    event = Signal(str, object)
+
+    def __init__(self, db_manager, db_worker=None, message_log=None, parent=None):
+        super().__init__(parent)
+        self.loop = asyncio.new_event_loop()
+        self.engine = SimulationEngine(db_manager, listener=self.event.emit, db_worker=db_worker,
+                                       message_log=message_log)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(self._guard(coro), self.loop)
+
+    async def _guard(self, coro):
+        try:
+            return await coro
+        except Exception as e:
+            self.event.emit("error", str(e))
+
+    def stop(self):
+        if self.isRunning():
+            try:
+                self.submit(self.engine.shutdown()).result(timeout=2)
+            except Exception:
+                pass
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.wait()
@@ -6,7 +6,43 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QStackedWidget, QFrame, QListWidget, QListWidgetItem, QToolButton)
 from PySide6.QtCore import Qt, QTimer, QThread, Signal, QDateTime, QSize
 from PySide6.QtGui import QFont, QIcon, QColor, QPalette
-import sqlite3
+from src.utils.templates import compile_template, TemplateError
+
+# {field} placeholders are filled in per sample; frames using a test field
+# are repeated for every result. Frame numbers and checksums are computed.
+DEFAULT_SAMPLE_INFO_TEMPLATE = """Send: <ENQ>
+Read: <ACK>
+
+Send: <STX>H|\\^&|||1^{analyzer}^|||||||||P||{timestamp}<CR><ETX>
+Read: <ACK>
+
+Send: <STX>Q|1|^{sample_id}^^||^^^ALL^||||||O<CR><ETX>
+Read: <ACK>
+
+Send: <STX>L|1|N<CR><ETX>
+Read: <ACK>
+
+Send: <EOT>"""
+
+DEFAULT_RESULT_TEMPLATE = """Send: <ENQ>
+Read: <ACK>
+
+Send: <STX>H|\\^&|||{analyzer}^7.0|||||||P||{timestamp}<CR><ETX>
+Read: <ACK>
+
+Send: <STX>P|1|{patient_id}|||{patient_name}|||U|||||||||||||||||||<CR><ETX>
+Read: <ACK>
+
+Send: <STX>O|{index}|{sample_id}^0.0^5^1|||^^^{test_code}^0.0|R||||||X|||3|||||||1|F<CR><ETX>
+Read: <ACK>
+
+Send: <STX>R|1|^^^{test_code}^0.0|{result}|{unit}||{flag}||F||<root user>||{timestamp}|{analyzer}<CR><ETX>
+Read: <ACK>
+
+Send: <STX>L|1|N<CR><ETX>
+Read: <ACK>
+
+Send: <EOT>"""
 
 class LISTab(QWidget):
     def __init__(self, parent=None):
@@ -37,6 +73,16 @@ class LISTab(QWidget):
         
         left_layout.addWidget(conn_type_group)
         
+        # Message protocol
+        protocol_group = QGroupBox("Protocol")
+        protocol_layout = QHBoxLayout(protocol_group)
+        
+        self.protocol_combo = QComboBox()
+        self.protocol_combo.addItems(["ASTM", "HL7"])
+        protocol_layout.addWidget(self.protocol_combo)
+        
+        left_layout.addWidget(protocol_group)
+        
         # TCP/IP settings
         self.tcp_widget = QWidget()
         tcp_layout = QFormLayout(self.tcp_widget)
@@ -148,9 +194,9 @@ class LISTab(QWidget):
         sample_info_tab = QWidget()
         sample_info_layout = QVBoxLayout(sample_info_tab)
         
-        sample_info_text = QTextEdit()
-        sample_info_text.setPlaceholderText("Enter ASTM message template for sample info request...")
-        sample_info_text.setText("Send: <ENQ>\nRead: <ACK>\n\nSend: <STX>1H|\\^&|||1^Analyzer_1^|||||||||P||20101118101825<CR><ETX>A1\nRead: <ACK>\n\nSend: <STX>2Q|1|^SampleID_03^^||^^^ALL^||||||O<CR><ETX>FF\n\nRead: <ACK>\n\nSend: <STX>3L|1|N<CR><ETX>06\n\nRead: <ACK>\n\nSend: < EOT >")
+        self.sample_info_text = QTextEdit()
+        self.sample_info_text.setPlaceholderText("Enter ASTM message template for sample info request...")
+        self.sample_info_text.setPlainText(DEFAULT_SAMPLE_INFO_TEMPLATE)
         
         # Field selector UI for sample info
         field_group = QGroupBox("Add Field")
@@ -170,16 +216,16 @@ class LISTab(QWidget):
         add_field_button = QPushButton("Add")
         field_layout.addWidget(add_field_button)
         
-        sample_info_layout.addWidget(sample_info_text)
+        sample_info_layout.addWidget(self.sample_info_text)
         sample_info_layout.addWidget(field_group)
         
         # Result Sending Template Tab
         result_send_tab = QWidget()
         result_send_layout = QVBoxLayout(result_send_tab)
         
-        result_send_text = QTextEdit()
-        result_send_text.setPlaceholderText("Enter ASTM message template for result sending...")
-        result_send_text.setText("send: <ENQ>\nread: <ACK>\nsend: <STX>1H]\\Aé|[]1 Analyzer 1^7.0]||||||||P|]20190801124640<CR><EXT>E4\nread: <ACK>\n\nsend: <STX>2P|1|PatientID_07|||Patient Name_7|||U|||||||||||||||||||<CR><EXT>67\nread: <ACK>\n\nsend: <STX>3O|1|SampleID_07^0.0^5^1|||^^^Test_1^0.0|R||||||X|||3|||||||1|F<CR><EXT>2C\nread: <ACK>\n\nsend: <STX>4R|1|^^^Test_1^0.0|2.4|mmol/l||N||F||<root user>||20190801124608|Analyzer 1<CR><EXT>3F\nread: <ACK>\n\nsend: <STX>5O|2|SampleID_07^0.0^5^1|||^^^Photo_reflex_test^0.0|R||||||X|||3|||||||1|F<CR><EXT>0D\nread: <ACK>\n\nsend: <STX>6R|1|^^^Photo_reflex_test^0.0|3.205|mmol/l||N||F||<root user>||20190801124606|Analyzer 1<CR><EXT>81\nread: <ACK>\n\nsend: <STX>7O|3|SampleID_07^0.0^5^1|||^^^Photometric_test^0.0|R||||||X|||3|||||||1|F<CR><EXT>AF\nread: <ACK>\n\nsend: <STX>0R|1|^^^Photometric_test^0.0|0.06|mmol/l||N||F||<root user>||20190801124607|Analyzer 1<CR><EXT>E7\nread: <ACK>\n\nsend: <STX>1L|1|N<CR><EXT>04\nread")
+        self.result_send_text = QTextEdit()
+        self.result_send_text.setPlaceholderText("Enter ASTM message template for result sending...")
+        self.result_send_text.setPlainText(DEFAULT_RESULT_TEMPLATE)
         
         # Field selector UI for result sending
         result_field_group = QGroupBox("Add Field")
@@ -199,7 +245,7 @@ class LISTab(QWidget):
         result_add_field_button = QPushButton("Add")
         result_field_layout.addWidget(result_add_field_button)
         
-        result_send_layout.addWidget(result_send_text)
+        result_send_layout.addWidget(self.result_send_text)
         result_send_layout.addWidget(result_field_group)
         
         # Add tabs to the ASTM templates tab widget
@@ -253,83 +299,55 @@ class LISTab(QWidget):
         self.client_radio.toggled.connect(self.toggle_socket_type)
         
         # Connect field selector buttons
-        add_field_button.clicked.connect(lambda: self.add_field(field_selector, field_text, field_direction, sample_info_text))
-        result_add_field_button.clicked.connect(lambda: self.add_field(result_field_selector, result_field_text, result_field_direction, result_send_text))
+        add_field_button.clicked.connect(lambda: self.add_field(field_selector, field_text, field_direction, self.sample_info_text))
+        result_add_field_button.clicked.connect(lambda: self.add_field(result_field_selector, result_field_text, result_field_direction, self.result_send_text))
 
     def save_connection_settings(self):
-        # analyzer_id = self.analyzer_combo.currentData()
-        analyzer_id = self.parent().get_analyzer_combo().currentData()
-        if not analyzer_id:
+        main_window = self.window()
+        analyzer_id = main_window.get_analyzer_combo().currentData()
+        if not analyzer_id or analyzer_id < 0:
             QMessageBox.warning(self, "Warning", "Please select an analyzer first")
             return
         
         try:
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT id FROM connection_settings WHERE analyzer_id = ?", (analyzer_id,))
-            existing = cursor.fetchone()
-            
-            connection_type = "TCP/IP" if self.tcp_radio.isChecked() else "Serial"
-            socket_type = "Server" if self.server_radio.isChecked() else "Client"
-            analyzer_address = self.analyzer_address.text()
-            analyzer_port = self.analyzer_port.text()
-            lis_address = self.lis_address.text()
-            lis_port = self.lis_port.text()
-            serial_port = self.serial_port.currentText()
-            baud_rate = self.baud_rate.text()
-            data_bits = self.data_bits.text()
-            stop_bits = self.stop_bits.text()
-            parity = self.parity.currentText()
-            auto_result = 1 if self.auto_result.isChecked() else 0
-            request_sample = 1 if self.request_sample.isChecked() else 0
-            sample_delay = self.sample_delay.text()
-            result_delay = self.result_delay.text()
-            
-            if existing:
-                cursor.execute("""
-                    UPDATE connection_settings 
-                    SET connection_type = ?, socket_type = ?, analyzer_address = ?,
-                        analyzer_port = ?, lis_address = ?, lis_port = ?,
-                        serial_port = ?, baud_rate = ?, data_bits = ?,
-                        stop_bits = ?, parity = ?, auto_result_sending = ?,
-                        request_sample_info = ?, sample_id_delay = ?,
-                        result_sending_delay = ?
-                    WHERE analyzer_id = ?
-                """, (connection_type, socket_type, analyzer_address, analyzer_port,
-                     lis_address, lis_port, serial_port, baud_rate, data_bits,
-                     stop_bits, parity, auto_result, request_sample,
-                     sample_delay, result_delay, analyzer_id))
-            else:
-                cursor.execute("""
-                    INSERT INTO connection_settings 
-                    (analyzer_id, connection_type, socket_type, analyzer_address,
-                     analyzer_port, lis_address, lis_port, serial_port, baud_rate,
-                     data_bits, stop_bits, parity, auto_result_sending,
-                     request_sample_info, sample_id_delay, result_sending_delay)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (analyzer_id, connection_type, socket_type, analyzer_address,
-                     analyzer_port, lis_address, lis_port, serial_port, baud_rate,
-                     data_bits, stop_bits, parity, auto_result, request_sample,
-                     sample_delay, result_delay))
-            
-            conn.commit()
-            conn.close()
-            
-            QMessageBox.information(self, "Success", "Connection settings saved successfully")
-            
+            settings = {
+                "connection_type": "TCP/IP" if self.tcp_radio.isChecked() else "Serial",
+                "socket_type": "Server" if self.server_radio.isChecked() else "Client",
+                "analyzer_address": self.analyzer_address.text(),
+                "analyzer_port": self.analyzer_port.text(),
+                "lis_address": self.lis_address.text(),
+                "lis_port": self.lis_port.text(),
+                "serial_port": self.serial_port.currentText(),
+                "baud_rate": self.baud_rate.text(),
+                "data_bits": self.data_bits.text(),
+                "stop_bits": self.stop_bits.text(),
+                "parity": self.parity.currentText(),
+                "auto_result_sending": 1 if self.auto_result.isChecked() else 0,
+                "request_sample_info": 1 if self.request_sample.isChecked() else 0,
+                "sample_id_delay": self.sample_delay.text(),
+                "result_sending_delay": self.result_delay.text(),
+                "protocol": self.protocol_combo.currentText(),
+            }
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to save connection settings: {str(e)}")
+            return
+
+        def saved(_):
+            main_window.engine_thread.submit(main_window.engine.reload_analyzer())
+            QMessageBox.information(self, "Success", "Connection settings saved successfully")
+
+        main_window.db_worker.submit(main_window.db_manager.save_connection_settings, analyzer_id, settings,
+                                     on_done=saved,
+                                     on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to save connection settings: {str(e)}"))
 
     def connect_to_lis(self):
-        analyzer_id = self.analyzer_combo.currentData()
-        if not analyzer_id:
+        main_window = self.window()
+        analyzer_id = main_window.get_analyzer_combo().currentData()
+        if not analyzer_id or analyzer_id < 0:
             QMessageBox.warning(self, "Warning", "Please select an analyzer first")
             return
         
-        self.log_text.append("Connecting to LIS...")
-        QTimer.singleShot(1000, lambda: self.log_text.append("Connected successfully"))
-        self.statusBar().showMessage("Connected")            
+        main_window.engine_thread.submit(main_window.engine.connect())
 
     def add_test(self):
         row = self.test_table.rowCount()
@@ -365,35 +383,45 @@ class LISTab(QWidget):
             self.test_table.removeRow(row)        
 
     def save_templates(self):
-        analyzer_id = self.analyzer_combo.currentData()
-        if not analyzer_id:
+        main_window = self.window()
+        analyzer_id = main_window.get_analyzer_combo().currentData()
+        if not analyzer_id or analyzer_id < 0:
             QMessageBox.warning(self, "Warning", "Please select an analyzer first")
             return
         
         try:
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            
-            cursor.execute("DELETE FROM tests WHERE analyzer_id = ?", (analyzer_id,))
-            
+            tests = []
             for row in range(self.test_table.rowCount()):
                 test_code = self.test_table.item(row, 0).text()
                 unit = self.test_table.item(row, 1).text()
                 lower_range = float(self.test_table.item(row, 2).text())
                 upper_range = float(self.test_table.item(row, 3).text())
-                
-                cursor.execute("""
-                    INSERT INTO tests (analyzer_id, test_code, unit, lower_range, upper_range)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (analyzer_id, test_code, unit, lower_range, upper_range))
-            
-            conn.commit()
-            conn.close()
-            
-            QMessageBox.information(self, "Success", "Templates and test data saved successfully")
+                tests.append((test_code, unit, lower_range, upper_range))
+
+            templates = {
+                "sample_info": self.sample_info_text.toPlainText(),
+                "result_send": self.result_send_text.toPlainText(),
+            }
+            # Refuse templates that wouldn't compile rather than storing them
+            for template_type, content in templates.items():
+                try:
+                    compile_template(content)
+                except TemplateError as e:
+                    raise ValueError(f"{template_type} template: {e}")
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to save templates and test data: {str(e)}")
+            return
+
+        def saved(_):
+            main_window.engine_thread.submit(main_window.engine.reload_analyzer())
+            QMessageBox.information(self, "Success", "Templates and test data saved successfully")
+
+        def failed(e):
+            QMessageBox.critical(self, "Error", f"Failed to save templates and test data: {str(e)}")
+
+        main_window.db_worker.submit(main_window.db_manager.save_analyzer_setup, analyzer_id, templates, tests,
+                                     on_done=saved, on_error=failed)
                 
     def toggle_connection_type(self):
         if self.tcp_radio.isChecked():
@@ -418,4 +446,8 @@ class LISTab(QWidget):
         if field in ["ENQ", "ACK", "STX", "ETX", "EOT"]:
             target.append(f"{dir_text}: <{field}>")
         else:
-            target.append(f"{dir_text}: {field} {content}")        
\ No newline at end of file
+            target.append(f"{dir_text}: {field} {content}")
+
+    def show_templates(self, templates):
+        self.sample_info_text.setPlainText(templates.get("sample_info", DEFAULT_SAMPLE_INFO_TEMPLATE))
+        self.result_send_text.setPlainText(templates.get("result_send", DEFAULT_RESULT_TEMPLATE))
@@ -0,0 +1,56 @@
+from PySide6.QtWidgets import QPlainTextEdit
+from PySide6.QtCore import QTimer, Signal
+from src.utils.log_buffer import LogBuffer
+
+
+class LogView(QPlainTextEdit):
+    """Read-only log widget with a line cap and batched rendering.
+
+    append() only stores the line in a LogBuffer and may be called from any
+    thread. A timer renders whatever arrived since the last tick in a single
+    appendPlainText, at most ~30 times a second, and the document is capped
+    at max_lines blocks. While paused nothing is rendered but lines are
+    still counted and kept in the ring; resuming shows the newest of them.
+    """
+
+    # total lines received, lines waiting to be rendered
+    stats_changed = Signal(int, int)
+
+    def __init__(self, parent=None, max_lines=5000, interval_ms=33):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+        self.buffer = LogBuffer(max_lines)
+        self.paused = False
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(interval_ms)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start()
+
+    def append(self, line):
+        self.buffer.append(line)
+
+    def set_paused(self, paused):
+        self.paused = paused
+        if not paused:
+            # Re-render from the ring rather than replaying everything missed
+            self.setPlainText("\n".join(self.buffer.snapshot()))
+            self.moveCursor(self.textCursor().MoveOperation.End)
+            self.ensureCursorVisible()
+        self.stats_changed.emit(self.buffer.total, self.buffer.unrendered)
+
+    def flush(self):
+        if self.paused:
+            if self.buffer.unrendered:
+                self.stats_changed.emit(self.buffer.total, self.buffer.unrendered)
+            return
+        lines = self.buffer.take_new()
+        if lines:
+            self.appendPlainText("\n".join(lines))
+            self.stats_changed.emit(self.buffer.total, 0)
+
+    def clear(self):
+        self.buffer.clear()
+        super().clear()
+        self.stats_changed.emit(0, 0)
@@ -1,7 +1,6 @@
 import sys
 import random
 import time
-import sqlite3
 from datetime import datetime
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                             QLabel, QComboBox, QPushButton, QTabWidget, QRadioButton,
@@ -16,6 +15,10 @@ from src.ui.sample_tab import SampleTab
 from src.ui.result_tab import ResultTab
 from src.ui.tester_tab import TesterTab
 from src.database.db_manger import DatabaseManager
+from src.database.message_log import MessageLog
+from src.ui.engine_thread import EngineThread
+from src.ui.db_worker import DatabaseWorkerBridge
+from src.ui.log_view import LogView
 
 class LabSimulator(QMainWindow):
     def __init__(self):
@@ -29,12 +32,27 @@ class LabSimulator(QMainWindow):
         # Initialize database
         self.db_manager = DatabaseManager()
         self.db_manager.create_database()        
+
+        # All SQL after startup runs on the database worker thread
+        self.db_worker = DatabaseWorkerBridge(self.db_manager, self)
+        self.db_worker.start()
+
+        # Every message on the wire is logged from a background writer
+        self.message_log = MessageLog(self.db_manager, compress=True)
+        self.message_log.start()
+
+        # Start the simulation engine; the tabs drive it through submit()
+        self.engine_thread = EngineThread(self.db_manager, self.db_worker.worker, self.message_log, self)
+        self.engine = self.engine_thread.engine
+        self.engine_thread.event.connect(self.on_engine_event)
+        self.engine_thread.start()
         
         # Setup the UI
         self.setup_ui()
         
         # Load analyzer list
         self.load_analyzers()
+        self.result_tab.load_sample_list()
     
     def setup_ui(self):
         # Set up main widget and layout
@@ -61,15 +79,15 @@ class LabSimulator(QMainWindow):
         set_button.setFixedWidth(80)
         set_button.clicked.connect(self.set_analyzer)
         
-        connection_status = QLabel("LIS Connection Not Established")
-        connection_status.setFont(QFont("Arial", 8, QFont.Weight.Bold))
-        connection_status.setStyleSheet("color: #ff4444;")
+        self.connection_status = QLabel("LIS Connection Not Established")
+        self.connection_status.setFont(QFont("Arial", 8, QFont.Weight.Bold))
+        self.connection_status.setStyleSheet("color: #ff4444;")
         
         top_layout.addWidget(analyzer_label)
         top_layout.addWidget(self.analyzer_combo)
         top_layout.addWidget(set_button)
         top_layout.addStretch()
-        top_layout.addWidget(connection_status)
+        top_layout.addWidget(self.connection_status)
         
         self.main_layout.addWidget(top_widget)
         
@@ -110,8 +128,7 @@ class LabSimulator(QMainWindow):
         log_group = QGroupBox("Connection Logs")
         log_layout = QVBoxLayout(log_group)
         
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
+        self.log_text = LogView(max_lines=1000)
         self.log_text.setMaximumHeight(150)
         log_layout.addWidget(self.log_text)
         
@@ -121,94 +138,96 @@ class LabSimulator(QMainWindow):
         # LabSimulator.toggle_socket_type(self) was in LISSetUpUI
                 
     def load_analyzers(self):
-        try:
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name FROM analyzers")
-            analyzers = cursor.fetchall()
-            conn.close()
-            
-            self.analyzer_combo.clear()
-            self.analyzer_combo.addItem('', -1)
-            for analyzer in analyzers:
-                self.analyzer_combo.addItem(analyzer[1], analyzer[0])
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load analyzers: {str(e)}")
+        self.db_worker.submit(self.db_manager.get_analyzers,
+                              on_done=self.show_analyzers,
+                              on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to load analyzers: {str(e)}"))
+
+    def show_analyzers(self, analyzers):
+        self.analyzer_combo.clear()
+        self.analyzer_combo.addItem('', -1)
+        for analyzer in analyzers:
+            self.analyzer_combo.addItem(analyzer[1], analyzer[0])
 
     def get_analyzer_combo(self):
         return self.analyzer_combo            
     
     def set_analyzer(self):
         analyzer_id = self.analyzer_combo.currentData()
-        analyzer_name = self.analyzer_combo.currentText()
-        try:
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT connection_type, socket_type, analyzer_address, analyzer_port, 
-                       lis_address, lis_port, serial_port, baud_rate, data_bits, 
-                       stop_bits, parity, auto_result_sending, request_sample_info,
-                       sample_id_delay, result_sending_delay 
-                FROM connection_settings 
-                WHERE analyzer_id = ?
-            """, (analyzer_id,))
-            
-            settings = cursor.fetchone()
-            if settings:
-                if settings[0] == "TCP/IP":
-                    self.tcp_radio.setChecked(True)
-                    if settings[1] == "Server":
-                        self.server_radio.setChecked(True)
-                    else:
-                        self.client_radio.setChecked(True)
-                    self.analyzer_address.setText(settings[2] or "")
-                    self.analyzer_port.setText(settings[3] or "")
-                    self.lis_address.setText(settings[4] or "")
-                    self.lis_port.setText(settings[5] or "")
+        self.engine_thread.submit(self.engine.set_analyzer(analyzer_id))
+
+    def show_analyzer(self, config):
+        lis_tab = self.lis_tab
+        settings = config["settings"]
+        if settings:
+            if settings["connection_type"] == "TCP/IP":
+                lis_tab.tcp_radio.setChecked(True)
+                if settings["socket_type"] == "Server":
+                    lis_tab.server_radio.setChecked(True)
                 else:
-                    self.serial_radio.setChecked(True)
-                    self.serial_port.setCurrentText(settings[6] or "COM1")
-                    self.baud_rate.setText(settings[7] or "9600")
-                    self.data_bits.setText(settings[8] or "8")
-                    self.stop_bits.setText(settings[9] or "1")
-                    self.parity.setCurrentText(settings[10] or "No")
-                
-                self.auto_result.setChecked(bool(settings[11]))
-                self.request_sample.setChecked(bool(settings[12]))
-                self.sample_delay.setText(str(settings[13] or "0"))
-                self.result_delay.setText(str(settings[14] or "0"))
-            
-            cursor.execute("""
-                SELECT template_type, template_content 
-                FROM astm_templates 
-                WHERE analyzer_id = ?
-            """, (analyzer_id,))
-            
-            templates = cursor.fetchall()
-            for template in templates:
-                if template[0] == "sample_info":
-                    pass
-                elif template[0] == "result_send":
-                    pass
-            
-            cursor.execute("""
-                SELECT test_code, unit, lower_range, upper_range 
-                FROM tests 
-                WHERE analyzer_id = ?
-            """, (analyzer_id,))
-            
-            tests = cursor.fetchall()
-            self.test_table.setRowCount(len(tests))
-            for i, test in enumerate(tests):
-                self.test_table.setItem(i, 0, QTableWidgetItem(test[0]))
-                self.test_table.setItem(i, 1, QTableWidgetItem(test[1]))
-                self.test_table.setItem(i, 2, QTableWidgetItem(str(test[2])))
-                self.test_table.setItem(i, 3, QTableWidgetItem(str(test[3])))
-            
-            conn.close()
-            
-            QMessageBox.information(self, "Success", f"Analyzer '{analyzer_name}' selected successfully")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load analyzer settings: {str(e)}")  
\ No newline at end of file
+                    lis_tab.client_radio.setChecked(True)
+                lis_tab.analyzer_address.setText(settings["analyzer_address"] or "")
+                lis_tab.analyzer_port.setText(settings["analyzer_port"] or "")
+                lis_tab.lis_address.setText(settings["lis_address"] or "")
+                lis_tab.lis_port.setText(settings["lis_port"] or "")
+            else:
+                lis_tab.serial_radio.setChecked(True)
+                lis_tab.serial_port.setCurrentText(settings["serial_port"] or "COM1")
+                lis_tab.baud_rate.setText(settings["baud_rate"] or "9600")
+                lis_tab.data_bits.setText(settings["data_bits"] or "8")
+                lis_tab.stop_bits.setText(settings["stop_bits"] or "1")
+                lis_tab.parity.setCurrentText(settings["parity"] or "No")
+
+            lis_tab.protocol_combo.setCurrentText(settings["protocol"] or "ASTM")
+            lis_tab.auto_result.setChecked(bool(settings["auto_result_sending"]))
+            lis_tab.request_sample.setChecked(bool(settings["request_sample_info"]))
+            lis_tab.sample_delay.setText(str(settings["sample_id_delay"] or "0"))
+            lis_tab.result_delay.setText(str(settings["result_sending_delay"] or "0"))
+
+        lis_tab.show_templates(config["templates"])
+
+        tests = config["tests"]
+        lis_tab.test_table.setRowCount(len(tests))
+        for i, test in enumerate(tests):
+            lis_tab.test_table.setItem(i, 0, QTableWidgetItem(test[1]))
+            lis_tab.test_table.setItem(i, 1, QTableWidgetItem(test[2]))
+            lis_tab.test_table.setItem(i, 2, QTableWidgetItem(str(test[3])))
+            lis_tab.test_table.setItem(i, 3, QTableWidgetItem(str(test[4])))
+
+        QMessageBox.information(self, "Success", f"Analyzer '{config['name']}' selected successfully")
+
+    def on_engine_event(self, event, data):
+        if event == "analyzer_set":
+            self.show_analyzer(data)
+        elif event == "log":
+            self.log_text.append(data)
+        elif event == "connected":
+            self.connection_status.setText("LIS Connection Established")
+            self.connection_status.setStyleSheet("color: #44ff44;")
+            self.statusBar().showMessage("Connected")
+        elif event == "disconnected":
+            self.connection_status.setText("LIS Connection Not Established")
+            self.connection_status.setStyleSheet("color: #ff4444;")
+            self.statusBar().showMessage("Disconnected")
+        elif event == "samples_stored":
+            self.result_tab.load_sample_list()
+        elif event == "store_progress":
+            self.sample_tab.update_store_progress(*data)
+        elif event == "progress":
+            self.sample_tab.update_progress(*data)
+        elif event == "results_ready":
+            self.result_tab.results_ready(data)
+        elif event == "analysis_finished":
+            self.sample_tab.analysis_finished()
+        elif event == "analysis_cancelled":
+            self.sample_tab.analysis_cancelled(data)
+        elif event == "results_sent":
+            self.result_tab.results_sent(data)
+        elif event == "error":
+            QMessageBox.critical(self, "Error", data)
+
+    def closeEvent(self, event):
+        self.engine_thread.stop()
+        self.message_log.stop()
+        self.db_worker.stop()
+        self.db_manager.close()
+        super().closeEvent(event)
@@ -0,0 +1,90 @@
+from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QSplitter, QLineEdit, QComboBox,
+                               QPushButton, QLabel, QTableWidget, QTableWidgetItem, QHeaderView,
+                               QPlainTextEdit, QAbstractItemView)
+from PySide6.QtCore import Qt
+
+
+class MessageLogDialog(QDialog):
+    # Browses the persistent message log: a filter row, the newest matching
+    # messages and the selected message's text. Queries run on the database
+    # worker, so the window stays responsive while they do.
+
+    FILTERS = ["Sample No.", "Control ID", "Analyzer", "Text"]
+
+    def __init__(self, db_manager, db_worker, parent=None, field="Text", value=""):
+        super().__init__(parent)
+        self.db = db_manager
+        self.db_worker = db_worker
+        self.setWindowTitle("Message Log")
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        self.field_combo = QComboBox()
+        self.field_combo.addItems(self.FILTERS)
+        self.field_combo.setCurrentText(field)
+        self.search_input = QLineEdit(value)
+        self.search_input.returnPressed.connect(self.search)
+        self.limit_combo = QComboBox()
+        self.limit_combo.addItems(["200", "1000", "5000"])
+        search_button = QPushButton("Search")
+        search_button.clicked.connect(self.search)
+        filter_layout.addWidget(self.field_combo)
+        filter_layout.addWidget(self.search_input)
+        filter_layout.addWidget(QLabel("Show:"))
+        filter_layout.addWidget(self.limit_combo)
+        filter_layout.addWidget(search_button)
+        layout.addLayout(filter_layout)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        self.table = QTableWidget()
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(["Time", "Analyzer", "Direction", "Protocol", "Control ID"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.itemSelectionChanged.connect(self.show_message)
+        self.message_text = QPlainTextEdit()
+        self.message_text.setReadOnly(True)
+        splitter.addWidget(self.table)
+        splitter.addWidget(self.message_text)
+        layout.addWidget(splitter)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+        self.messages = []
+
+        if value:
+            self.search()
+
+    def search(self):
+        value = self.search_input.text().strip()
+        field = self.field_combo.currentText()
+        filters = {}
+        if value:
+            key = {"Sample No.": "sample_number", "Control ID": "control_id",
+                   "Analyzer": "analyzer", "Text": "search"}[field]
+            filters[key] = value
+        self.status_label.setText("Searching...")
+        self.db_worker.submit(self.db.get_messages, limit=int(self.limit_combo.currentText()),
+                              on_done=self.show_messages,
+                              on_error=lambda e: self.status_label.setText(f"Search failed: {e}"),
+                              **filters)
+
+    def show_messages(self, messages):
+        self.messages = messages
+        self.table.setRowCount(len(messages))
+        for i, (_, logged_at, analyzer, direction, protocol, control_id, _) in enumerate(messages):
+            for column, value in enumerate([logged_at, analyzer, direction, protocol, control_id]):
+                self.table.setItem(i, column, QTableWidgetItem(value or ""))
+        self.message_text.clear()
+        self.status_label.setText(f"{len(messages)} messages")
+        if messages:
+            self.table.selectRow(0)
+
+    def show_message(self):
+        rows = self.table.selectionModel().selectedRows()
+        if rows:
+            self.message_text.setPlainText(self.messages[rows[0].row()][6].replace("\r", "\n"))
@@ -1,10 +1,12 @@
 from PySide6.QtWidgets import (QWidget, QHBoxLayout, QVBoxLayout, QSplitter, QGroupBox, 
                              QRadioButton, QFormLayout, QLineEdit, QComboBox, QCheckBox, 
                              QPushButton, QLabel, QTextEdit, QTableWidget, QTableWidgetItem, 
-                             QHeaderView, QTabWidget, QMessageBox)
+                             QHeaderView, QTabWidget, QMessageBox, QFileDialog, QProgressDialog,
+                             QTableView)
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QColor
-import sqlite3
+from src.ui.sample_model import SampleTableModel
+from src.ui.message_log_dialog import MessageLogDialog
 
 class ResultTab(QWidget):
     # Define signals if needed
@@ -25,13 +27,13 @@ class ResultTab(QWidget):
         sample_list_group = QGroupBox("Samples")
         sample_list_layout = QVBoxLayout(sample_list_group)
         
-        self.sample_list = QTableWidget()
-        self.sample_list.setColumnCount(3)
-        self.sample_list.setHorizontalHeaderLabels(["Sample No.", "Patient ID", "Patient Name"])
+        # Backed by a paged model once the database is available
+        self.sample_model = None
+        self.sample_list = QTableView()
         self.sample_list.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        self.sample_list.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.sample_list.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
-        self.sample_list.selectionModel().selectionChanged.connect(self.load_sample_results)
+        self.sample_list.verticalHeader().setVisible(False)
+        self.sample_list.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.sample_list.setSelectionMode(QTableView.SelectionMode.SingleSelection)
         
         sample_list_layout.addWidget(self.sample_list)
         
@@ -39,6 +41,16 @@ class ResultTab(QWidget):
         result_details_group = QGroupBox("Results")
         result_details_layout = QVBoxLayout(result_details_group)
         
+        patient_layout = QHBoxLayout()
+        patient_layout.addWidget(QLabel("Patient ID:"))
+        self.patient_id_label = QLabel("Not Available")
+        patient_layout.addWidget(self.patient_id_label)
+        patient_layout.addWidget(QLabel("Patient Name:"))
+        self.patient_name_label = QLabel("Not Available")
+        patient_layout.addWidget(self.patient_name_label)
+        patient_layout.addStretch()
+        result_details_layout.addLayout(patient_layout)
+        
         self.result_table = QTableWidget()
         self.result_table.setColumnCount(5)
         self.result_table.setHorizontalHeaderLabels(["Test Code", "Result", "Unit", "Normal Range", "Sent"])
@@ -55,8 +67,16 @@ class ResultTab(QWidget):
         send_all_button = QPushButton("Send All Results")
         send_all_button.clicked.connect(self.send_all_results)
         
+        export_button = QPushButton("Export Results")
+        export_button.clicked.connect(self.export_results)
+        
         button_layout.addWidget(send_selected_button)
         button_layout.addWidget(send_all_button)
+        button_layout.addWidget(export_button)
+        
+        traffic_button = QPushButton("Show Traffic")
+        traffic_button.clicked.connect(self.show_traffic)
+        button_layout.addWidget(traffic_button)
         
         result_details_layout.addLayout(button_layout)
         
@@ -94,74 +114,106 @@ class ResultTab(QWidget):
         if not result_ids:
             return
         
-        try:
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            
-            for result_id in result_ids:
-                cursor.execute("UPDATE results SET sent = 1 WHERE id = ?", (result_id,))
-            
-            conn.commit()
-            conn.close()
-            
+        main_window = self.window()
+        main_window.engine_thread.submit(main_window.engine.send_results(result_ids))
+
+    def results_sent(self, count):
+        self.load_sample_results()
+        QMessageBox.information(self, "Success", f"{count} results sent successfully")
+
+    def results_ready(self, sample_numbers):
+        # Results of a running analysis become sendable sample by sample;
+        # the shown sample is read back when it is one of them
+        selected = self.sample_list.selectionModel().selectedRows() if self.sample_model else []
+        if selected and self.sample_model.index(selected[0].row(), 0).data() in sample_numbers:
             self.load_sample_results()
-            
-            self.log_text.append(f"Sent {len(result_ids)} results to LIS")
-            QMessageBox.information(self, "Success", f"{len(result_ids)} results sent successfully")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to send results: {str(e)}")        
+
+    def export_results(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Results", "results.csv", "CSV Files (*.csv)")
+        if not path:
+            return
+
+        main_window = self.window()
+        progress = QProgressDialog("Exporting results...", "Cancel", 0, 0, self)
+        progress.setWindowTitle("Export Results")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(500)
+
+        def update(done, total):
+            progress.setMaximum(total)
+            progress.setValue(done)
+
+        def finished(count):
+            progress.close()
+            QMessageBox.information(self, "Success", f"{count} results exported to {path}")
+
+        def failed(e):
+            progress.close()
+            if not job.cancelled:
+                QMessageBox.critical(self, "Error", f"Failed to export results: {str(e)}")
+
+        job = main_window.db_worker.submit_job(main_window.db_manager.export_results, path,
+                                               on_done=finished, on_error=failed, on_progress=update)
+        progress.canceled.connect(job.cancel)
+
+    def show_traffic(self):
+        # Messages logged for the selected sample, newest first
+        selected = self.sample_list.selectionModel().selectedRows() if self.sample_model else []
+        if not selected:
+            QMessageBox.warning(self, "Warning", "Please select a sample")
+            return
+        sample_number = self.sample_model.index(selected[0].row(), 0).data()
+        if not sample_number:
+            return
+        main_window = self.window()
+        dialog = MessageLogDialog(main_window.db_manager, main_window.db_worker, self,
+                                  "Sample No.", sample_number)
+        dialog.show()
+
+    def load_sample_list(self):
+        if self.sample_model is None:
+            main_window = self.window()
+            self.sample_model = SampleTableModel(main_window.db_manager, main_window.db_worker, self)
+            self.sample_list.setModel(self.sample_model)
+            self.sample_list.selectionModel().selectionChanged.connect(self.load_sample_results)
+        else:
+            self.sample_model.refresh()
 
     def load_sample_results(self):
-        selected = self.sample_list.selectedItems()
+        selected = self.sample_list.selectionModel().selectedRows()
         if not selected:
             return
         
-        sample_db_id = self.sample_list.item(selected[0].row(), 0).data(Qt.ItemDataRole.UserRole)
+        sample_db_id = self.sample_model.sample_id(selected[0].row())
+        if sample_db_id is None:
+            # Its page is still being read back
+            return
 
-        try:
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT patient_id, patient_name
-                FROM samples
-                WHERE id = ?
-            """, (sample_db_id,))
-            
-            patient = cursor.fetchone()
-            self.patient_id_label.setText(patient[0])
-            self.patient_name_label.setText(patient[1])
+        main_window = self.window()
+        main_window.db_worker.submit(main_window.db_manager.get_sample_results, sample_db_id,
+                                     on_done=lambda data: self.show_sample_results(*data),
+                                     on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to load sample results: {str(e)}"))
+
+    def show_sample_results(self, patient, results):
+        self.patient_id_label.setText(patient[0])
+        self.patient_name_label.setText(patient[1])
+        
+        self.result_table.setRowCount(len(results))
+        for i, result in enumerate(results):
+            result_id, test_code, result_value, unit, lower_range, upper_range, sent = result
             
-            cursor.execute("""
-                SELECT r.id, t.test_code, r.result_value, t.unit, t.lower_range, t.upper_range, r.sent
-                FROM results r
-                JOIN tests t ON r.test_id = t.id
-                WHERE r.sample_id = ?
-            """, (sample_db_id,))
+            normal_range = f"{lower_range} - {upper_range}"
+            sent_text = "Yes" if sent else "No"
             
-            results = cursor.fetchall()
+            self.result_table.setItem(i, 0, QTableWidgetItem(test_code))
+            self.result_table.setItem(i, 1, QTableWidgetItem(str(result_value)))
+            self.result_table.setItem(i, 2, QTableWidgetItem(unit))
+            self.result_table.setItem(i, 3, QTableWidgetItem(normal_range))
+            self.result_table.setItem(i, 4, QTableWidgetItem(sent_text))
             
-            self.result_table.setRowCount(len(results))
-            for i, result in enumerate(results):
-                result_id, test_code, result_value, unit, lower_range, upper_range, sent = result
-                
-                normal_range = f"{lower_range} - {upper_range}"
-                sent_text = "Yes" if sent else "No"
-                
-                self.result_table.setItem(i, 0, QTableWidgetItem(test_code))
-                self.result_table.setItem(i, 1, QTableWidgetItem(str(result_value)))
-                self.result_table.setItem(i, 2, QTableWidgetItem(unit))
-                self.result_table.setItem(i, 3, QTableWidgetItem(normal_range))
-                self.result_table.setItem(i, 4, QTableWidgetItem(sent_text))
-                
-                self.result_table.item(i, 0).setData(Qt.ItemDataRole.UserRole, result_id)
-                
-                if result_value < lower_range or result_value > upper_range:
-                    for col in range(5):
-                        item = self.result_table.item(i, col)
-                        item.setBackground(QColor(80, 0, 0))
+            self.result_table.item(i, 0).setData(Qt.ItemDataRole.UserRole, result_id)
             
-            conn.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load sample results: {str(e)}")        
\ No newline at end of file
+            if result_value < lower_range or result_value > upper_range:
+                for col in range(5):
+                    item = self.result_table.item(i, col)
+                    item.setBackground(QColor(80, 0, 0))
@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+class SampleTableModel(QAbstractTableModel):
+    """Samples table, newest first, read from SQLite a page at a time.
+
+    The view asks for more rows through canFetchMore/fetchMore as it
+    scrolls; each page is a keyset query on (date_time, id) run on the
+    database worker, and its rows are inserted when the query is done.
+    Only the key each page starts after is kept for every page, the rows
+    themselves live in a small LRU cache and evicted pages are re-read in
+    the background when scrolled back into view, showing empty rows until
+    they arrive. Memory and load time stay flat however many samples exist.
+    """
+
+    HEADERS = ["Sample No.", "Patient ID", "Patient Name"]
+
+    def __init__(self, db_manager, db_worker, parent=None, page_size=200, cache_pages=8):
+        super().__init__(parent)
+        self.db = db_manager
+        self.db_worker = db_worker
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self._page_keys = []
+        self._pages = OrderedDict()
+        self._next_key = None
+        self._rows = 0
+        self._exhausted = False
+        self._fetching = False
+        # Pages being re-read; bumping the generation on refresh makes the
+        # answers to queries still running be ignored
+        self._loading = set()
+        self._generation = 0
+        self.fetchMore()
+
+    def refresh(self):
+        self.beginResetModel()
+        self._page_keys = []
+        self._pages.clear()
+        self._next_key = None
+        self._rows = 0
+        self._exhausted = False
+        self._fetching = False
+        self._loading.clear()
+        self._generation += 1
+        self.endResetModel()
+        # Views only fetch once they are painted; load the first page now so
+        # the newest samples are there even while the tab is hidden
+        self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted or self._fetching:
+            return
+        self._fetching = True
+        generation = self._generation
+        self.db_worker.submit(self.db.get_samples_page, self._next_key, self.page_size,
+                              on_done=lambda rows: self._page_fetched(generation, rows),
+                              on_error=lambda e: self._fetch_failed(generation))
+
+    def _page_fetched(self, generation, rows):
+        if generation != self._generation:
+            return
+        self._fetching = False
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if not rows:
+            return
+
+        self.beginInsertRows(QModelIndex(), self._rows, self._rows + len(rows) - 1)
+        self._page_keys.append(self._next_key)
+        self._cache(len(self._page_keys) - 1, rows)
+        self._next_key = (rows[-1][4], rows[-1][0])
+        self._rows += len(rows)
+        self.endInsertRows()
+
+    def _fetch_failed(self, generation):
+        # The view asks again on its next scroll
+        if generation == self._generation:
+            self._fetching = False
+
+    def _cache(self, page, rows):
+        self._pages[page] = rows
+        self._pages.move_to_end(page)
+        while len(self._pages) > self.cache_pages:
+            self._pages.popitem(last=False)
+
+    def _row(self, row):
+        page, offset = divmod(row, self.page_size)
+        rows = self._pages.get(page)
+        if rows is None:
+            self._reload(page)
+            return None
+        self._pages.move_to_end(page)
+        # A page re-read after samples were updated can come back shorter
+        return rows[offset] if offset < len(rows) else None
+
+    def _reload(self, page):
+        if page in self._loading:
+            return
+        self._loading.add(page)
+        generation = self._generation
+        self.db_worker.submit(self.db.get_samples_page, self._page_keys[page], self.page_size,
+                              on_done=lambda rows: self._page_reloaded(generation, page, rows),
+                              on_error=lambda e: self._loading.discard(page))
+
+    def _page_reloaded(self, generation, page, rows):
+        if generation != self._generation:
+            return
+        self._loading.discard(page)
+        self._cache(page, rows)
+        first = page * self.page_size
+        last = min(first + self.page_size, self._rows) - 1
+        self.dataChanged.emit(self.index(first, 0), self.index(last, len(self.HEADERS) - 1))
+
+    def sample_id(self, row):
+        sample = self._row(row)
+        return sample[0] if sample else None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            sample = self._row(index.row())
+            return sample[index.column() + 1] if sample else None
+        if role == Qt.ItemDataRole.UserRole:
+            return self.sample_id(index.row())
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
@@ -1,14 +1,11 @@
-import random
-from datetime import datetime
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                             QLabel, QComboBox, QPushButton, QTabWidget, QRadioButton,
                             QLineEdit, QCheckBox, QTextEdit, QProgressBar, QGroupBox,
                             QFormLayout, QTableWidget, QTableWidgetItem, QHeaderView,
                             QSplitter, QMessageBox, QScrollArea, QSpacerItem, QSizePolicy,
                             QStackedWidget, QFrame, QListWidget, QListWidgetItem, QToolButton)
-from PySide6.QtCore import Qt, QTimer, QThread, Signal, QDateTime, QSize
+from PySide6.QtCore import Qt, QThread, Signal, QDateTime, QSize
 from PySide6.QtGui import QFont, QIcon, QColor, QPalette
-import sqlite3
 
 class SampleTab(QWidget):
     def __init__(self, parent=None):
@@ -56,7 +53,18 @@ class SampleTab(QWidget):
         start_button.setIconSize(QSize(24, 24))
         start_button.setStyleSheet("font-size: 16px; padding: 10px;")
         start_button.clicked.connect(self.start_analysis)
-        sample_layout.addWidget(start_button)
+        
+        cancel_button = QPushButton()
+        cancel_button.setIcon(QIcon.fromTheme("process-stop"))
+        cancel_button.setText("Cancel")
+        cancel_button.setIconSize(QSize(24, 24))
+        cancel_button.setStyleSheet("font-size: 16px; padding: 10px;")
+        cancel_button.clicked.connect(self.cancel_analysis)
+        
+        analysis_button_layout = QHBoxLayout()
+        analysis_button_layout.addWidget(start_button, 1)
+        analysis_button_layout.addWidget(cancel_button)
+        sample_layout.addLayout(analysis_button_layout)
         
         # Progress section
         progress_group = QGroupBox("Analysis Progress")
@@ -121,6 +129,10 @@ class SampleTab(QWidget):
         sample_row_layout.addWidget(patient_input)
         sample_row_layout.addWidget(patient_name_label)
         sample_row_layout.addWidget(patient_name_input)
+
+        # STAT samples are processed ahead of routine ones
+        stat_check = QCheckBox("STAT")
+        sample_row_layout.addWidget(stat_check)
         
         remove_button = QToolButton()
         remove_button.setText("X")
@@ -133,9 +145,8 @@ class SampleTab(QWidget):
         sample_row.deleteLater()        
 
     def start_analysis(self):
-        sample_ids = []
-        patient_ids = []
-        patient_names = []
+        samples = []
+        stat = []
         
         for i in range(self.sample_layout.count()):
             widget = self.sample_layout.itemAt(i).widget()
@@ -144,151 +155,42 @@ class SampleTab(QWidget):
                 sample_input = layout.itemAt(1).widget()
                 patient_input = layout.itemAt(3).widget()
                 patient_name_input = layout.itemAt(5).widget()
+                stat_check = layout.itemAt(6).widget()
                 
                 if sample_input.text():
-                    sample_ids.append(sample_input.text())
-                    patient_ids.append(patient_input.text())
-                    patient_names.append(patient_name_input.text())
+                    samples.append((sample_input.text(), patient_input.text(), patient_name_input.text()))
+                    if stat_check.isChecked():
+                        stat.append(sample_input.text())
         
-        if not sample_ids:
+        if not samples:
             QMessageBox.warning(self, "Warning", "Please enter at least one sample ID")
             return
         
-        self.store_samples(sample_ids, patient_ids, patient_names)
-        self.generate_results(sample_ids)
-        self.load_sample_list()
-        
-        self.progress_bar.setMaximum(len(sample_ids))
+        self.progress_bar.setMaximum(len(samples))
         self.progress_bar.setValue(0)
         
-        self.current_sample_index = 0
-        self.progress_timer = QTimer()
-        self.progress_timer.timeout.connect(lambda: self.update_progress(sample_ids))
-        self.progress_timer.start(1000)
+        main_window = self.window()
+        main_window.engine_thread.submit(main_window.engine.run_analysis(samples, stat=stat))
         
-        QMessageBox.information(self, "Started", "Analysis started for {} samples".format(len(sample_ids)))                
+        QMessageBox.information(self, "Started", "Analysis started for {} samples".format(len(samples)))                
 
-    def update_progress(self, sample_ids):
-        if self.current_sample_index < len(sample_ids):
-            self.progress_bar.setValue(self.current_sample_index + 1)
-            self.current_sample_label.setText(sample_ids[self.current_sample_index])
-            self.current_sample_index += 1
-        else:
-            self.progress_timer.stop()
-            self.current_sample_label.setText("Completed")
-            QMessageBox.information(self, "Completed", "Analysis completed for all samples")
-    
-    def store_samples(self, sample_ids, patient_ids, patient_names):
-        try:
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            for i, sample_id in enumerate(sample_ids):
-                cursor.execute("SELECT id FROM samples WHERE sample_number = ?", (sample_id,))
-                existing = cursor.fetchone()
-                
-                patient_id = patient_ids[i] if i < len(patient_ids) else ""
-                patient_name = patient_names[i] if i < len(patient_names) else ""
-                
-                if existing:
-                    cursor.execute("""
-                        UPDATE samples SET
-                        patient_id = ?,
-                        patient_name = ?,
-                        date_time = ?
-                        WHERE sample_number = ?
-                    """, (patient_id, patient_name, now, sample_id))
-                else:
-                    cursor.execute("""
-                        INSERT INTO samples
-                        (sample_number, patient_id, patient_name, date_time)
-                        VALUES (?, ?, ?, ?)
-                    """, (sample_id, patient_id, patient_name, now))
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to store samples: {str(e)}")
-    
-    def generate_results(self, sample_ids):
-        try:
-            analyzer_id = self.analyzer_combo.currentData()
-            if not analyzer_id:
-                return
-            
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT id, test_code, lower_range, upper_range
-                FROM tests
-                WHERE analyzer_id = ?
-            """, (analyzer_id,))
-            
-            tests = cursor.fetchall()
-            if not tests:
-                conn.close()
-                return
-            
-            for sample_id in sample_ids:
-                cursor.execute("SELECT id FROM samples WHERE sample_number = ?", (sample_id,))
-                sample_db_id = cursor.fetchone()[0]
-                
-                for test in tests:
-                    test_id, test_code, lower_range, upper_range = test
-                    
-                    result_value = round(random.uniform(lower_range, upper_range), 3)
-                    
-                    cursor.execute("""
-                        SELECT id FROM results
-                        WHERE sample_id = ? AND test_id = ?
-                    """, (sample_db_id, test_id))
-                    
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        cursor.execute("""
-                            UPDATE results SET
-                            result_value = ?,
-                            sent = 0
-                            WHERE sample_id = ? AND test_id = ?
-                        """, (result_value, sample_db_id, test_id))
-                    else:
-                        cursor.execute("""
-                            INSERT INTO results
-                            (sample_id, test_id, result_value, sent)
-                            VALUES (?, ?, ?, 0)
-                        """, (sample_db_id, test_id, result_value))
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to generate results: {str(e)}")      
+    def cancel_analysis(self):
+        self.window().engine.cancel_analysis()
 
-    def load_sample_list(self):
-        try:
-            conn = sqlite3.connect('analyzersim.db')
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT id, sample_number, patient_id, patient_name
-                FROM samples
-                ORDER BY date_time DESC
-            """)
-            
-            samples = cursor.fetchall()
-            
-            self.sample_list.setRowCount(len(samples))
-            for i, sample in enumerate(samples):
-                sample_id, sample_number, patient_id, patient_name = sample
-                
-                self.sample_list.setItem(i, 0, QTableWidgetItem(sample_number))
-                self.sample_list.setItem(i, 1, QTableWidgetItem(patient_id))
-                self.sample_list.setItem(i, 2, QTableWidgetItem(patient_name))
-                self.sample_list.item(i, 0).setData(Qt.ItemDataRole.UserRole, sample_id)
-            
-            conn.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load sample list: {str(e)}")
+    def update_store_progress(self, stage, done, total):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        self.current_sample_label.setText(f"Storing {stage} ({done}/{total})")
+
+    def update_progress(self, done, total, sample_number):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        self.current_sample_label.setText(sample_number)
+
+    def analysis_finished(self):
+        self.current_sample_label.setText("Completed")
+        QMessageBox.information(self, "Completed", "Analysis completed for all samples")
+
+    def analysis_cancelled(self, done):
+        self.current_sample_label.setText("Cancelled")
+        QMessageBox.information(self, "Cancelled", f"Analysis cancelled after {done} samples")
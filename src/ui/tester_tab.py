@@ -1,87 +1,373 @@
 from PySide6.QtWidgets import (QWidget, QHBoxLayout, QVBoxLayout, QSplitter, QGroupBox, 
                              QRadioButton, QFormLayout, QLineEdit, QComboBox, QCheckBox, 
                              QPushButton, QLabel, QTextEdit, QTableWidget, QTableWidgetItem, 
-                             QHeaderView, QTabWidget, QMessageBox, QGridLayout, QFileDialog)
+                             QHeaderView, QTabWidget, QMessageBox, QGridLayout, QFileDialog,
+                             QInputDialog)
 from PySide6.QtCore import Qt, Signal, QThread
 from PySide6.QtGui import QColor
 import socket
-import serial
 import json
+import queue
+import threading
+import time
 from datetime import datetime
+from src.utils.astm import ASTMFrameParser, ASTMFrame, CONTROL_NAMES, ENQ, ACK, NAK, EOT, encode_records
+from src.utils.hl7 import MLLPFramer, wrap, msh_fields
+from src.utils.metrics import ExchangeMetrics, MetricsServer, registry
+from src.ui.log_view import LogView
+from src.utils.event_batcher import EventBatcher
+from src.engine.link import open_serial, read_available
+from src.utils.capture import CaptureReader, CaptureWriter, RECEIVED, SENT, replay
+from src.ui.message_log_dialog import MessageLogDialog
+from src.utils.responder import Responder, ResponderError, DEFAULT_RULES
+
+CONTROL_CODES = {name.strip("<>"): code for code, name in CONTROL_NAMES.items()}
+
+# E1381 sender limits for messages sent from the output window: seconds to
+# wait for the reply to an ENQ or a frame, and times a frame is sent
+REPLY_TIMEOUT = 15.0
+MAX_ATTEMPTS = 6
 
 class CommThread(QThread):
-    data_received = Signal(str)
-    status_update = Signal(str)
+    # Received data and status messages reach the UI in batches of
+    # ("data" | "status", text) events, at most ~20 per second
+    events_received = Signal(list)
 
-    def __init__(self, protocol, connection_type, settings, auto_response=False):
+    def __init__(self, protocol, connection_type, settings, responder=None, name="",
+                 capture=None, message_log=None):
         super().__init__()
         self.protocol = protocol
         self.connection_type = connection_type
         self.settings = settings
         self.running = False
         self.conn = None
-        self.auto_response = auto_response
+        # Responder deciding the automatic replies, None to reply to nothing
+        self.responder = responder
+        self.stopping = threading.Event()
+        # CaptureWriter recording every byte in both directions, if any
+        self.capture = capture
+        # MessageLog for complete messages in both directions, if any
+        self.message_log = message_log
+        self.name = name
+        self._astm_text = []
+        self.replay_stop = threading.Event()
+        # The reader's auto-replies, send() on the GUI thread and a replay
+        # thread all write; one at a time, so frames never interleave and
+        # the byte counters keep a single writer
+        self._write_lock = threading.Lock()
+        # Timings: when the last read arrived (for our reply latency), when
+        # the current inbound ENQ arrived and what we are waiting on a reply for
+        self.metrics = ExchangeMetrics(name, protocol)
+        self._received_at = 0.0
+        self._session_started = None
+        self._awaiting = None
+        # Replies (ACK, NAK, EOT) for the ASTM transfer in progress from the
+        # output window, None while there is none
+        self._replies = None
+        self.events = EventBatcher(self.events_received.emit,
+                                   summarize=lambda count: ("status", f"({count} more sent messages not shown)"))
+
+    def log_message(self, direction, message):
+        if self.message_log:
+            self.message_log.log(direction, self.protocol, message, self.name)
+
+    def emit_data(self, text):
+        self.events.add(("data", text))
+
+    def emit_status(self, text, echo=False):
+        # Echoes of sent data are summarized when there are many of them
+        self.events.add(("status", text), verbose=echo)
 
     def run(self):
         self.running = True
+        self.events.start()
         try:
             if self.connection_type == "TCP/IP":
                 self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 if self.settings.get("mode") == "Client":
                     self.conn.connect((self.settings["host"], int(self.settings["port"])))
-                    self.status_update.emit("Connected via TCP/IP (Client)")
+                    self.emit_status("Connected via TCP/IP (Client)")
                 else:  # Server
                     self.conn.bind(("", int(self.settings["port"])))
                     self.conn.listen(1)
-                    self.status_update.emit("Server started, waiting for connection...")
+                    self.emit_status("Server started, waiting for connection...")
                     self.conn, addr = self.conn.accept()
-                    self.status_update.emit(f"Connected to {addr}")
+                    self.emit_status(f"Connected to {addr}")
             elif self.connection_type == "Serial":
-                self.conn = serial.Serial(
-                    port=self.settings["port"],
-                    baudrate=int(self.settings["baudrate"]),
-                    timeout=1
-                )
-                self.status_update.emit("Connected via Serial")
+                self.conn = open_serial(self.settings)
+                self.emit_status("Connected via Serial")
+
+            # Inbound bytes go through the protocol framer so frames and
+            # messages split across reads are reassembled before handling
+            if self.protocol == "ASTM":
+                framer = ASTMFrameParser()
+            else:
+                framer = MLLPFramer(self.handle_hl7_message)
 
             while self.running:
-                if self.connection_type == "TCP/IP":
-                    data = self.conn.recv(1024).decode('utf-8')
+                if self.protocol == "ASTM":
+                    for event in self.read_into(framer):
+                        self.handle_astm_event(event)
                 else:
-                    data = self.conn.readline().decode('utf-8')
-                if data:
-                    self.data_received.emit(data)
-                    if self.auto_response:
-                        response = "ACK" if self.protocol == "ASTM" else "MSH|^~\&|SIM||LIS||20250225||ACK|||2.5"
-                        self.send(response)
+                    self.read_into(framer)
 
         except Exception as e:
-            self.status_update.emit(f"Error: {str(e)}")
+            self.emit_status(f"Error: {str(e)}")
             self.running = False
+        finally:
+            # Reported here, while the batcher still delivers, rather than
+            # from stop() on the GUI thread
+            if self.stopping.is_set():
+                self.emit_status("Connection closed")
+            self.events.stop()
+
+    def read_into(self, framer):
+        if self.connection_type == "TCP/IP":
+            # Receive straight into the framer's buffer
+            buffer = framer.get_buffer()
+            nbytes = self.conn.recv_into(buffer)
+            if not nbytes:
+                self.running = False
+                if not self.stopping.is_set():
+                    self.emit_status("Connection closed by peer")
+                return []
+            self._received_at = time.perf_counter()
+            self.metrics.bytes_received.inc(nbytes)
+            if self.capture:
+                self.capture.write(RECEIVED, buffer[:nbytes])
+            return framer.buffer_updated(nbytes)
+        data = read_available(self.conn)
+        if data:
+            self._received_at = time.perf_counter()
+            self.metrics.bytes_received.inc(len(data))
+            if self.capture:
+                self.capture.write(RECEIVED, data)
+        return framer.feed(data)
+
+    def handle_astm_event(self, event):
+        metrics = self.metrics
+        if isinstance(event, ASTMFrame):
+            text = event.text.decode('utf-8', errors='replace')
+            metrics.frames_received.inc()
+            if event.valid:
+                # A repeated frame number is a retransmission, logged once
+                if not self._astm_text or self._astm_text[-1][0] != event.number:
+                    self._astm_text.append((event.number, event.text))
+                self.emit_data(f"[{event.number}] {text}")
+            else:
+                self.emit_data(f"[{event.number}] {text} (checksum error)")
+            self.respond_astm(event)
+            return
+
+        self.emit_data(CONTROL_NAMES[event])
+        replies = self._replies
+        if replies is not None and event in (ACK, NAK, EOT):
+            replies.put(event)
+            return
+        if event == ENQ:
+            self._session_started = self._received_at
+            self._astm_text = []
+            self.respond_astm(event)
+        elif event == EOT:
+            if self._astm_text:
+                self.log_message("received", b"".join(text for _, text in self._astm_text))
+                self._astm_text = []
+            if self._session_started is not None:
+                metrics.session.observe(self._received_at - self._session_started)
+                metrics.messages_received.inc()
+                self._session_started = None
+            self.respond_astm(event)
+        elif event in (ACK, NAK) and self._awaiting:
+            # Reply to something sent from the output window
+            histogram, sent = self._awaiting
+            histogram.observe(self._received_at - sent)
+            self._awaiting = None
+            if event == NAK:
+                metrics.naks_received.inc()
+
+    def handle_hl7_message(self, message):
+        self.emit_data(message.decode('utf-8', errors='replace').replace("\r", "\n"))
+        fields = msh_fields(message)
+        if len(fields) > 9 and fields[9].startswith(b"ACK"):
+            if self._awaiting:
+                histogram, sent = self._awaiting
+                histogram.observe(self._received_at - sent)
+                self._awaiting = None
+            return
+        self.metrics.messages_received.inc()
+        self.log_message("received", message)
+        response = self.responder and self.responder.hl7(message)
+        if response and self.wait_reply(response):
+            # Exactly one ACK per reassembled message
+            ack = response.hl7_ack(message)
+            if self.write(wrap(ack)):
+                self.metrics.reply.observe(time.perf_counter() - self._received_at)
+                if response.negative:
+                    self.metrics.naks_sent.inc()
+                self.emit_status(f"Sent: {ack.decode('latin-1')}", echo=True)
+
+    def respond_astm(self, event):
+        response = self.responder and self.responder.astm(event)
+        if response and self.wait_reply(response):
+            self.reply_control(response.control)
+
+    def wait_reply(self, response):
+        # A rule's delay holds the reply (and further reads) back; returns
+        # False if the connection is closed meanwhile
+        if response.delay:
+            return not self.stopping.wait(response.delay)
+        return True
+
+    def send_control(self, code):
+        if self.write(bytes([code])):
+            self.emit_status(f"Sent: {CONTROL_NAMES[code]}", echo=True)
+            return True
+        return False
+
+    def reply_control(self, code):
+        # Automatic reply; timed from the read that carried the event
+        if self.send_control(code):
+            self.metrics.reply.observe(time.perf_counter() - self._received_at)
+            if code == NAK:
+                self.metrics.naks_sent.inc()
+
+    def write(self, data):
+        if self.conn and self.running:
+            try:
+                with self._write_lock:
+                    if self.connection_type == "TCP/IP":
+                        self.conn.sendall(data)
+                    else:
+                        self.conn.write(data)
+                    self.metrics.bytes_sent.inc(len(data))
+                    if self.capture:
+                        self.capture.write(SENT, data)
+                return True
+            except Exception as e:
+                self.emit_status(f"Send error: {str(e)}")
+        return False
 
     def send(self, message):
         if self.conn and self.running:
+            # A control character name such as ACK or <EOT> is sent as is
+            control = CONTROL_CODES.get(message.strip().strip("<>").upper())
+            if self.protocol == "ASTM" and control is not None:
+                self.send_control(control)
+                return
             if self.protocol == "ASTM":
-                message = f"\x02{message}\x03"  # STX and ETX for ASTM
-            elif self.protocol == "HL7":
-                message = f"\x0B{message}\x1C\x0D"  # VT, FS, CR for HL7
-            try:
-                if self.connection_type == "TCP/IP":
-                    self.conn.send(message.encode('utf-8'))
+                self.send_astm(message)
+                return
+            message = f"\x0B{message}\x1C\x0D"  # VT, FS, CR for HL7
+            sent = time.perf_counter()
+            if self.write(message.encode('utf-8')):
+                self.log_message("sent", message[1:-2].encode('utf-8'))
+                self.metrics.messages_sent.inc()
+                self._awaiting = (self.metrics.message_ack, sent)
+                self.emit_status(f"Sent: {message}", echo=True)
+
+    def send_astm(self, message):
+        # Each line of the message is a record. The records go out as
+        # numbered, checksummed frames inside an ENQ ... EOT exchange, run
+        # from a helper thread that waits for the reader to pass on each reply
+        records = [line.encode('utf-8') for line in message.replace("\r", "\n").split("\n") if line.strip()]
+        if not records:
+            return
+        if self._replies is not None:
+            self.emit_status("A transfer is already in progress")
+            return
+        self._replies = queue.Queue()
+        threading.Thread(target=self._transfer, args=(records, self._replies),
+                         name="astm-send", daemon=True).start()
+
+    def _transfer(self, records, replies):
+        metrics = self.metrics
+        started = time.perf_counter()
+        established = False
+        try:
+            if self._exchange(bytes([ENQ]), replies, metrics.enq_ack) != ACK:
+                self.emit_status("Receiver did not accept the link")
+                return
+            established = True
+            for frame in encode_records(records):
+                for attempt in range(MAX_ATTEMPTS):
+                    reply = self._exchange(frame, replies, metrics.frame_ack)
+                    if reply is None:
+                        return
+                    if reply != NAK:
+                        break
+                    metrics.retransmissions.inc()
                 else:
-                    self.conn.write(message.encode('utf-8'))
-                self.status_update.emit(f"Sent: {message}")
-            except Exception as e:
-                self.status_update.emit(f"Send error: {str(e)}")
+                    self.emit_status("Frame rejected by receiver")
+                    return
+                metrics.frames_sent.inc()
+                self.emit_status(f"Sent: [{frame[1] - 0x30}] {frame[2:-5].decode('utf-8', errors='replace').rstrip()}",
+                                 echo=True)
+                if reply == EOT:
+                    # Receiver interrupt: the frame counts, the rest waits
+                    self.emit_status("Receiver interrupted the transfer")
+                    break
+            self.log_message("sent", b"\r".join(records) + b"\r")
+            metrics.messages_sent.inc()
+            metrics.session.observe(time.perf_counter() - started)
+        finally:
+            self._replies = None
+            if established:
+                self.send_control(EOT)
+
+    def _exchange(self, data, replies, histogram):
+        # Writes data and waits for its reply; None when there is none
+        sent = time.perf_counter()
+        if not self.write(data):
+            return None
+        try:
+            reply = replies.get(timeout=REPLY_TIMEOUT)
+        except queue.Empty:
+            self.metrics.timeouts.inc()
+            self.emit_status("Timed out waiting for a reply")
+            return None
+        if reply is not None:
+            histogram.observe(time.perf_counter() - sent)
+            if reply == NAK:
+                self.metrics.naks_received.inc()
+        return reply
+
+    def replay(self, path, speed=1.0, direction=SENT):
+        # Sends one side of a capture over this connection from a helper
+        # thread, keeping the recorded timing scaled by speed (0: no delays)
+        def run():
+            try:
+                with CaptureReader(path) as reader:
+                    self.emit_status(f"Replaying {path}")
+                    started = time.monotonic()
+                    sent = replay(reader, self.write, speed, direction, stop=self.replay_stop)
+                self.emit_status(f"Replay finished: {sent} bytes in {time.monotonic() - started:.2f}s")
+            except (OSError, ValueError) as e:
+                self.emit_status(f"Replay error: {e}")
+
+        self.replay_stop.clear()
+        threading.Thread(target=run, name="capture-replay", daemon=True).start()
 
     def stop(self):
         self.running = False
+        self.stopping.set()
+        self.replay_stop.set()
+        replies = self._replies
+        if replies is not None:
+            # Ends a transfer waiting on a reply
+            replies.put(None)
         if self.conn:
             if self.connection_type == "TCP/IP":
+                # shutdown() wakes the reader blocked in recv(); close()
+                # alone does not
+                try:
+                    self.conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
                 self.conn.close()
             else:
+                # Wake the reader blocked in read() before closing
+                self.conn.cancel_read()
                 self.conn.close()
-        self.status_update.emit("Connection closed")
 
 class TesterTab(QWidget):
     # Define signals if needed
@@ -141,6 +427,15 @@ class TesterTab(QWidget):
         self.port_input = QLineEdit("5000")
         self.baud_label = QLabel("Baud Rate:")
         self.baud_input = QLineEdit("9600")
+        self.data_bits_label = QLabel("Data Bits:")
+        self.data_bits_combo = QComboBox()
+        self.data_bits_combo.addItems(["8", "7", "6", "5"])
+        self.stop_bits_label = QLabel("Stop Bits:")
+        self.stop_bits_combo = QComboBox()
+        self.stop_bits_combo.addItems(["1", "1.5", "2"])
+        self.parity_label = QLabel("Parity:")
+        self.parity_combo = QComboBox()
+        self.parity_combo.addItems(["No", "Even", "Odd", "Mark", "Space"])
         
         self.conn_settings_grid.addWidget(self.host_label, 0, 0)
         self.conn_settings_grid.addWidget(self.host_input, 0, 1)
@@ -148,11 +443,24 @@ class TesterTab(QWidget):
         self.conn_settings_grid.addWidget(self.port_input, 1, 1)
         self.conn_settings_grid.addWidget(self.baud_label, 2, 0)
         self.conn_settings_grid.addWidget(self.baud_input, 2, 1)
+        self.conn_settings_grid.addWidget(self.data_bits_label, 3, 0)
+        self.conn_settings_grid.addWidget(self.data_bits_combo, 3, 1)
+        self.conn_settings_grid.addWidget(self.stop_bits_label, 4, 0)
+        self.conn_settings_grid.addWidget(self.stop_bits_combo, 4, 1)
+        self.conn_settings_grid.addWidget(self.parity_label, 5, 0)
+        self.conn_settings_grid.addWidget(self.parity_combo, 5, 1)
         settings_layout.addLayout(self.conn_settings_grid)
 
         # Auto-Response Checkbox
+        auto_response_layout = QHBoxLayout()
         self.auto_response_check = QCheckBox("Auto-Response")
-        settings_layout.addWidget(self.auto_response_check)
+        self.response_rules_btn = QPushButton("Rules...")
+        self.response_rules_btn.clicked.connect(self.edit_response_rules)
+        auto_response_layout.addWidget(self.auto_response_check)
+        auto_response_layout.addWidget(self.response_rules_btn)
+        auto_response_layout.addStretch()
+        settings_layout.addLayout(auto_response_layout)
+        self.response_rules = DEFAULT_RULES
 
         # Lab Machine Selector
         settings_layout.addWidget(QLabel("Lab Machine:"))
@@ -160,6 +468,31 @@ class TesterTab(QWidget):
         self.machine_combo.addItems(["Analyzer A", "Analyzer B", "Centrifuge", "Custom"])
         settings_layout.addWidget(self.machine_combo)
 
+        # Exchange latency metrics, for dashboards (Prometheus) or files
+        metrics_layout = QHBoxLayout()
+        self.metrics_serve_check = QCheckBox("Serve metrics on port")
+        self.metrics_serve_check.toggled.connect(self.toggle_metrics_server)
+        self.metrics_port_input = QLineEdit("9464")
+        self.metrics_port_input.setFixedWidth(60)
+        metrics_layout.addWidget(self.metrics_serve_check)
+        metrics_layout.addWidget(self.metrics_port_input)
+        settings_layout.addLayout(metrics_layout)
+        self.export_metrics_btn = QPushButton("Export Metrics")
+        self.export_metrics_btn.clicked.connect(self.export_metrics)
+        settings_layout.addWidget(self.export_metrics_btn)
+
+        # Search every message logged, by sample, control id or text
+        message_log_layout = QHBoxLayout()
+        self.message_search_input = QLineEdit()
+        self.message_search_input.setPlaceholderText("Search message log")
+        self.message_search_input.returnPressed.connect(self.search_message_log)
+        self.message_search_btn = QPushButton("Search")
+        self.message_search_btn.clicked.connect(self.search_message_log)
+        message_log_layout.addWidget(self.message_search_input)
+        message_log_layout.addWidget(self.message_search_btn)
+        settings_layout.addLayout(message_log_layout)
+        self.metrics_server = None
+
         # Connect/Disconnect Buttons
         self.connect_btn = QPushButton("Connect")
         self.connect_btn.clicked.connect(self.connect_to_lis)
@@ -191,12 +524,21 @@ class TesterTab(QWidget):
         # Input Window (Received Data)
         input_group = QGroupBox("Input (Received from LIS)")
         input_layout = QVBoxLayout()
-        self.input_window = QTextEdit()
-        self.input_window.setReadOnly(True)
+        self.input_window = LogView(max_lines=10000)
         input_layout.addWidget(self.input_window)
+        input_btn_layout = QHBoxLayout()
         self.clear_input_btn = QPushButton("Clear Input")
         self.clear_input_btn.clicked.connect(lambda: self.input_window.clear())
-        input_layout.addWidget(self.clear_input_btn)
+        # Soak tests: stop rendering traffic but keep counting it
+        self.pause_input_check = QCheckBox("Pause Rendering")
+        self.pause_input_check.toggled.connect(self.input_window.set_paused)
+        self.input_count_label = QLabel("0 lines")
+        self.input_window.stats_changed.connect(self.update_input_count)
+        input_btn_layout.addWidget(self.clear_input_btn)
+        input_btn_layout.addWidget(self.pause_input_check)
+        input_btn_layout.addStretch()
+        input_btn_layout.addWidget(self.input_count_label)
+        input_layout.addLayout(input_btn_layout)
         input_group.setLayout(input_layout)
         io_panel.addWidget(input_group, stretch=2)
 
@@ -217,6 +559,22 @@ class TesterTab(QWidget):
         self.clear_output_btn.clicked.connect(lambda: self.output_window.clear())
         output_btn_layout.addWidget(self.send_btn)
         output_btn_layout.addWidget(self.clear_output_btn)
+        output_btn_layout.addStretch()
+        # Record the session's raw bytes, or play a recording back
+        self.record_check = QCheckBox("Record Session")
+        self.record_check.toggled.connect(self.toggle_recording)
+        self.replay_direction_combo = QComboBox()
+        self.replay_direction_combo.addItems(["Sent", "Received"])
+        self.replay_speed_combo = QComboBox()
+        self.replay_speed_combo.addItems(["1x", "2x", "10x", "Max"])
+        self.replay_btn = QPushButton("Replay Capture")
+        self.replay_btn.clicked.connect(self.replay_capture)
+        self.replay_btn.setEnabled(False)
+        output_btn_layout.addWidget(self.record_check)
+        output_btn_layout.addWidget(self.replay_direction_combo)
+        output_btn_layout.addWidget(self.replay_speed_combo)
+        output_btn_layout.addWidget(self.replay_btn)
+        self.capture = None
         output_layout.addLayout(output_btn_layout)
         output_group.setLayout(output_layout)
         io_panel.addWidget(output_group, stretch=2)
@@ -224,8 +582,7 @@ class TesterTab(QWidget):
         # Status Log
         status_group = QGroupBox("Status Log")
         status_layout = QVBoxLayout()
-        self.status_log = QTextEdit()
-        self.status_log.setReadOnly(True)
+        self.status_log = LogView(max_lines=2000)
         status_layout.addWidget(self.status_log)
         self.clear_log_btn = QPushButton("Clear Log")
         self.clear_log_btn.clicked.connect(lambda: self.status_log.clear())
@@ -252,8 +609,8 @@ class TesterTab(QWidget):
             self.port_label.setText("Port:")
             self.port_label.show()
             self.port_input.show()
-            self.baud_label.hide()
-            self.baud_input.hide()
+            for widget in self.serial_widgets():
+                widget.hide()
             self.toggle_mode_fields()
         else:  # Serial
             self.host_label.hide()
@@ -262,8 +619,12 @@ class TesterTab(QWidget):
             self.port_label.show()
             self.port_input.setText("COM1")
             self.port_input.show()
-            self.baud_label.show()
-            self.baud_input.show()
+            for widget in self.serial_widgets():
+                widget.show()
+
+    def serial_widgets(self):
+        return [self.baud_label, self.baud_input, self.data_bits_label, self.data_bits_combo,
+                self.stop_bits_label, self.stop_bits_combo, self.parity_label, self.parity_combo]
 
     def toggle_mode_fields(self):
         if self.conn_type_combo.currentText() == "TCP/IP":
@@ -281,28 +642,40 @@ class TesterTab(QWidget):
             "host": self.host_input.text(),
             "port": self.port_input.text(),
             "baudrate": self.baud_input.text(),
+            "data_bits": self.data_bits_combo.currentText(),
+            "stop_bits": self.stop_bits_combo.currentText(),
+            "parity": self.parity_combo.currentText(),
             "mode": "Client" if self.client_radio.isChecked() else "Server"
         }
         protocol = self.protocol_combo.currentText()
         conn_type = self.conn_type_combo.currentText()
 
-        self.thread = CommThread(protocol, conn_type, settings, self.auto_response_check.isChecked())
-        self.thread.data_received.connect(self.update_input_window)
-        self.thread.status_update.connect(self.update_status_log)
+        responder = Responder(self.response_rules) if self.auto_response_check.isChecked() else None
+        self.thread = CommThread(protocol, conn_type, settings, responder,
+                                 self.machine_combo.currentText(), self.capture,
+                                 getattr(self.window(), "message_log", None))
+        self.thread.events_received.connect(self.handle_events)
         self.thread.start()
 
         self.connect_btn.setEnabled(False)
         self.disconnect_btn.setEnabled(True)
         self.send_btn.setEnabled(True)
+        self.replay_btn.setEnabled(True)
 
     def disconnect_from_lis(self):
         if self.thread:
             self.thread.stop()
             self.thread.wait()
+            events = self.thread.events
+            self.update_status_log(f"Delivered {events.events} events in {events.batches} batches "
+                                   f"({events.merged} merged, {events.dropped} echoes dropped)")
             self.thread = None
+        if self.capture:
+            self.capture.flush()
         self.connect_btn.setEnabled(True)
         self.disconnect_btn.setEnabled(False)
         self.send_btn.setEnabled(False)
+        self.replay_btn.setEnabled(False)
         self.status_indicator.setText("Disconnected")
         self.status_indicator.setStyleSheet("color: red; font-weight: bold;")
 
@@ -315,11 +688,28 @@ class TesterTab(QWidget):
             else:
                 QMessageBox.warning(self, "Empty Message", "Please enter data to send.")
 
-    def update_input_window(self, data):
-        self.input_window.append(f"[{datetime.now().strftime('%H:%M:%S')}] {data}")
+    def handle_events(self, events):
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        data = [f"[{timestamp}] {text}" for kind, text in events if kind == "data"]
+        if data:
+            self.input_window.buffer.extend(data)
+        status = [text for kind, text in events if kind == "status"]
+        if status:
+            self.status_log.buffer.extend(f"[{timestamp}] {message}" for message in status)
+            for message in status:
+                self.update_status_indicator(message)
+
+    def update_input_count(self, total, pending):
+        if pending:
+            self.input_count_label.setText(f"{total} lines ({pending} not shown)")
+        else:
+            self.input_count_label.setText(f"{total} lines")
 
     def update_status_log(self, message):
         self.status_log.append(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+        self.update_status_indicator(message)
+
+    def update_status_indicator(self, message):
         if "Connected" in message:
             self.status_indicator.setText("Connected")
             self.status_indicator.setStyleSheet("color: green; font-weight: bold;")
@@ -335,8 +725,12 @@ class TesterTab(QWidget):
             "host": self.host_input.text(),
             "port": self.port_input.text(),
             "baudrate": self.baud_input.text(),
+            "data_bits": self.data_bits_combo.currentText(),
+            "stop_bits": self.stop_bits_combo.currentText(),
+            "parity": self.parity_combo.currentText(),
             "machine": self.machine_combo.currentText(),
-            "auto_response": self.auto_response_check.isChecked()
+            "auto_response": self.auto_response_check.isChecked(),
+            "response_rules": self.response_rules
         }
         file_name, _ = QFileDialog.getSaveFileName(self, "Save Settings", "", "JSON Files (*.json)")
         if file_name:
@@ -356,20 +750,109 @@ class TesterTab(QWidget):
                 self.host_input.setText(settings["host"])
                 self.port_input.setText(settings["port"])
                 self.baud_input.setText(settings["baudrate"])
+                # Settings files saved before these fields existed
+                self.data_bits_combo.setCurrentText(settings.get("data_bits", "8"))
+                self.stop_bits_combo.setCurrentText(settings.get("stop_bits", "1"))
+                self.parity_combo.setCurrentText(settings.get("parity", "No"))
                 self.machine_combo.setCurrentText(settings["machine"])
                 self.auto_response_check.setChecked(settings["auto_response"])
+                self.response_rules = settings.get("response_rules", DEFAULT_RULES)
                 self.toggle_connection_fields(settings["conn_type"])
                 self.toggle_mode_fields()
             self.status_log.append(f"Settings loaded from {file_name}")
 
+    def toggle_recording(self, enabled):
+        if enabled and self.capture is None:
+            file_name, _ = QFileDialog.getSaveFileName(self, "Record Session", "",
+                                                       "Capture Files (*.lcap)")
+            if not file_name:
+                self.record_check.setChecked(False)
+                return
+            try:
+                self.capture = CaptureWriter(file_name)
+            except (OSError, ValueError) as e:
+                QMessageBox.warning(self, "Record Session", str(e))
+                self.record_check.setChecked(False)
+                return
+            self.update_status_log(f"Recording to {file_name}")
+        elif not enabled and self.capture is not None:
+            if self.thread:
+                self.thread.capture = None
+            self.capture.close()
+            self.update_status_log(f"Recorded {self.capture.records} chunks to {self.capture.path}")
+            self.capture = None
+        if self.thread:
+            # Start or stop recording a connection that is already open
+            self.thread.capture = self.capture
+
+    def replay_capture(self):
+        if not (self.thread and self.thread.running):
+            return
+        file_name, _ = QFileDialog.getOpenFileName(self, "Replay Capture", "", "Capture Files (*.lcap)")
+        if file_name:
+            speed = self.replay_speed_combo.currentText()
+            direction = SENT if self.replay_direction_combo.currentText() == "Sent" else RECEIVED
+            self.thread.replay(file_name, 0 if speed == "Max" else float(speed[:-1]), direction)
+
+    def edit_response_rules(self):
+        text = json.dumps(self.response_rules, indent=2)
+        while True:
+            text, ok = QInputDialog.getMultiLineText(self, "Auto-Response Rules",
+                                                     "Rules (JSON), see src/utils/responder.py:", text)
+            if not ok:
+                return
+            try:
+                responder = Responder.from_json(text)
+            except ResponderError as e:
+                QMessageBox.warning(self, "Auto-Response Rules", str(e))
+                continue
+            self.response_rules = responder.rules
+            if self.thread:
+                # Applies to the open connection from its next message
+                self.thread.responder = responder if self.auto_response_check.isChecked() else None
+            self.update_status_log(f"{len(responder.rules)} auto-response rules set")
+            return
+
+    def search_message_log(self):
+        main_window = self.window()
+        dialog = MessageLogDialog(main_window.db_manager, main_window.db_worker, self,
+                                  "Text", self.message_search_input.text().strip())
+        dialog.show()
+
+    def toggle_metrics_server(self, enabled):
+        if enabled and self.metrics_server is None:
+            try:
+                self.metrics_server = MetricsServer(int(self.metrics_port_input.text()))
+            except (ValueError, OSError) as e:
+                self.update_status_log(f"Metrics server error: {e}")
+                self.metrics_serve_check.setChecked(False)
+                return
+            self.metrics_server.start()
+            self.metrics_port_input.setEnabled(False)
+            self.update_status_log(f"Serving metrics on http://127.0.0.1:{self.metrics_server.port}/metrics")
+        elif not enabled and self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+            self.metrics_port_input.setEnabled(True)
+            self.update_status_log("Metrics server stopped")
+
+    def export_metrics(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Metrics", "",
+                                                   "JSON Files (*.json);;CSV Files (*.csv)")
+        if file_name:
+            with open(file_name, 'w', newline='') as f:
+                f.write(registry.to_csv() if file_name.lower().endswith(".csv") else registry.to_json())
+            self.status_log.append(f"Metrics exported to {file_name}")
+
     def load_template(self, template):
         if template == "ASTM ACK":
             self.output_window.setText("ACK")
         elif template == "HL7 ACK":
-            self.output_window.setText("MSH|^~\&|SIM||LIS||20250225||ACK|||2.5")
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            self.output_window.setText(f"MSH|^~\\&|SIM||LIS||{timestamp}||ACK|||2.5\rMSA|AA|")
         elif template == "Sample Result":
             if self.protocol_combo.currentText() == "ASTM":
-                self.output_window.setText("H|\^&|||SIM|||||||20250225\rP|1\rO|1||^^^GLU||20250225||||||A\rR|1|^^^GLU|5.5|mmol/L||||F")
+                self.output_window.setText("H|\^&|||SIM|||||||20250225\rP|1\rO|1||^^^GLU||20250225||||||A\rR|1|^^^GLU|5.5|mmol/L||||F\rL|1|N")
             else:  # HL7
                 self.output_window.setText("MSH|^~\&|SIM||LIS||20250225||ORU^R01|||2.5\rPID|1||12345||Doe^John\rOBR|1|||^GLUCOSE\rOBX|1|NM|^GLUCOSE||5.5|mmol/L|||F")
         else:
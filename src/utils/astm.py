@@ -0,0 +1,134 @@
+from collections import namedtuple
+from src.utils.framing import FrameBuffer
+
+# ASTM E1381 control characters
+STX = 0x02
+ETX = 0x03
+EOT = 0x04
+ENQ = 0x05
+ACK = 0x06
+LF = 0x0A
+CR = 0x0D
+NAK = 0x15
+ETB = 0x17
+
+CONTROL_NAMES = {
+    ENQ: "<ENQ>",
+    ACK: "<ACK>",
+    NAK: "<NAK>",
+    EOT: "<EOT>",
+}
+
+# number: frame number (0-7), text: record bytes between the frame number
+# and ETB/ETX, final: True for ETX frames, valid: checksum matched
+ASTMFrame = namedtuple("ASTMFrame", "number text final valid")
+
+
+# E1381 allows at most 240 text characters per frame; longer records are
+# split into ETB frames with the last one ending in ETX
+MAX_FRAME_TEXT = 240
+
+# Two hex digits for every checksum value, so encoding a frame is one
+# C-level sum over its bytes and a table lookup
+CHECKSUM_HEX = tuple(b"%02X" % value for value in range(256))
+
+
+def checksum(data):
+    # Modulo 256 sum of the frame number, text and ETB/ETX
+    return CHECKSUM_HEX[sum(data) & 0xFF]
+
+
+class ASTMFrameParser(FrameBuffer):
+    """Incremental E1381 parser fed with raw bytes.
+
+    Complete frames are sliced out of the receive buffer and returned as
+    ASTMFrame tuples. Control characters received between frames are
+    returned as plain ints.
+    """
+
+    def __init__(self, size=65536, max_frame=65536):
+        super().__init__(size)
+        self.max_frame = max_frame
+
+    def _drain(self):
+        events = []
+        buf = self._buf
+        view = self._view
+        pos = self._start
+        end = self._end
+
+        while pos < end:
+            byte = buf[pos]
+            if byte != STX:
+                if byte in CONTROL_NAMES:
+                    events.append(byte)
+                else:
+                    self.discarded += 1
+                pos += 1
+                continue
+
+            # Frame terminator is whichever of ETX/ETB comes first
+            etx = buf.find(b"\x03", pos + 1, end)
+            etb = buf.find(b"\x17", pos + 1, end if etx < 0 else etx)
+            term = etb if etb >= 0 else etx
+            if term < 0:
+                if end - pos > self.max_frame:
+                    # Runaway frame, drop it and resync on the next STX
+                    nxt = buf.find(b"\x02", pos + 1, end)
+                    self.discarded += (nxt if nxt >= 0 else end) - pos
+                    pos = nxt if nxt >= 0 else end
+                    continue
+                break
+
+            # A second STX before the terminator means the first frame was cut
+            restart = buf.find(b"\x02", pos + 1, term)
+            if restart >= 0:
+                self.discarded += restart - pos
+                pos = restart
+                continue
+
+            # Need the two checksum characters plus CR LF
+            if term + 5 > end:
+                break
+
+            frame_number = buf[pos + 1] - 0x30
+            received = bytes(view[term + 1:term + 3])
+            valid = received.upper() == checksum(view[pos + 1:term + 1])
+            events.append(ASTMFrame(frame_number, bytes(view[pos + 2:term]),
+                                    buf[term] == ETX, valid))
+            pos = term + 5
+
+        if pos >= end:
+            self._start = self._end = 0
+        else:
+            self._start = pos
+        return events
+
+
+def encode_frame(number, text, final=True):
+    # text is the record including its trailing CR
+    body = b"%d%s%s" % (number % 8, text, b"\x03" if final else b"\x17")
+    return b"\x02" + body + checksum(body) + b"\r\n"
+
+
+def encode_record(number, record, max_text=MAX_FRAME_TEXT):
+    # Frames for one record (without its trailing CR), numbered from number;
+    # returns them with the number the next frame should use
+    text = record + b"\r"
+    if len(text) <= max_text:
+        return [encode_frame(number, text)], (number + 1) % 8
+    frames = []
+    last = len(text) - max_text
+    for start in range(0, len(text), max_text):
+        frames.append(encode_frame(number, text[start:start + max_text], start >= last))
+        number = (number + 1) % 8
+    return frames, number
+
+
+def encode_records(records, number=1, max_text=MAX_FRAME_TEXT):
+    # Frames for a whole message; numbering runs on mod 8 across records
+    frames = []
+    for record in records:
+        encoded, number = encode_record(number, record, max_text)
+        frames.extend(encoded)
+    return frames
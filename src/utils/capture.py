@@ -0,0 +1,321 @@
+import argparse
+import mmap
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+# Append-only traffic captures.
+#
+# A capture file starts with MAGIC and holds one record per chunk of bytes
+# seen on a link: a RECORD header (timestamp as epoch seconds, direction,
+# connection id, length) followed by the raw bytes. Every index_every
+# records the writer appends (timestamp, offset, record number) to a
+# sidecar "<file>.idx", so a reader can jump to a point in time without
+# scanning. Readers memory-map the file and slice records out of the map,
+# so captures larger than RAM replay with only the pages in use resident.
+# A record cut short by a crash is ignored.
+
+MAGIC = b"LACSCAP1"
+RECORD = struct.Struct("<dBHI")
+INDEX_ENTRY = struct.Struct("<dQQ")
+
+RECEIVED = 0
+SENT = 1
+DIRECTIONS = {"received": RECEIVED, "sent": SENT}
+
+# Pages behind the read position are released every RELEASE_EVERY bytes, so
+# a replay's resident set stays bounded however large the file is
+RELEASE_EVERY = 64 * 1024 * 1024
+
+CaptureRecord = namedtuple("CaptureRecord", "timestamp direction connection data")
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class CaptureWriter:
+    """Appends records to a capture file; safe to share between threads."""
+
+    def __init__(self, path, index_every=256):
+        self.path = path
+        self.index_every = index_every
+        self.records = 0
+        self._lock = threading.Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            # Appending: count what is there and bring the index up to date
+            self.records = rebuild_index(path, index_every)
+        self._file = open(path, "ab")
+        self._index = open(index_path(path), "ab")
+        if new:
+            self._file.write(MAGIC)
+            self._index.truncate(0)
+
+    def write(self, direction, data, connection=0, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if self._file is None:
+                return
+            if self.records % self.index_every == 0:
+                self._index.write(INDEX_ENTRY.pack(timestamp, self._file.tell(), self.records))
+            self._file.write(RECORD.pack(timestamp, direction, connection, len(data)))
+            self._file.write(data)
+            self.records += 1
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._index.close()
+                self._file = self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _scan(buffer, start=len(MAGIC)):
+    # Yields (offset, timestamp, direction, connection, length) for every
+    # complete record from start on
+    size = len(buffer)
+    offset = start
+    while offset + RECORD.size <= size:
+        timestamp, direction, connection, length = RECORD.unpack_from(buffer, offset)
+        if offset + RECORD.size + length > size:
+            break
+        yield offset, timestamp, direction, connection, length
+        offset += RECORD.size + length
+
+
+def rebuild_index(path, index_every=256):
+    # Rewrites the sidecar index from the capture itself; returns the number
+    # of complete records. A torn record at the end is cut off so new
+    # records follow the last good one.
+    end = len(MAGIC)
+    records = 0
+    with open(path, "r+b") as f, open(index_path(path), "wb") as index:
+        if os.path.getsize(path) <= len(MAGIC):
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if buffer[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a capture file")
+            for offset, timestamp, _, _, length in _scan(buffer):
+                if records % index_every == 0:
+                    index.write(INDEX_ENTRY.pack(timestamp, offset, records))
+                records += 1
+                end = offset + RECORD.size + length
+        f.truncate(end)
+    return records
+
+
+class CaptureReader:
+    """Memory-mapped view of a capture file.
+
+    Iterating yields CaptureRecord tuples in file order; records(start=...)
+    starts at a timestamp using the sidecar index when there is one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = None
+        if os.fstat(self._file.fileno()).st_size < len(MAGIC):
+            self.close()
+            raise ValueError(f"{path} is not a capture file")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a capture file")
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(index_path(self.path), "rb") as f:
+                data = f.read()
+        except OSError:
+            return []
+        entries = [INDEX_ENTRY.unpack_from(data, offset)
+                   for offset in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+        # Entries past the end of the file are from a capture that was cut
+        return [entry for entry in entries if entry[1] < len(self._map)]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self, start=None):
+        buffer = self._map
+        offset = len(MAGIC)
+        if start is not None and self._index:
+            # Last indexed record at or before start, then scan forward
+            position = bisect_right([entry[0] for entry in self._index], start) - 1
+            if position >= 0:
+                offset = self._index[position][1]
+        released = offset - offset % mmap.PAGESIZE
+        for offset, timestamp, direction, connection, length in _scan(buffer, offset):
+            if offset - released >= RELEASE_EVERY:
+                released = self._release(released, offset)
+            if start is not None and timestamp < start:
+                continue
+            body = offset + RECORD.size
+            yield CaptureRecord(timestamp, direction, connection, buffer[body:body + length])
+
+    def _release(self, start, end):
+        # Drops the mapped pages in [start, end) from memory; they are read
+        # from disk again if needed. Returns the new page-aligned start
+        end -= end % mmap.PAGESIZE
+        if hasattr(mmap, "MADV_DONTNEED") and end > start:
+            self._map.madvise(mmap.MADV_DONTNEED, start, end - start)
+        return end
+
+    def summary(self):
+        # One pass over the headers only
+        records = 0
+        sizes = [0, 0]
+        first = last = None
+        connections = set()
+        released = 0
+        for offset, timestamp, direction, connection, length in _scan(self._map):
+            if offset - released >= RELEASE_EVERY:
+                released = self._release(released, offset)
+            records += 1
+            sizes[direction] += length
+            connections.add(connection)
+            first = timestamp if first is None else first
+            last = timestamp
+        return {
+            "records": records,
+            "bytes_received": sizes[RECEIVED],
+            "bytes_sent": sizes[SENT],
+            "connections": sorted(connections),
+            "start": first,
+            "duration": (last - first) if records else 0.0,
+        }
+
+
+def replay(records, send, speed=1.0, direction=None, connection=None, stop=None):
+    """Feeds captured bytes to send(data) with their original spacing.
+
+    speed scales time (2.0 plays twice as fast); 0 sends everything as fast
+    as possible. direction and connection select which records are replayed.
+    stop, a threading.Event, ends the replay early. Returns bytes sent.
+    """
+    sent = 0
+    origin = None
+    started = time.monotonic()
+    for record in records:
+        if stop is not None and stop.is_set():
+            break
+        if direction is not None and record.direction != direction:
+            continue
+        if connection is not None and record.connection != connection:
+            continue
+        if speed > 0:
+            if origin is None:
+                origin = record.timestamp
+            delay = (record.timestamp - origin) / speed - (time.monotonic() - started)
+            if delay > 0:
+                if stop is not None:
+                    if stop.wait(delay):
+                        break
+                else:
+                    time.sleep(delay)
+        send(record.data)
+        sent += len(record.data)
+    return sent
+
+
+def _printable(data):
+    return "".join(chr(byte) if 32 <= byte < 127 else f"<{byte:02X}>" for byte in data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and replay traffic captures")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    info = commands.add_parser("info", help="summarize a capture")
+    info.add_argument("path")
+
+    dump = commands.add_parser("dump", help="print records")
+    dump.add_argument("path")
+    dump.add_argument("--limit", type=int)
+
+    index = commands.add_parser("index", help="rebuild the .idx sidecar")
+    index.add_argument("path")
+
+    play = commands.add_parser("replay", help="send captured bytes to a TCP peer")
+    play.add_argument("path")
+    play.add_argument("--host", default="127.0.0.1")
+    play.add_argument("--port", type=int, required=True)
+    play.add_argument("--direction", choices=sorted(DIRECTIONS), default="sent",
+                      help="which side of the capture to send (default: sent)")
+    play.add_argument("--connection", type=int)
+    play.add_argument("--speed", type=float, default=1.0, help="time scale; 0 = as fast as possible")
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        print(f"{rebuild_index(args.path)} records indexed")
+        return 0
+
+    with CaptureReader(args.path) as reader:
+        if args.command == "info":
+            for key, value in reader.summary().items():
+                print(f"{key}: {value}")
+        elif args.command == "dump":
+            for number, record in enumerate(reader):
+                if args.limit is not None and number >= args.limit:
+                    break
+                arrow = "<-" if record.direction == RECEIVED else "->"
+                print(f"{record.timestamp:.6f} #{record.connection} {arrow} {_printable(record.data)}")
+        else:
+            with socket.create_connection((args.host, args.port)) as conn:
+                # Drain the peer's replies so it never blocks on a full socket
+                received = []
+
+                def drain():
+                    try:
+                        while True:
+                            data = conn.recv(65536)
+                            if not data:
+                                break
+                            received.append(len(data))
+                    except OSError:
+                        pass
+                threading.Thread(target=drain, daemon=True).start()
+                started = time.monotonic()
+                sent = replay(reader, conn.sendall, args.speed, DIRECTIONS[args.direction],
+                              args.connection)
+                print(f"Replayed {sent} bytes in {time.monotonic() - started:.2f}s, "
+                      f"{sum(received)} bytes received")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
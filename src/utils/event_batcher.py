@@ -0,0 +1,81 @@
+import threading
+
+
+class EventBatcher:
+    """Coalesces events from a producer thread into lists.
+
+    add() queues an event; the queue is handed to emit(list) when it reaches
+    max_batch events or, at the latest, every interval seconds from a small
+    flush thread. The consumer therefore sees at most one call per interval
+    (plus one per max_batch events) however fast events arrive.
+
+    Events added with verbose=True (e.g. echoes of sent data) are only kept
+    up to verbose_limit per batch; the rest are counted and replaced by one
+    summary event made by summarize(count).
+    """
+
+    def __init__(self, emit, interval=0.05, max_batch=1000, verbose_limit=20, summarize=None):
+        self.emit = emit
+        self.interval = interval
+        self.max_batch = max_batch
+        self.verbose_limit = verbose_limit
+        self.summarize = summarize
+        self.events = 0
+        self.batches = 0
+        self.dropped = 0
+        self._pending = []
+        self._verbose = 0
+        self._suppressed = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def merged(self):
+        # Events that shared a batch with an earlier one instead of being
+        # delivered on their own
+        return self.events - self.batches
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="event-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def add(self, event, verbose=False):
+        with self._lock:
+            if verbose:
+                self._verbose += 1
+                if self._verbose > self.verbose_limit:
+                    self._suppressed += 1
+                    self.dropped += 1
+                    return
+            self._pending.append(event)
+            self.events += 1
+            full = len(self._pending) >= self.max_batch
+        # Without a flush thread (not started or stopped) deliver right away
+        if full or self._thread is None:
+            self.flush()
+
+    def flush(self):
+        # Emitting under the lock keeps batches in order between the flush
+        # thread and the producer
+        with self._lock:
+            events, self._pending = self._pending, []
+            if self._suppressed and self.summarize:
+                events.append(self.summarize(self._suppressed))
+            self._suppressed = 0
+            self._verbose = 0
+            if events:
+                self.batches += 1
+                self.emit(events)
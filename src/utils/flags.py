@@ -0,0 +1,9 @@
+# Abnormal flags shared by the ASTM/HL7 message builders and the templates
+
+
+def result_flag(value, lower_range, upper_range):
+    if value < lower_range:
+        return "L"
+    if value > upper_range:
+        return "H"
+    return "N"
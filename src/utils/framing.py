@@ -0,0 +1,66 @@
+class FrameBuffer:
+    """Growable receive buffer shared by the protocol framers.
+
+    Bytes land in a preallocated bytearray, either written in place through
+    get_buffer/buffer_updated (socket.recv_into, asyncio.BufferedProtocol) or
+    copied in by feed. Subclasses implement _drain, which consumes complete
+    units between _start and _end and advances _start past them.
+    """
+
+    def __init__(self, size=65536):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self.discarded = 0
+
+    def _reserve(self, n):
+        # Make room for n more bytes, compacting before growing
+        if len(self._buf) - self._end >= n:
+            return
+        pending = self._end - self._start
+        if len(self._buf) - pending >= n:
+            self._buf[:pending] = self._buf[self._start:self._end]
+        else:
+            size = len(self._buf)
+            while size - pending < n:
+                size *= 2
+            buf = bytearray(size)
+            buf[:pending] = self._view[self._start:self._end]
+            self._buf = buf
+            self._view = memoryview(buf)
+        self._moved(self._start)
+        self._start = 0
+        self._end = pending
+
+    def _moved(self, offset):
+        # Called when pending data is shifted left by offset bytes
+        pass
+
+    def get_buffer(self, sizehint=4096):
+        if sizehint <= 0:
+            sizehint = 4096
+        self._reserve(sizehint)
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        self._end += nbytes
+        return self._drain()
+
+    def feed(self, data):
+        n = len(data)
+        if n:
+            self._reserve(n)
+            self._buf[self._end:self._end + n] = data
+            self._end += n
+        return self._drain()
+
+    def pending(self):
+        return self._end - self._start
+
+    def reset(self):
+        self._start = 0
+        self._end = 0
+
+    def _drain(self):
+        raise NotImplementedError
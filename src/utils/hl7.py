@@ -0,0 +1,131 @@
+from datetime import datetime
+from src.utils.framing import FrameBuffer
+
+# MLLP block characters
+VT = 0x0B
+FS = 0x1C
+CR = 0x0D
+
+START_BLOCK = b"\x0b"
+END_BLOCK = b"\x1c\x0d"
+
+
+def wrap(message):
+    return START_BLOCK + message + END_BLOCK
+
+
+class MLLPFramer(FrameBuffer):
+    """Reassembles MLLP blocks from a byte stream.
+
+    Each complete message (the bytes between VT and FS CR) is passed to
+    callback as bytes. Several messages in one read are split, and a message
+    spread over many reads is only scanned once: the search for the end block
+    resumes where the previous read left off.
+    """
+
+    def __init__(self, callback, size=65536, max_message=16 * 1024 * 1024):
+        super().__init__(size)
+        self.callback = callback
+        self.max_message = max_message
+        # Offset of the current message body, -1 while waiting for VT
+        self._body = -1
+        self._scan = 0
+
+    def _moved(self, offset):
+        if self._body >= 0:
+            self._body -= offset
+            self._scan -= offset
+
+    def reset(self):
+        super().reset()
+        self._body = -1
+        self._scan = 0
+
+    def _drain(self):
+        buf = self._buf
+        end = self._end
+        delivered = 0
+
+        while True:
+            if self._body < 0:
+                start = buf.find(b"\x0b", self._start, end)
+                if start < 0:
+                    # Anything outside a block is noise
+                    self.discarded += end - self._start
+                    self._start = self._end = 0
+                    break
+                self.discarded += start - self._start
+                self._start = start
+                self._body = self._scan = start + 1
+
+            stop = buf.find(b"\x1c\x0d", self._scan, end)
+            if stop < 0:
+                # Resume one byte back in case FS arrived without its CR
+                self._scan = max(self._body, end - 1)
+                if end - self._body > self.max_message:
+                    self.discarded += end - self._start
+                    self._body = -1
+                    self._start = self._end = 0
+                break
+
+            # A new VT inside the block means the previous message was cut
+            restart = buf.find(b"\x0b", self._body, stop)
+            if restart >= 0:
+                self.discarded += restart - self._start
+                self._start = restart
+                self._body = self._scan = restart + 1
+                continue
+
+            message = bytes(self._view[self._body:stop])
+            self._start = stop + 2
+            self._body = -1
+            delivered += 1
+            self.callback(message)
+
+        if self._body < 0 and self._start >= self._end:
+            self._start = self._end = 0
+        return delivered
+
+
+def msh_fields(message):
+    # Fields of the MSH segment, indexed so that fields[n] is MSH-n
+    segment_end = message.find(b"\r")
+    msh = message if segment_end < 0 else message[:segment_end]
+    if not msh.startswith(b"MSH") or len(msh) < 4:
+        return []
+    separator = msh[3:4]
+    return [b"MSH", separator] + msh[4:].split(separator)
+
+
+def build_ack(message, code="AA", text=""):
+    fields = msh_fields(message)
+
+    def field(n):
+        return fields[n].decode("latin-1") if n < len(fields) else ""
+
+    separator = field(1) or "|"
+    encoding = field(2) or "^~\\&"
+    trigger = field(9).split(encoding[:1])[1] if encoding[:1] in field(9) else ""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    msh = separator.join([
+        "MSH", encoding, field(5), field(6), field(3), field(4), timestamp, "",
+        f"ACK^{trigger}" if trigger else "ACK",
+        f"ACK{timestamp}", field(11) or "P", field(12) or "2.5",
+    ])
+    msa = separator.join(["MSA", code, field(10)] + ([text] if text else []))
+    return f"{msh}\r{msa}\r".encode("latin-1")
+
+
+def segment_fields(message, name):
+    # Fields of the first segment called name, indexed so fields[n] is
+    # NAME-n (use msh_fields for MSH, whose first field is the separator)
+    separator = message[3:4] or b"|"
+    for segment in message.split(b"\r"):
+        if segment[:3] == name:
+            return segment.split(separator)
+    return []
+
+
+def ack_code(message):
+    fields = segment_fields(message, b"MSA")
+    return fields[1].decode("latin-1") if len(fields) > 1 else ""
@@ -0,0 +1,55 @@
+import threading
+from collections import deque
+from itertools import islice
+
+
+class LogBuffer:
+    """Thread-safe ring buffer of log lines.
+
+    Any thread may append; only the newest max_lines are kept. A viewer
+    calls take_new() periodically to get the lines it hasn't rendered yet,
+    so it never has to render more than max_lines at once no matter how
+    many arrived in between.
+    """
+
+    def __init__(self, max_lines=5000):
+        self.max_lines = max_lines
+        self.lines = deque(maxlen=max_lines)
+        self.total = 0
+        self._unrendered = 0
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            self.lines.append(line)
+            self.total += 1
+            self._unrendered += 1
+
+    def extend(self, lines):
+        lines = list(lines)
+        with self._lock:
+            self.lines.extend(lines)
+            self.total += len(lines)
+            self._unrendered += len(lines)
+
+    @property
+    def unrendered(self):
+        return self._unrendered
+
+    def take_new(self):
+        # Returns the lines appended since the last call, capped to the ring
+        with self._lock:
+            count = min(self._unrendered, len(self.lines))
+            self._unrendered = 0
+            return list(islice(self.lines, len(self.lines) - count, None))
+
+    def snapshot(self):
+        with self._lock:
+            self._unrendered = 0
+            return list(self.lines)
+
+    def clear(self):
+        with self._lock:
+            self.lines.clear()
+            self.total = 0
+            self._unrendered = 0
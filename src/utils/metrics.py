@@ -0,0 +1,291 @@
+import csv
+import io
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency histograms and counters for the communication paths, exportable
+# as JSON, CSV or Prometheus text. Observing is a bisect over fixed bucket
+# bounds and two additions, with no lock: each series has a single writer
+# (one session or CommThread) and exporters only read, so a snapshot may at
+# worst be one observation behind.
+
+# Bucket upper bounds in seconds, 100us to 30s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = buckets
+        # One count per bucket plus the +Inf overflow
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Named series keyed by their labels.
+
+    counter()/histogram() return the same object for the same name and
+    labels, so callers look a series up once and keep it.
+    """
+
+    def __init__(self, prefix="lacs_"):
+        self.prefix = prefix
+        self.help = {}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    series = cls(name, dict(key[1]), **kwargs)
+                    self._series[key] = series
+                    self.help.setdefault(name, help_text)
+        return series
+
+    def counter(self, name, help_text="", **labels):
+        return self._get(Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS, **labels):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def series(self):
+        with self._lock:
+            return list(self._series.values())
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        # Flat rows: one per counter, one per histogram with its quantiles
+        rows = []
+        for series in self.series():
+            row = {"name": self.prefix + series.name, "type": series.kind}
+            row.update(series.labels)
+            if series.kind == "counter":
+                row["value"] = series.value
+            else:
+                row.update(count=series.count, sum=round(series.sum, 6),
+                           mean=round(series.sum / series.count, 6) if series.count else 0.0,
+                           p50=series.quantile(0.50), p95=series.quantile(0.95),
+                           p99=series.quantile(0.99))
+            rows.append(row)
+        return rows
+
+    def to_json(self):
+        return json.dumps({"timestamp": time.time(), "metrics": self.snapshot()})
+
+    def to_csv(self, header=True):
+        rows = self.snapshot()
+        columns = ["timestamp", "name", "type", "analyzer", "protocol", "stage", "direction",
+                   "value", "count", "sum", "mean", "p50", "p95", "p99"]
+        for row in rows:
+            columns.extend(key for key in row if key not in columns)
+        out = io.StringIO()
+        writer = csv.DictWriter(out, columns, lineterminator="\n")
+        if header:
+            writer.writeheader()
+        timestamp = round(time.time(), 3)
+        for row in rows:
+            writer.writerow(dict(row, timestamp=timestamp))
+        return out.getvalue()
+
+    def to_prometheus(self):
+        lines = []
+        described = set()
+        for series in sorted(self.series(), key=lambda s: s.name):
+            name = self.prefix + series.name
+            if name not in described:
+                described.add(name)
+                if self.help.get(series.name):
+                    lines.append(f"# HELP {name} {self.help[series.name]}")
+                lines.append(f"# TYPE {name} {series.kind}")
+            if series.kind == "counter":
+                lines.append(f"{name}{_labels(series.labels)} {series.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(series.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(series.labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(series.labels)} {series.sum}")
+            lines.append(f"{name}_count{_labels(series.labels)} {series.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+# Shared by every session and CommThread in the process
+registry = MetricsRegistry()
+
+
+class ExchangeMetrics:
+    # The series for one analyzer's link, looked up once so the hot paths
+    # only call observe()/inc()
+
+    def __init__(self, analyzer, protocol, metrics=None):
+        metrics = metrics or registry
+        labels = {"analyzer": analyzer or "", "protocol": protocol}
+
+        def latency(stage):
+            return metrics.histogram("exchange_seconds", "Latency of one protocol exchange",
+                                     stage=stage, **labels)
+
+        # enq_ack: ENQ to ACK, frame_ack: frame to ACK, message_ack: HL7
+        # message to ACK, session: ENQ to EOT, reply: inbound frame or
+        # message to our own reply
+        self.enq_ack = latency("enq_ack")
+        self.frame_ack = latency("frame_ack")
+        self.message_ack = latency("message_ack")
+        self.session = latency("session")
+        self.reply = latency("reply")
+
+        def counter(name, help_text, direction):
+            return metrics.counter(name, help_text, direction=direction, **labels)
+
+        self.frames_sent = counter("frames_total", "ASTM frames", "sent")
+        self.frames_received = counter("frames_total", "ASTM frames", "received")
+        self.messages_sent = counter("messages_total", "Complete messages", "sent")
+        self.messages_received = counter("messages_total", "Complete messages", "received")
+        self.naks_sent = counter("naks_total", "Negative acknowledgements", "sent")
+        self.naks_received = counter("naks_total", "Negative acknowledgements", "received")
+        self.retransmissions = counter("retransmissions_total", "Frames sent again", "sent")
+        self.timeouts = counter("timeouts_total", "Replies not received in time", "received")
+        self.bytes_sent = counter("bytes_total", "Bytes on the link", "sent")
+        self.bytes_received = counter("bytes_total", "Bytes on the link", "received")
+
+
+class MetricsExporter:
+    """Appends a snapshot of the registry to path every interval seconds.
+
+    The format follows the extension: .csv adds rows (header once), anything
+    else adds one JSON document per line.
+    """
+
+    def __init__(self, path, interval=10.0, metrics=None):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics or registry
+        self.csv = path.lower().endswith(".csv")
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        if self.csv:
+            header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            text = self.metrics.to_csv(header)
+        else:
+            text = self.metrics.to_json() + "\n"
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            f.write(text)
+
+
+class MetricsServer:
+    """Serves the registry at http://host:port/metrics in Prometheus text
+    format (and /metrics.json) from a background thread."""
+
+    def __init__(self, port=9464, host="127.0.0.1", metrics=None):
+        metrics = metrics or registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics":
+                    body = metrics.to_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path.split("?")[0] == "/metrics.json":
+                    body = metrics.to_json().encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,159 @@
+import json
+from src.utils.astm import ASTMFrame, ENQ, ACK, NAK, EOT
+from src.utils.hl7 import build_ack, msh_fields
+
+# Automatic replies for the communication tester, configured as a list of
+# rules (JSON in the tester's settings), e.g.
+#
+#   {"protocol": "ASTM", "event": "frame", "record": "Q", "reply": "NAK"}
+#   {"protocol": "ASTM", "event": "ENQ", "reply": "ACK", "delay_ms": 200}
+#   {"protocol": "HL7", "message_type": "QRY", "reply": "AE", "text": "Not supported"}
+#   {"protocol": "HL7", "control_id": "MSG0042", "reply": "NONE"}
+#
+# ASTM rules match an event (ENQ, EOT, frame or invalid, a frame with a bad
+# checksum), optionally narrowed to a record type, and reply ACK, NAK or
+# EOT. HL7 rules match MSH-9 (ORU^R01, or just ORU) and/or MSH-10 and
+# reply with an ACK whose MSA carries the code (AA, AE, AR, CA, CE, CR),
+# MSH-10 of the message and the optional text. NONE sends nothing.
+#
+# Rules are compiled into dicts keyed by what they match, so finding the
+# reply is a few dict lookups from the most specific key to the least,
+# however many rules there are. Of two rules with the same key the first
+# one wins.
+
+ASTM_EVENTS = ("ENQ", "EOT", "frame", "invalid")
+ASTM_REPLIES = {"ACK": ACK, "NAK": NAK, "EOT": EOT, "NONE": None}
+HL7_REPLIES = ("AA", "AE", "AR", "CA", "CE", "CR", "NONE")
+
+DEFAULT_RULES = [
+    {"protocol": "ASTM", "event": "ENQ", "reply": "ACK"},
+    {"protocol": "ASTM", "event": "frame", "reply": "ACK"},
+    {"protocol": "ASTM", "event": "invalid", "reply": "NAK"},
+    {"protocol": "HL7", "reply": "AA"},
+]
+
+
+class ResponderError(ValueError):
+    pass
+
+
+class Response:
+    def __init__(self, reply, delay=0.0, text=""):
+        self.reply = reply
+        self.delay = delay
+        self.text = text
+        # ASTM replies are a fixed control character
+        self.control = ASTM_REPLIES.get(reply)
+
+    @property
+    def negative(self):
+        return self.reply in ("NAK", "AE", "AR", "CE", "CR")
+
+    def hl7_ack(self, message):
+        return build_ack(message, self.reply, self.text)
+
+
+class Responder:
+    """Compiled reply rules for one connection.
+
+    astm(event) and hl7(message) return the Response to send, or None when
+    no rule matches or the rule says NONE. astm() must see every inbound
+    event in order: a frame continuing an ETB-split record is matched with
+    the type of the record it belongs to.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self._astm = {}
+        self._hl7 = {}
+        for number, rule in enumerate(self.rules, 1):
+            self._compile(number, rule)
+        self._record = None
+
+    def _compile(self, number, rule):
+        if not isinstance(rule, dict):
+            raise ResponderError(f"Rule {number}: expected an object, got {rule!r}")
+        protocol = str(rule.get("protocol", "")).upper()
+        reply = str(rule.get("reply", "")).upper()
+        try:
+            delay = float(rule.get("delay_ms", 0)) / 1000
+        except (TypeError, ValueError):
+            raise ResponderError(f"Rule {number}: delay_ms must be a number")
+        if delay < 0:
+            raise ResponderError(f"Rule {number}: delay_ms must not be negative")
+
+        if protocol == "ASTM":
+            event = rule.get("event", "frame")
+            if event not in ASTM_EVENTS:
+                raise ResponderError(f"Rule {number}: event must be one of {', '.join(ASTM_EVENTS)}")
+            if reply not in ASTM_REPLIES:
+                raise ResponderError(f"Rule {number}: ASTM reply must be one of {', '.join(ASTM_REPLIES)}")
+            record = rule.get("record") or None
+            if record is not None and (event not in ("frame", "invalid") or len(record) != 1):
+                raise ResponderError(f"Rule {number}: record is a single record type letter, "
+                                     f"for frame or invalid events")
+            key = (event, record.upper().encode("latin-1") if record else None)
+            self._astm.setdefault(key, Response(reply, delay))
+        elif protocol == "HL7":
+            if reply not in HL7_REPLIES:
+                raise ResponderError(f"Rule {number}: HL7 reply must be one of {', '.join(HL7_REPLIES)}")
+            key = (rule.get("control_id") or None, rule.get("message_type") or None)
+            self._hl7.setdefault(key, Response(reply, delay, str(rule.get("text", ""))))
+        else:
+            raise ResponderError(f"Rule {number}: protocol must be ASTM or HL7")
+
+    @classmethod
+    def from_json(cls, text):
+        try:
+            rules = json.loads(text)
+        except ValueError as e:
+            raise ResponderError(f"Rules are not valid JSON: {e}")
+        if not isinstance(rules, list):
+            raise ResponderError("Rules must be a JSON list")
+        return cls(rules)
+
+    def _found(self, response):
+        if response is None or response.reply == "NONE":
+            return None
+        return response
+
+    def astm(self, event):
+        table = self._astm
+        if isinstance(event, ASTMFrame):
+            record = self._record if self._record is not None else event.text[:1]
+            if event.valid:
+                # The next frame starts a new record unless this one was cut
+                self._record = None if event.final else record
+                kind = "frame"
+            else:
+                # A rejected frame will be sent again; the state stays put
+                kind = "invalid"
+            response = table.get((kind, record))
+            if response is None:
+                response = table.get((kind, None))
+            return self._found(response)
+        self._record = None
+        if event == ENQ:
+            return self._found(table.get(("ENQ", None)))
+        if event == EOT:
+            return self._found(table.get(("EOT", None)))
+        return None
+
+    def hl7(self, message):
+        table = self._hl7
+        if not table:
+            return None
+        fields = msh_fields(message)
+        message_type = fields[9].decode("latin-1") if len(fields) > 9 else ""
+        control_id = fields[10].decode("latin-1") if len(fields) > 10 else ""
+        # ORU^R01^ORU_R01 also matches rules for ORU^R01 and ORU
+        components = message_type.split("^")
+        trigger = "^".join(components[:2])
+        code = components[0]
+        for key in ((control_id, message_type), (control_id, trigger), (control_id, code),
+                    (control_id, None), (None, message_type), (None, trigger), (None, code),
+                    (None, None)):
+            response = table.get(key)
+            if response is not None:
+                return self._found(response)
+        return None
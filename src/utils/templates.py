@@ -0,0 +1,182 @@
+import re
+from datetime import datetime
+from string import Formatter
+from src.utils.flags import result_flag
+from src.utils.astm import ENQ, ACK, NAK, EOT, STX, ETX, ETB, CR, LF
+
+# Compiles the LIS tab's ASTM scripts, e.g.
+#
+#   Send: <ENQ>
+#   Read: <ACK>
+#   Send: <STX>P|1|{patient_id}|||{patient_name}<CR><ETX>
+#   Read: <ACK>
+#
+# into a TemplatePlan once, so each sample only costs a field substitution.
+# The plan yields the record texts; the exchange around them (ENQ, ACKs,
+# EOT) is run by AnalyzerSession, which numbers and checksums the frames
+# itself and splits records longer than a frame into ETB frames. Frame
+# numbers and checksums written in a template are therefore ignored, and
+# Send/Read lines of control characters are only checked. Frames that use
+# a test field are repeated for every result.
+
+CONTROLS = {"ENQ": ENQ, "ACK": ACK, "NAK": NAK, "EOT": EOT, "STX": STX,
+            "ETX": ETX, "ETB": ETB, "CR": CR, "LF": LF}
+
+SAMPLE_FIELDS = ("analyzer", "timestamp", "sample_id", "patient_id", "patient_name")
+TEST_FIELDS = ("index", "test_code", "result", "unit", "lower", "upper", "flag")
+
+STEP_PATTERN = re.compile(r"^\s*(send|read)\s*:?\s*(.*?)\s*$", re.IGNORECASE)
+TOKEN_PATTERN = re.compile(r"<\s*([A-Za-z]+)\s*>")
+FRAME_PATTERN = re.compile(r"^<STX>(\d?)(.*?)(<ETX>|<ETB>)([0-9A-Fa-f]{2})?(<CR><LF>)?$", re.DOTALL)
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def _normalize(text):
+    # "< EOT >" and "<eot>" both mean <EOT>; other <...> text is literal
+    def control(match):
+        name = match.group(1).upper()
+        return f"<{name}>" if name in CONTROLS else match.group(0)
+    return TOKEN_PATTERN.sub(control, text)
+
+
+def _controls(text, number):
+    names = TOKEN_PATTERN.findall(text)
+    if not names or TOKEN_PATTERN.sub("", text).strip():
+        raise TemplateError(f"Line {number}: expected control characters such as <ENQ>, got '{text}'")
+    return bytes(CONTROLS[name] for name in names)
+
+
+def _compile_record(text, number):
+    # Splits the record text into literal bytes and field names
+    parts = []
+    fields = set()
+    try:
+        parsed = list(Formatter().parse(text))
+    except ValueError as e:
+        raise TemplateError(f"Line {number}: {e}")
+    for literal, field, spec, conversion in parsed:
+        if literal:
+            literal = literal.replace("<CR>", "\r").replace("<LF>", "\n")
+            parts.append(literal.encode("latin-1"))
+        if field is not None:
+            if field not in SAMPLE_FIELDS and field not in TEST_FIELDS:
+                raise TemplateError(f"Line {number}: unknown field {{{field}}}; available fields are "
+                                    + ", ".join(SAMPLE_FIELDS + TEST_FIELDS))
+            parts.append(field)
+            fields.add(field)
+    return tuple(parts), fields
+
+
+def compile_template(content):
+    steps = []
+    record = None
+    for number, line in enumerate(content.splitlines(), 1):
+        if not line.strip():
+            continue
+        match = STEP_PATTERN.match(line)
+        if not match:
+            raise TemplateError(f"Line {number}: expected 'Send:' or 'Read:', got '{line.strip()}'")
+        direction, text = match.group(1).lower(), _normalize(match.group(2))
+
+        if direction == "read":
+            # A bare "Read:" waits for any reply
+            steps.append(("expect", _controls(text, number)[0] if text else None))
+            continue
+
+        frame = FRAME_PATTERN.match(text)
+        if not frame:
+            steps.append(("send", _controls(text, number)))
+            continue
+        body = frame.group(2)
+        # An ETB frame continues the record in the next frame
+        record = body if record is None else record + body
+        if frame.group(3) == "<ETB>":
+            continue
+        if not record.endswith("<CR>"):
+            raise TemplateError(f"Line {number}: a record must end with <CR> before <ETX>")
+        parts, fields = _compile_record(record[:-len("<CR>")], number)
+        steps.append(("record", parts, bool(fields & set(TEST_FIELDS))))
+        record = None
+
+    if record is not None:
+        raise TemplateError("Template ends inside a record continued with <ETB>")
+    return TemplatePlan(_group_tests(steps))
+
+
+def _group_tests(steps):
+    # Runs of per-test records, with the Read steps between and after them,
+    # become one ("repeat", steps) group
+    grouped = []
+    group = None
+    for step in steps:
+        if step[0] == "record" and step[2]:
+            if group is None:
+                group = []
+                grouped.append(("repeat", group))
+            group.append(step)
+        elif step[0] == "expect" and group is not None:
+            group.append(step)
+        else:
+            group = None
+            grouped.append(step)
+    return grouped
+
+
+def _render(parts, values):
+    return b"".join([part if part.__class__ is bytes else values[part] for part in parts])
+
+
+def _value(value):
+    return str(value if value is not None else "").encode("latin-1", errors="replace")
+
+
+class TemplatePlan:
+    def __init__(self, steps):
+        self.steps = steps
+
+    def _values(self, context, results):
+        # context maps sample fields to values; results are (test, value)
+        # pairs with test an (id, test_code, unit, lower_range, upper_range) row
+        sample = {field: _value(context.get(field)) for field in SAMPLE_FIELDS}
+        if not context.get("timestamp"):
+            sample["timestamp"] = datetime.now().strftime("%Y%m%d%H%M%S").encode()
+        tests = []
+        for index, (test, value) in enumerate(results, 1):
+            values = dict(sample)
+            values.update(index=_value(index), test_code=_value(test[1]), result=_value(value),
+                          unit=_value(test[2]), lower=_value(test[3]), upper=_value(test[4]),
+                          flag=_value(result_flag(value, test[3], test[4])))
+            tests.append(values)
+        return sample, tests
+
+    def records(self, context, results):
+        # Record texts for AnalyzerSession.send_astm
+        sample, tests = self._values(context, results)
+        records = []
+        for step in self.steps:
+            if step[0] == "repeat":
+                for values in tests:
+                    records.extend(_render(inner[1], values) for inner in step[1] if inner[0] == "record")
+            elif step[0] == "record":
+                records.append(_render(step[1], sample))
+        return records
+
+
+class TemplateCache:
+    # Compiled plans per (analyzer_id, template_type). A plan is recompiled
+    # only when the stored template text differs from the one it was built
+    # from, so reloading an unchanged analyzer costs a string comparison.
+    def __init__(self):
+        self._plans = {}
+
+    def get(self, analyzer_id, template_type, content):
+        key = (analyzer_id, template_type)
+        cached = self._plans.get(key)
+        if cached and cached[0] == content:
+            return cached[1]
+        plan = compile_template(content)
+        self._plans[key] = (content, plan)
+        return plan
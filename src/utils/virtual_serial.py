@@ -0,0 +1,107 @@
+import argparse
+import os
+import select
+import sys
+import threading
+import time
+
+# Linux/macOS stand-in for tools/com0com: two pseudo-terminals whose
+# masters are cross-connected by a relay thread, so whatever is written to
+# one port's device is read from the other's. Both ends are ordinary tty
+# devices that pyserial (and the tester tab) can open by name.
+
+
+class VirtualSerialPair:
+    """A connected pair of virtual serial ports, e.g. /dev/pts/3 <-> /dev/pts/4.
+
+    baudrate, if given, paces the relay to what a real line at that speed
+    (10 bits per character) would carry; otherwise bytes go through as fast
+    as the ptys allow. Use as a context manager or call open()/close().
+    """
+
+    def __init__(self, baudrate=None):
+        self.baudrate = baudrate
+        self.ports = None
+        self.bytes_relayed = 0
+        self._masters = []
+        self._slaves = []
+        self._wake = None
+        self._thread = None
+
+    def open(self):
+        if os.name != "posix":
+            raise OSError("Virtual serial pairs need pseudo-terminals; use com0com on Windows")
+        import pty
+        import tty
+        for _ in range(2):
+            master, slave = pty.openpty()
+            # Raw mode: no echo and no CR/LF translation, ASTM frames end in CR
+            tty.setraw(slave)
+            tty.setraw(master)
+            self._masters.append(master)
+            self._slaves.append(slave)
+        self.ports = tuple(os.ttyname(slave) for slave in self._slaves)
+        self._wake = os.pipe()
+        self._thread = threading.Thread(target=self._relay, name="virtual-serial", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread:
+            os.write(self._wake[1], b"x")
+            self._thread.join()
+            self._thread = None
+        for fd in self._masters + self._slaves + list(self._wake or ()):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._masters, self._slaves, self._wake = [], [], None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _relay(self):
+        a, b = self._masters
+        peer = {a: b, b: a}
+        # Seconds one byte takes on the simulated line
+        byte_time = 10.0 / self.baudrate if self.baudrate else 0.0
+        while True:
+            readable, _, _ = select.select([a, b, self._wake[0]], [], [])
+            if self._wake[0] in readable:
+                return
+            for fd in readable:
+                try:
+                    data = os.read(fd, 65536)
+                except OSError:
+                    # EIO while nobody has the port open
+                    continue
+                if byte_time:
+                    time.sleep(len(data) * byte_time)
+                view = memoryview(data)
+                while view:
+                    written = os.write(peer[fd], view)
+                    view = view[written:]
+                self.bytes_relayed += len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create a pair of connected virtual serial ports")
+    parser.add_argument("--baudrate", type=int, help="pace the link like a real line at this speed")
+    args = parser.parse_args(argv)
+
+    with VirtualSerialPair(args.baudrate) as pair:
+        print(f"{pair.ports[0]} <-> {pair.ports[1]}  (Ctrl+C to stop)", flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    print(f"Relayed {pair.bytes_relayed} bytes")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+import pytest
+from src.database.db_manger import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    # A fresh database with the default analyzers and tests
+    manager = DatabaseManager(str(tmp_path / "analyzersim.db"))
+    manager.create_database()
+    yield manager
+    manager.close()
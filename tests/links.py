@@ -0,0 +1,59 @@
+import asyncio
+from src.engine.link import Link
+
+
+class MemoryTransport(asyncio.Transport):
+    # Hands written bytes to the peer Link on the next loop iteration
+
+    def __init__(self, loop, link):
+        super().__init__()
+        self._loop = loop
+        self._link = link
+        self._closing = False
+        self.peer = None
+
+    def get_extra_info(self, name, default=None):
+        return "memory" if name == "peername" else default
+
+    def is_closing(self):
+        return self._closing
+
+    def write(self, data):
+        if not self.peer._closing:
+            self._loop.call_soon(self.peer._link.data_received, bytes(data))
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.call_soon(self._link.connection_lost, None)
+        self.peer.close()
+
+
+def link_pair(protocol):
+    # Two connected Links, analyzer side first; needs a running loop
+    loop = asyncio.get_running_loop()
+    links = Link(protocol), Link(protocol)
+    transports = [MemoryTransport(loop, link) for link in links]
+    transports[0].peer, transports[1].peer = transports[1], transports[0]
+    for link, transport in zip(links, transports):
+        link.connection_made(transport)
+    return links
+
+
+async def fake_lis(link, frames, replies=None):
+    # Answers an ASTM sender until it closes: ACK for ENQ and every frame,
+    # or whatever replies (event -> reply bytes) says. Frames received are
+    # appended to frames.
+    try:
+        while True:
+            event = await link.receive()
+            if isinstance(event, int):
+                reply = (replies or {}).get(event, b"\x06" if event == 0x05 else None)
+            else:
+                frames.append(event)
+                reply = (replies or {}).get("frame", b"\x06")
+            if reply:
+                link.write(reply)
+    except ConnectionError:
+        pass
@@ -0,0 +1,76 @@
+from src.utils.astm import (ASTMFrame, ASTMFrameParser, ENQ, ACK, EOT, checksum, encode_frame,
+                            encode_records, MAX_FRAME_TEXT)
+
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def test_frame_split_over_reads():
+    frame = encode_frame(1, b"H|\\^&\r")
+    events = feed_all(ASTMFrameParser(), [frame[:1], frame[1:7], frame[7:-1], frame[-1:]])
+    assert events == [ASTMFrame(1, b"H|\\^&\r", True, True)]
+
+
+def test_control_characters_between_frames():
+    data = bytes([ENQ]) + encode_frame(1, b"L|1|N\r") + bytes([EOT])
+    events = ASTMFrameParser().feed(data)
+    assert events == [ENQ, ASTMFrame(1, b"L|1|N\r", True, True), EOT]
+
+
+def test_etb_continued_record():
+    frames = encode_records([b"R|1|^^^GLU|" + b"5" * 300])
+    events = ASTMFrameParser().feed(b"".join(frames))
+    assert [(event.number, event.final) for event in events] == [(1, False), (2, True)]
+    assert b"".join(event.text for event in events) == b"R|1|^^^GLU|" + b"5" * 300 + b"\r"
+
+
+def test_bad_checksum_is_reported_invalid():
+    frame = bytearray(encode_frame(2, b"O|1|S1\r"))
+    frame[-4:-2] = b"00" if frame[-4:-2] != b"00" else b"01"
+    events = ASTMFrameParser().feed(bytes(frame))
+    assert len(events) == 1 and not events[0].valid and events[0].number == 2
+
+
+def test_empty_frame():
+    body = b"3\x03"
+    events = ASTMFrameParser().feed(b"\x02" + body + checksum(body) + b"\r\n")
+    assert events == [ASTMFrame(3, b"", True, True)]
+
+
+def test_cut_frame_resyncs_on_next_stx():
+    parser = ASTMFrameParser()
+    events = parser.feed(b"\x021H|trunc" + encode_frame(1, b"H|\\^&\r"))
+    assert events == [ASTMFrame(1, b"H|\\^&\r", True, True)]
+    assert parser.discarded == len(b"\x021H|trunc")
+
+
+def test_noise_is_discarded():
+    parser = ASTMFrameParser()
+    assert parser.feed(b"xyz" + bytes([ACK])) == [ACK]
+    assert parser.discarded == 3
+
+
+def test_encode_records_splits_at_240_characters():
+    record = b"R|1|^^^GLU|" + b"7" * 500
+    frames = encode_records([b"H|\\^&", record, b"L|1|N"])
+    events = ASTMFrameParser().feed(b"".join(frames))
+    assert all(event.valid for event in events)
+    assert [event.number for event in events] == [1, 2, 3, 4, 5]
+    assert [event.final for event in events] == [True, False, False, True, True]
+    assert [len(event.text) for event in events[1:4]] == [MAX_FRAME_TEXT, MAX_FRAME_TEXT, 32]
+    assert b"".join(event.text for event in events[1:4]) == record + b"\r"
+
+
+def test_encode_records_exact_frame_length_is_one_frame():
+    record = b"R" * (MAX_FRAME_TEXT - 1)
+    events = ASTMFrameParser().feed(b"".join(encode_records([record])))
+    assert len(events) == 1 and events[0].final and len(events[0].text) == MAX_FRAME_TEXT
+
+
+def test_encode_records_numbers_wrap_modulo_8():
+    frames = encode_records([b"R|%d" % i for i in range(10)], number=6)
+    assert [frame[1] - 0x30 for frame in frames] == [6, 7, 0, 1, 2, 3, 4, 5, 6, 7]
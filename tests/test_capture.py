@@ -0,0 +1,50 @@
+import os
+from src.utils.capture import (CaptureWriter, CaptureReader, CaptureRecord, RECEIVED, SENT,
+                               RECORD, index_path, replay)
+
+CHUNKS = [(SENT, b"\x05"), (RECEIVED, b"\x06"), (SENT, b"\x021H|\\^&\r\x03XX\r\n"), (RECEIVED, b"\x06")]
+
+
+def write_capture(path, index_every=2):
+    with CaptureWriter(path, index_every) as writer:
+        for number, (direction, data) in enumerate(CHUNKS):
+            writer.write(direction, data, connection=3, timestamp=1000.0 + number)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "traffic.cap")
+    write_capture(path)
+    with CaptureReader(path) as reader:
+        records = list(reader)
+        assert reader.summary()["records"] == 4
+        assert [record.timestamp for record in reader.records(start=1002.0)] == [1002.0, 1003.0]
+    assert records == [CaptureRecord(1000.0 + n, d, 3, data) for n, (d, data) in enumerate(CHUNKS)]
+
+
+def test_torn_tail_is_ignored_and_cut_on_append(tmp_path):
+    path = str(tmp_path / "traffic.cap")
+    write_capture(path)
+    complete = os.path.getsize(path)
+    # A crash in the middle of the next record: its header and half its body
+    with open(path, "ab") as f:
+        f.write(RECORD.pack(1004.0, SENT, 3, 10) + b"12345")
+    with CaptureReader(path) as reader:
+        assert len(list(reader)) == 4
+
+    with CaptureWriter(path, index_every=2) as writer:
+        assert writer.records == 4
+        assert os.path.getsize(path) == complete
+        writer.write(SENT, b"\x04", connection=3, timestamp=1005.0)
+    with CaptureReader(path) as reader:
+        records = list(reader)
+    assert len(records) == 5 and records[-1].data == b"\x04"
+    assert os.path.getsize(index_path(path)) > 0
+
+
+def test_replay_selects_one_direction(tmp_path):
+    path = str(tmp_path / "traffic.cap")
+    write_capture(path)
+    sent = []
+    with CaptureReader(path) as reader:
+        assert replay(reader, sent.append, speed=0, direction=SENT) == 14
+    assert sent == [data for direction, data in CHUNKS if direction == SENT]
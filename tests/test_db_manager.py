@@ -0,0 +1,55 @@
+import sqlite3
+import threading
+import pytest
+
+
+def test_thread_connections_close_when_threads_exit(db):
+    db.connection()
+    assert db.open_connections == 1
+
+    def work():
+        db.query("SELECT COUNT(*) FROM analyzers")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert db.open_connections == 1
+
+
+def test_close_closes_every_connection(db):
+    conn = db.connection()
+    db.close()
+    assert db.open_connections == 0
+    # A new connection is opened on next use
+    assert db.connection() is not conn
+
+
+def test_analyzer_setup_is_saved_in_one_transaction(db):
+    tests = db.get_analyzer_config(1)["tests"]
+    with pytest.raises(sqlite3.Error):
+        db.save_analyzer_setup(1, {"sample_info": "Q|1|^{sample_number}"}, [("GLU", "mmol/l", 3.9)])
+    config = db.get_analyzer_config(1)
+    assert "sample_info" not in config["templates"]
+    assert config["tests"] == tests
+
+    db.save_analyzer_setup(1, {"sample_info": "Q|1|^{sample_number}"}, [("GLU", "mmol/l", 3.9, 6.1)])
+    config = db.get_analyzer_config(1)
+    assert config["templates"]["sample_info"] == "Q|1|^{sample_number}"
+    assert [test[1:] for test in config["tests"]] == [("GLU", "mmol/l", 3.9, 6.1)]
+
+
+def test_store_samples_updates_existing_samples_in_place(db):
+    db.store_samples([("S1", "P1", "Doe^John"), ("S2", "P2", "Roe^Jane")])
+    ids = dict(db.query("SELECT sample_number, id FROM samples"))
+    test = db.get_analyzer_config(1)["tests"][0]
+    db.store_results(["S1"], [test], [[5.0]])
+
+    # A repeated sample number, also twice in one batch, keeps its row
+    db.store_samples([("S1", "P9", "Doe^Jim"), ("S3", "P3", ""), ("S3", "P4", "Poe^Ed")])
+    rows = db.query("SELECT sample_number, id, patient_id, patient_name FROM samples ORDER BY id")
+    assert rows[:2] == [("S1", ids["S1"], "P9", "Doe^Jim"), ("S2", ids["S2"], "P2", "Roe^Jane")]
+    assert [row[0] for row in rows] == ["S1", "S2", "S3"] and rows[2][2:] == ("P4", "Poe^Ed")
+    # Results still belong to the sample
+    assert db.get_sample_orders(["S1"]) == {"S1": ("P9", "Doe^Jim", [test[1]])}
@@ -0,0 +1,87 @@
+import asyncio
+from src.engine.engine import SimulationEngine
+from src.engine.session import AnalyzerSession
+from src.engine.workload import Workload
+from tests.links import link_pair, fake_lis
+
+SAMPLES = [("S1", "P1", "Ann"), ("S2", "P2", "Bob")]
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_run_analysis_stores_samples_and_results(db):
+    events = []
+
+    async def main():
+        engine = SimulationEngine(db, listener=lambda event, data: events.append((event, data)), seed=1)
+        await engine.set_analyzer(1)
+        await engine.run_analysis(SAMPLES, speed=0)
+        await engine.shutdown()
+
+    run(main())
+    assert db.query("SELECT sample_number FROM samples ORDER BY id") == [("S1",), ("S2",)]
+    assert db.query_one("SELECT COUNT(*) FROM results")[0] == 6
+    assert [data for event, data in events if event == "progress"] == [(1, 2, "S1"), (2, 2, "S2")]
+    assert events[-1] == ("analysis_finished", 2)
+
+
+def test_send_results_in_one_transfer(db):
+    db.save_connection_settings(1, {"connection_type": "TCP/IP", "socket_type": "Client",
+                                    "lis_address": "localhost", "lis_port": "0", "protocol": "ASTM"})
+
+    async def main():
+        engine = SimulationEngine(db, seed=1)
+        await engine.set_analyzer(1)
+        await engine.run_analysis(SAMPLES, speed=0)
+        analyzer, lis = link_pair("ASTM")
+        engine.session = AnalyzerSession(analyzer, "ASTM")
+        frames = []
+        task = asyncio.create_task(fake_lis(lis, frames))
+        ids = [row[0] for row in db.query("SELECT id FROM results")]
+        sent = await engine.send_results(ids)
+        await engine.shutdown()
+        await task
+        return sent, frames
+
+    sent, frames = run(main())
+    assert sent == 6
+    kinds = [frame.text[:1] for frame in frames]
+    assert kinds[0] == b"H" and kinds[-1] == b"L"
+    assert kinds.count(b"H") == 1 and kinds.count(b"P") == 2 and kinds.count(b"R") == 6
+    assert db.query_one("SELECT COUNT(*) FROM results WHERE sent = 1")[0] == 6
+
+
+def test_results_are_stored_as_each_sample_finishes(db):
+    stored = []
+
+    def listener(event, data):
+        if event == "progress":
+            stored.append(db.query_one("SELECT COUNT(*) FROM results")[0])
+
+    async def main():
+        engine = SimulationEngine(db, listener=listener, seed=1)
+        await engine.set_analyzer(1)
+        await engine.run_analysis(SAMPLES, speed=0, batch=1)
+        await engine.shutdown()
+
+    run(main())
+    assert stored == [3, 6]
+
+
+def test_analyzer_without_tests_is_paced_per_sample(db):
+    db.save_tests(1, [])
+    workload = Workload(default_turnaround=2.0)
+    events = []
+
+    async def main():
+        engine = SimulationEngine(db, listener=lambda event, data: events.append(event), seed=1)
+        await engine.set_analyzer(1)
+        await engine.run_analysis(SAMPLES, workload=workload, speed=0)
+        await engine.shutdown()
+
+    run(main())
+    assert workload.stats.last == 4.0
+    assert "results_ready" not in events and events[-1] == "analysis_finished"
+    assert db.query_one("SELECT COUNT(*) FROM results")[0] == 0
@@ -0,0 +1,59 @@
+import threading
+from src.utils.event_batcher import EventBatcher
+
+
+def test_flushes_when_a_batch_is_full():
+    batches = []
+    batcher = EventBatcher(batches.append, interval=60, max_batch=3)
+    batcher.start()
+    try:
+        for n in range(7):
+            batcher.add(n)
+        assert batches == [[0, 1, 2], [3, 4, 5]]
+    finally:
+        batcher.stop()
+    # stop() delivers what is left
+    assert batches[-1] == [6]
+    assert (batcher.events, batcher.batches, batcher.merged) == (7, 3, 4)
+
+
+def test_flushes_on_the_interval():
+    delivered = threading.Event()
+    batches = []
+
+    def emit(events):
+        batches.append(events)
+        delivered.set()
+
+    batcher = EventBatcher(emit, interval=0.02, max_batch=1000)
+    batcher.start()
+    try:
+        batcher.add("a")
+        batcher.add("b")
+        assert delivered.wait(2)
+        assert batches == [["a", "b"]]
+    finally:
+        batcher.stop()
+
+
+def test_without_a_flush_thread_events_go_straight_through():
+    batches = []
+    batcher = EventBatcher(batches.append)
+    batcher.add("a")
+    batcher.add("b")
+    assert batches == [["a"], ["b"]]
+
+
+def test_verbose_events_are_summarized():
+    batches = []
+    batcher = EventBatcher(batches.append, interval=60, verbose_limit=2,
+                           summarize=lambda count: f"{count} more")
+    batcher.start()
+    try:
+        batcher.add("status")
+        for n in range(5):
+            batcher.add(f"echo {n}", verbose=True)
+    finally:
+        batcher.stop()
+    assert batches == [["status", "echo 0", "echo 1", "3 more"]]
+    assert batcher.dropped == 3
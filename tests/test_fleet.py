@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from src.engine.fleet import DEFAULT_TESTS, Fleet, load_fleet, merge_stats, run_sharded, split_shards
+from src.engine.lis_server import LISServer
+from src.utils.metrics import registry
+
+
+def save_settings(db, port, analyzers=((1, "ASTM"), (2, "HL7"))):
+    for analyzer_id, protocol in analyzers:
+        db.save_connection_settings(analyzer_id, {
+            "connection_type": "TCP/IP", "socket_type": "Client", "lis_address": "127.0.0.1",
+            "lis_port": str(port), "protocol": protocol, "result_sending_delay": "50",
+        })
+
+
+def messages_sent(config):
+    return registry.counter("messages_total", analyzer=config["name"], direction="sent",
+                            protocol=config["settings"]["protocol"]).value
+
+
+def test_fleet_against_lis_server(db):
+    async def main():
+        async with LISServer(port=0) as server:
+            save_settings(db, server.port)
+            configs = load_fleet(db, [1, 2], replicas=2)
+            before = [messages_sent(config) for config in configs]
+            stats = await Fleet(configs, seed=1).run(duration=1.0, report_interval=10)
+            return configs, before, stats, server.stats
+
+    configs, before, stats, server_stats = asyncio.run(asyncio.wait_for(main(), 20))
+    assert len({config["name"] for config in configs}) == 4
+    # Every analyzer sent on its own schedule, in its own protocol
+    sent = [messages_sent(config) - count for config, count in zip(configs, before)]
+    assert all(count > 0 for count in sent)
+    assert stats["sessions"] == 4 and stats["connected"] == 0 and stats["errors"] == 0
+    assert stats["messages"] == sum(sent)
+    assert stats["results"] == sum(count * len(config["tests"] or DEFAULT_TESTS) for config, count in zip(configs, sent))
+    assert server_stats.messages > 0
+
+
+def test_shards_split_analyzers_round_robin():
+    configs = [{"name": f"A{n}"} for n in range(5)]
+    assert [[config["name"] for config in shard] for shard in split_shards(configs, 2)] == [
+        ["A0", "A2", "A4"], ["A1", "A3"]]
+    # More workers than analyzers: no empty shards
+    assert len(split_shards(configs[:3], 8)) == 3
+
+
+def test_merge_stats():
+    merged = merge_stats([
+        {"elapsed": 2.0, "sessions": 2, "connected": 1, "messages": 10, "results": 30, "queries": 0,
+         "errors": 1, "messages_per_sec": 5.04, "average_per_sec": 5.0},
+        {"elapsed": 2.5, "sessions": 3, "connected": 3, "messages": 20, "results": 60, "queries": 4,
+         "errors": 0, "messages_per_sec": 8.03, "average_per_sec": 8.0},
+    ])
+    assert merged == {"elapsed": 2.5, "sessions": 5, "connected": 4, "messages": 30, "results": 90,
+                      "queries": 4, "errors": 1, "messages_per_sec": 13.1, "average_per_sec": 13.0}
+
+
+def test_sharded_run(db):
+    # The LIS runs on a loop of its own thread, the shards in worker processes
+    server = LISServer(port=0)
+    ready = threading.Event()
+    running = {}
+
+    def serve():
+        async def main():
+            running["loop"] = asyncio.get_running_loop()
+            running["stop"] = asyncio.Event()
+            async with server:
+                ready.set()
+                await running["stop"].wait()
+
+        asyncio.run(main())
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        assert ready.wait(10)
+        save_settings(db, server.port, ((1, "ASTM"), (2, "ASTM")))
+        stats = run_sharded(load_fleet(db, [1, 2], replicas=2), 2, seed=1, duration=1.0)
+    finally:
+        if "stop" in running:
+            running["loop"].call_soon_threadsafe(running["stop"].set)
+        thread.join(10)
+    assert stats["sessions"] == 4
+    assert stats["messages"] > 0 and stats["errors"] == 0
+    assert server.stats.messages > 0
@@ -0,0 +1,56 @@
+from src.utils.hl7 import MLLPFramer, wrap
+
+ORU = b"MSH|^~\\&|SIM||LIS||20250101||ORU^R01|CTL1|P|2.5\rPID|1||P1\r"
+ORM = b"MSH|^~\\&|LIS||SIM||20250101||ORM^O01|CTL2|P|2.5\rORC|NW|S1\r"
+
+
+def framer():
+    messages = []
+    return MLLPFramer(messages.append), messages
+
+
+def test_several_messages_in_one_read():
+    mllp, messages = framer()
+    assert mllp.feed(wrap(ORU) + wrap(ORM)) == 2
+    assert messages == [ORU, ORM]
+
+
+def test_message_split_over_reads():
+    mllp, messages = framer()
+    data = wrap(ORU)
+    for i in range(len(data)):
+        mllp.feed(data[i:i + 1])
+    assert messages == [ORU]
+
+
+def test_end_block_split_between_fs_and_cr():
+    mllp, messages = framer()
+    data = wrap(ORU)
+    mllp.feed(data[:-1])
+    assert messages == []
+    mllp.feed(data[-1:])
+    assert messages == [ORU]
+
+
+def test_noise_and_cut_messages_are_discarded():
+    mllp, messages = framer()
+    mllp.feed(b"noise\x0bMSH|cut" + wrap(ORM))
+    assert messages == [ORM]
+    assert mllp.discarded == len(b"noise\x0bMSH|cut")
+
+
+def test_oversized_message_is_dropped():
+    messages = []
+    mllp = MLLPFramer(messages.append, max_message=64)
+    mllp.feed(b"\x0b" + b"x" * 100)
+    mllp.feed(wrap(ORM))
+    assert messages == [ORM]
+
+
+def test_buffer_interface():
+    mllp, messages = framer()
+    data = wrap(ORU)
+    buffer = mllp.get_buffer(len(data))
+    buffer[:len(data)] = data
+    mllp.buffer_updated(len(data))
+    assert messages == [ORU]
@@ -0,0 +1,114 @@
+import asyncio
+from src.engine.lis_server import LISServer
+from src.utils.astm import ASTMFrame, ASTMFrameParser, ENQ, ACK, NAK, EOT, encode_records
+
+QUERY = [b"H|\\^&", b"Q|1|^S1^^||^^^ALL^||||||O", b"L|1|N"]
+ORDERS = {"S1": ("P1", "Ann", ["GLU", "UREA"])}
+
+
+class Analyzer:
+    # Raw ASTM peer of the LIS stand-in
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.parser = ASTMFrameParser()
+        self.events = []
+
+    async def next(self):
+        while not self.events:
+            data = await asyncio.wait_for(self.reader.read(65536), 5)
+            assert data, "LIS closed the connection"
+            self.events.extend(self.parser.feed(data))
+        return self.events.pop(0)
+
+    async def send(self, records):
+        self.write(ENQ)
+        assert await self.next() == ACK
+        for frame in encode_records(records):
+            self.writer.write(frame)
+            assert await self.next() == ACK
+        self.write(EOT)
+
+    def write(self, code):
+        self.writer.write(bytes([code]))
+
+
+def converse(script, **options):
+    async def main():
+        async with LISServer(port=0, answer=lambda ids: ORDERS, **options) as server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            result = await script(Analyzer(reader, writer))
+            writer.close()
+            return result, server.stats
+
+    return asyncio.run(asyncio.wait_for(main(), 20))
+
+
+def test_query_is_answered():
+    async def script(analyzer):
+        await analyzer.send(QUERY)
+        assert await analyzer.next() == ENQ
+        analyzer.write(ACK)
+        records = []
+        while True:
+            event = await analyzer.next()
+            if event == EOT:
+                return records
+            records.append(event.text.rstrip(b"\r"))
+            analyzer.write(ACK)
+
+    records, stats = converse(script)
+    assert records[1:3] == [b"P|1|P1|||Ann", b"O|1|S1||^^^GLU\\^^^UREA|R"]
+    assert stats.queries == 1 and stats.dropped == 0
+
+
+def test_receiver_interrupt_ends_the_answer():
+    async def script(analyzer):
+        await analyzer.send(QUERY)
+        assert await analyzer.next() == ENQ
+        analyzer.write(ACK)
+        assert isinstance(await analyzer.next(), ASTMFrame)
+        analyzer.write(EOT)
+        return await analyzer.next()
+
+    last, stats = converse(script)
+    assert last == EOT
+    assert stats.dropped == 1
+
+
+def test_answer_given_up_after_repeated_naks():
+    async def script(analyzer):
+        await analyzer.send(QUERY)
+        assert await analyzer.next() == ENQ
+        analyzer.write(ACK)
+        frames = 0
+        while True:
+            event = await analyzer.next()
+            if event == EOT:
+                return frames
+            frames += 1
+            analyzer.write(NAK)
+
+    frames, stats = converse(script)
+    assert frames == 6
+    assert stats.dropped == 1
+
+
+def test_answer_retried_after_contention():
+    async def script(analyzer):
+        await analyzer.send(QUERY)
+        assert await analyzer.next() == ENQ
+        # Our ENQ crosses the LIS's; the analyzer has priority
+        await analyzer.send([b"H|\\^&", b"L|1|N"])
+        assert await analyzer.next() == ENQ
+        analyzer.write(ACK)
+        frames = 0
+        while await analyzer.next() != EOT:
+            frames += 1
+            analyzer.write(ACK)
+        return frames
+
+    frames, stats = converse(script)
+    assert frames == 4
+    assert stats.messages == 2 and stats.dropped == 0
@@ -0,0 +1,40 @@
+import threading
+from src.utils.log_buffer import LogBuffer
+
+
+def test_ring_keeps_the_newest_lines():
+    buffer = LogBuffer(max_lines=3)
+    buffer.extend(f"line {n}" for n in range(5))
+    buffer.append("line 5")
+    assert buffer.snapshot() == ["line 3", "line 4", "line 5"]
+    assert buffer.total == 6
+
+
+def test_take_new_is_capped_at_the_ring():
+    buffer = LogBuffer(max_lines=3)
+    buffer.extend(["a", "b"])
+    assert buffer.take_new() == ["a", "b"]
+    assert buffer.take_new() == []
+    buffer.extend(["c", "d", "e", "f"])
+    assert buffer.unrendered == 4
+    # Only what the ring still holds is rendered
+    assert buffer.take_new() == ["d", "e", "f"]
+    assert buffer.unrendered == 0
+
+
+def test_clear_resets_the_counts():
+    buffer = LogBuffer(max_lines=3)
+    buffer.extend(["a", "b"])
+    buffer.clear()
+    assert (buffer.total, buffer.unrendered, buffer.snapshot()) == (0, 0, [])
+
+
+def test_appends_from_several_threads():
+    buffer = LogBuffer(max_lines=100)
+    threads = [threading.Thread(target=lambda: [buffer.append("x") for _ in range(1000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert buffer.total == 4000
+    assert len(buffer.take_new()) == 100
@@ -0,0 +1,82 @@
+import threading
+import zlib
+import pytest
+from src.database.message_log import MessageLog, astm_ids, hl7_ids
+
+ASTM = [b"H|\\^&|CTL9|", b"P|1", b"O|1|S1^1^1||^^^GLU", b"R|1|^^^GLU|5.5", b"L|1|N"]
+QUERY = [b"H|\\^&", b"Q|1|^S2\\^S3||^^^ALL", b"L|1|N"]
+ORU = b"MSH|^~\\&|SIM||LIS||20250101||ORU^R01|CTL1|P|2.5\rPID|1||P1\rOBR|1|S4||^GLU\rOBX|1|NM|GLU||5.5\r"
+QRY = b"MSH|^~\\&|SIM||LIS||20250101||QRY^Q02|CTL2|P|2.5\rQRD|20250101|R|I|Q1|||1^RD|S5~S6|OTH\r"
+
+
+def row(text, samples=(), logged_at="2025-01-01 00:00:00.000"):
+    body = text.encode()
+    return (logged_at, "A1", "received", "ASTM", "", 0, body, text, set(samples))
+
+
+def test_ids():
+    assert astm_ids(ASTM) == (b"CTL9", [b"S1"])
+    assert astm_ids(QUERY) == (b"", [b"S2", b"S3"])
+    assert hl7_ids(ORU) == (b"CTL1", [b"S4"])
+    assert hl7_ids(QRY) == (b"CTL2", [b"S5", b"S6"])
+
+
+def test_messages_are_found_by_sample(db):
+    log = MessageLog(db, compress=True)
+    log.start()
+    log.log("received", "ASTM", ASTM, "A1")
+    log.log("sent", "ASTM", b"\r".join(QUERY), "A1")
+    log.log("sent", "HL7", ORU, "A2")
+    log.log("received", "HL7", QRY, "A2")
+    log.stop()
+    assert (log.logged, log.dropped) == (4, 0)
+
+    def found(**filters):
+        return [message[6] for message in db.get_messages(**filters)]
+
+    assert found(sample_number="S1") == [b"\r".join(ASTM).decode()]
+    assert found(sample_number="S3") == [b"\r".join(QUERY).decode()]
+    assert found(sample_number="S4") == [ORU.decode()]
+    assert found(sample_number="S6") == [QRY.decode()]
+    assert found(control_id="CTL1", analyzer="A2") == [ORU.decode()]
+    assert found(analyzer="A1", sample_number="S4") == []
+    # Newest first
+    assert [message[5] for message in db.get_messages(analyzer="A2")] == ["CTL2", "CTL1"]
+
+
+def test_search_uses_fts_when_available(db):
+    if not db.has_message_search():
+        pytest.skip("SQLite without FTS5")
+    db.store_messages([row("R|1|^^^GLU|5.5"), row("R|1|^^^CREA|80")])
+    assert [message[6] for message in db.get_messages(search="GLU")] == ["R|1|^^^GLU|5.5"]
+    # A phrase, so query syntax in the text is matched literally
+    assert db.get_messages(search='GLU" OR "CREA') == []
+
+
+def test_search_falls_back_to_like(db):
+    db._message_search = False
+    db.store_messages([row("R|1|^^^GLU|5.5"), row("R|1|^^^CREA|80")])
+    assert [message[6] for message in db.get_messages(search="GLU")] == ["R|1|^^^GLU|5.5"]
+    # Compressed bodies can't be matched without FTS5
+    db.execute("UPDATE message_log SET compressed = 1, body = ? WHERE id = 2",
+               (zlib.compress(b"R|1|^^^CREA|80"),))
+    assert db.get_messages(search="CREA") == []
+
+
+def test_concurrent_writers_get_distinct_ids(db):
+    def write(writer):
+        for batch in range(10):
+            db.store_messages([row(f"{writer}-{batch}-{n}", {f"S{writer}"}) for n in range(5)])
+
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ids = [row[0] for row in db.query("SELECT id FROM message_log ORDER BY id")]
+    assert ids == list(range(1, 201))
+    # Every sample row points at one of its writer's messages
+    assert db.query("""
+        SELECT COUNT(*) FROM message_samples ms JOIN message_log m ON m.id = ms.message_id
+        WHERE CAST(m.body AS TEXT) LIKE substr(ms.sample_number, 2) || '-%'
+    """) == [(200,)]
@@ -0,0 +1,45 @@
+from src.engine.fleet import FleetMember, FleetStats
+from src.engine.messages import astm_result_records, merge_astm_messages, astm_orders
+
+TESTS = [(1, "GLU", "mmol/l", 3.9, 6.1), (2, "UREA", "mmol/l", 2.5, 7.8)]
+
+
+def sequence_numbers(records):
+    return [record.split(b"|")[0] + b"|" + record.split(b"|")[1] for record in records]
+
+
+def test_merged_messages_are_numbered_per_level():
+    messages = [astm_result_records("SIM", (f"S{n}", f"P{n}", "Name"), list(zip(TESTS, [5.0, 4.0])),
+                                    "20250101120000") for n in (1, 2, 3)]
+    records = merge_astm_messages(messages)
+    assert sequence_numbers(records) == [
+        b"H|\\^&",
+        b"P|1", b"O|1", b"R|1", b"R|2",
+        b"P|2", b"O|1", b"R|1", b"R|2",
+        b"P|3", b"O|1", b"R|1", b"R|2",
+        b"L|1",
+    ]
+    assert astm_orders(records) == {f"S{n}": (f"P{n}", "Name", ["GLU", "UREA"]) for n in (1, 2, 3)}
+
+
+def test_merged_queries_count_across_samples():
+    messages = [[b"H|\\^&", b"Q|1|^%s^^||^^^ALL^||||||O" % number, b"L|1|N"] for number in (b"A", b"B")]
+    assert sequence_numbers(merge_astm_messages(messages)) == [b"H|\\^&", b"Q|1", b"Q|2", b"L|1"]
+
+
+def test_template_numbering_is_corrected():
+    # A template with a fixed R|1 for every test
+    message = [b"H|\\^&", b"P|1", b"O|1|S1", b"R|1|^^^GLU", b"O|2|S1", b"R|1|^^^UREA", b"R|1|^^^X", b"L|1|N"]
+    assert sequence_numbers(merge_astm_messages([message, message])) == [
+        b"H|\\^&", b"P|1", b"O|1", b"R|1", b"O|2", b"R|1", b"R|2",
+        b"P|2", b"O|1", b"R|1", b"O|2", b"R|1", b"R|2", b"L|1",
+    ]
+
+
+def test_fleet_member_uses_the_analyzers_protocol():
+    def member(protocol):
+        config = {"name": "A", "tests": TESTS, "settings": {"protocol": protocol}}
+        return FleetMember(config, "ASTM", FleetStats(), 1.0)
+
+    assert member("HL7").protocol == "HL7"
+    assert member(None).protocol == "ASTM"
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import urllib.request
+from src.utils.metrics import Histogram, MetricsRegistry, MetricsServer, ExchangeMetrics, MetricsExporter
+
+
+def test_histogram_buckets_and_counts():
+    histogram = Histogram("exchange_seconds", {}, buckets=(0.001, 0.01, 0.1))
+    for value in (0.0005, 0.001, 0.002, 0.05, 0.05, 3.0):
+        histogram.observe(value)
+    # A value on a bound falls in that bucket; the last count is +Inf
+    assert histogram.counts == [2, 1, 2, 1]
+    assert histogram.count == 6
+    assert histogram.sum == 0.0005 + 0.001 + 0.002 + 0.05 + 0.05 + 3.0
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.8) == 0.1
+    assert histogram.quantile(1.0) == float("inf")
+    assert Histogram("empty", {}).quantile(0.5) == 0.0
+
+
+def test_series_are_shared_by_name_and_labels():
+    metrics = MetricsRegistry()
+    first = ExchangeMetrics("A1", "ASTM", metrics)
+    again = ExchangeMetrics("A1", "ASTM", metrics)
+    assert first.frame_ack is again.frame_ack
+    assert first.frames_sent is not first.frames_received
+    assert first.frame_ack is not ExchangeMetrics("A2", "ASTM", metrics).frame_ack
+
+
+def test_prometheus_text():
+    metrics = MetricsRegistry()
+    exchange = ExchangeMetrics('A"1', "ASTM", metrics)
+    exchange.frames_sent.inc(3)
+    exchange.frame_ack.observe(0.003)
+    exchange.frame_ack.observe(20.0)
+    lines = metrics.to_prometheus().splitlines()
+    assert "# TYPE lacs_frames_total counter" in lines
+    assert 'lacs_frames_total{analyzer="A\\"1",direction="sent",protocol="ASTM"} 3' in lines
+    prefix = 'lacs_exchange_seconds_bucket{analyzer="A\\"1",protocol="ASTM",stage="frame_ack",'
+    assert prefix + 'le="0.0025"} 0' in lines
+    assert prefix + 'le="0.005"} 1' in lines
+    assert prefix + 'le="10.0"} 1' in lines
+    assert prefix + 'le="30.0"} 2' in lines
+    assert prefix + 'le="+Inf"} 2' in lines
+    assert 'lacs_exchange_seconds_count{analyzer="A\\"1",protocol="ASTM",stage="frame_ack"} 2' in lines
+    # HELP and TYPE once per metric, not per series
+    assert sum(line == "# TYPE lacs_exchange_seconds histogram" for line in lines) == 1
+
+
+def test_snapshot_json_and_csv():
+    metrics = MetricsRegistry()
+    ExchangeMetrics("A1", "HL7", metrics).message_ack.observe(0.02)
+    rows = {(row["name"], row.get("stage"), row.get("direction")): row
+            for row in json.loads(metrics.to_json())["metrics"]}
+    row = rows[("lacs_exchange_seconds", "message_ack", None)]
+    assert (row["count"], row["p50"], row["p99"]) == (1, 0.025, 0.025)
+    assert rows[("lacs_messages_total", None, "sent")]["value"] == 0
+    records = list(csv.DictReader(io.StringIO(metrics.to_csv())))
+    assert len(records) == len(rows)
+    assert {record["analyzer"] for record in records} == {"A1"}
+
+
+def test_exporter_appends_snapshots(tmp_path):
+    metrics = MetricsRegistry()
+    metrics.counter("frames_total", direction="sent").inc()
+    path = str(tmp_path / "metrics.csv")
+    exporter = MetricsExporter(path, metrics=metrics)
+    exporter.write()
+    exporter.write()
+    lines = open(path).read().splitlines()
+    assert lines[0].startswith("timestamp,name") and len(lines) == 3
+
+
+def test_metrics_endpoint():
+    metrics = MetricsRegistry()
+    ExchangeMetrics("A1", "ASTM", metrics).enq_ack.observe(0.0002)
+    server = MetricsServer(port=0, metrics=metrics)
+    server.start()
+    try:
+        url = f"http://127.0.0.1:{server.port}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            text = response.read().decode()
+        assert text == metrics.to_prometheus()
+        assert 'stage="enq_ack",le="0.00025"} 1' in text
+        with urllib.request.urlopen(url + "/metrics.json") as response:
+            assert json.loads(response.read())["metrics"]
+    finally:
+        server.stop()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import sqlite3
+from src.database.migrations import MIGRATIONS, migrate
+
+BASELINE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "analyzersim.db")
+
+
+def baseline(tmp_path):
+    # A copy of the database shipped before migrations, with the duplicates
+    # older versions could leave behind
+    path = str(tmp_path / "baseline.db")
+    shutil.copy(BASELINE_DB, path)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO samples (id, sample_number, patient_id) VALUES (?, ?, ?)",
+                     [(1, "S1", "P1"), (2, "S1", "P1"), (3, "S2", "P2")])
+    conn.executemany("INSERT INTO results (id, sample_id, test_id, result_value) VALUES (?, ?, ?, ?)",
+                     [(1, 1, 1, 1.0), (2, 2, 2, 2.0), (3, 2, 1, 3.0), (4, 3, 1, 4.0)])
+    conn.executemany("INSERT INTO connection_settings (analyzer_id, lis_port) VALUES (?, ?)",
+                     [(1, "5000"), (1, "6000")])
+    conn.executemany("INSERT INTO astm_templates (analyzer_id, template_type, template_content) "
+                     "VALUES (?, ?, ?)", [(1, "result_send", "old"), (1, "result_send", "new")])
+    conn.commit()
+    return conn
+
+
+def test_baseline_database_is_at_version_0():
+    conn = sqlite3.connect(f"file:{BASELINE_DB}?mode=ro", uri=True)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    conn.close()
+
+
+def test_upgrade_baseline_to_latest(tmp_path):
+    conn = baseline(tmp_path)
+    assert migrate(conn) == 0
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+
+    # Duplicate samples merged onto the first row, newest result per test kept
+    assert conn.execute("SELECT id, sample_number FROM samples ORDER BY id").fetchall() == [(1, "S1"), (3, "S2")]
+    assert conn.execute("SELECT sample_id, test_id, result_value FROM results ORDER BY sample_id, test_id"
+                        ).fetchall() == [(1, 1, 3.0), (1, 2, 2.0), (3, 1, 4.0)]
+    assert conn.execute("SELECT lis_port, protocol FROM connection_settings").fetchall() == [("6000", "ASTM")]
+    assert conn.execute("SELECT template_content FROM astm_templates").fetchall() == [("new",)]
+
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_samples_sample_number", "idx_results_sample_test", "idx_tests_analyzer",
+            "idx_connection_settings_analyzer", "idx_message_log_analyzer"} <= indexes
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"message_log", "message_samples"} <= tables
+    # Existing data is untouched
+    assert conn.execute("SELECT COUNT(*) FROM analyzers").fetchone()[0] == 2
+    conn.close()
+
+
+def test_migrate_is_idempotent(tmp_path):
+    conn = baseline(tmp_path)
+    migrate(conn)
+    assert migrate(conn) == len(MIGRATIONS)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    conn.close()
+
+
+def test_new_database(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "new.db"))
+    assert migrate(conn) == 0
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    conn.close()
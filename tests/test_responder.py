@@ -0,0 +1,107 @@
+import pytest
+from src.utils.astm import ASTMFrame, ENQ, ACK, NAK, EOT
+from src.utils.responder import Responder, ResponderError
+
+ORU = b"MSH|^~\\&|SIM||LIS||20250101||ORU^R01^ORU_R01|CTL1|P|2.5\rPID|1||P1\r"
+
+
+def frame(text, final=True, valid=True):
+    return ASTMFrame(1, text, final, valid)
+
+
+def test_defaults():
+    responder = Responder()
+    assert responder.astm(ENQ).control == ACK
+    assert responder.astm(frame(b"H|\\^&\r")).control == ACK
+    assert responder.astm(frame(b"H|\\^&\r", valid=False)).control == NAK
+    assert responder.astm(EOT) is None
+    assert responder.hl7(ORU).reply == "AA"
+
+
+def test_first_rule_wins():
+    responder = Responder([
+        {"protocol": "ASTM", "event": "ENQ", "reply": "NAK"},
+        {"protocol": "ASTM", "event": "ENQ", "reply": "ACK"},
+        {"protocol": "HL7", "reply": "AE"},
+        {"protocol": "HL7", "reply": "AA"},
+    ])
+    assert responder.astm(ENQ).control == NAK
+    assert responder.hl7(ORU).reply == "AE"
+
+
+def test_record_rule_beats_generic_frame_rule():
+    # Listed after the generic rule, still more specific
+    responder = Responder([
+        {"protocol": "ASTM", "event": "frame", "reply": "ACK"},
+        {"protocol": "ASTM", "event": "frame", "record": "q", "reply": "NAK"},
+    ])
+    assert responder.astm(frame(b"Q|1|^S1\r")).control == NAK
+    assert responder.astm(frame(b"R|1|^^^GLU|5\r")).control == ACK
+
+
+def test_etb_continuation_matches_its_record():
+    responder = Responder([
+        {"protocol": "ASTM", "event": "frame", "reply": "ACK"},
+        {"protocol": "ASTM", "event": "frame", "record": "R", "reply": "NAK"},
+        {"protocol": "ASTM", "event": "invalid", "reply": "NAK"},
+        {"protocol": "ASTM", "event": "invalid", "record": "R", "reply": "EOT"},
+    ])
+    assert responder.astm(frame(b"R|1|^^^GLU|5", final=False)).control == NAK
+    # A rejected continuation is resent, so it still belongs to the R record
+    assert responder.astm(frame(b"55555\r", valid=False)).control == EOT
+    assert responder.astm(frame(b"55555\r")).control == NAK
+    assert responder.astm(frame(b"L|1|N\r")).control == ACK
+
+
+def test_hl7_precedence():
+    rules = [
+        {"protocol": "HL7", "reply": "CA"},
+        {"protocol": "HL7", "message_type": "ORU", "reply": "CE"},
+        {"protocol": "HL7", "message_type": "ORU^R01", "reply": "CR"},
+        {"protocol": "HL7", "message_type": "ORU^R01^ORU_R01", "reply": "AR"},
+        {"protocol": "HL7", "control_id": "CTL1", "reply": "AE", "text": "Rejected"},
+        {"protocol": "HL7", "control_id": "CTL1", "message_type": "ORU", "reply": "AA"},
+    ]
+    response = Responder(rules).hl7(ORU)
+    assert response.reply == "AA"
+    assert Responder(rules[:5]).hl7(ORU).text == "Rejected"
+    assert Responder(rules[:4]).hl7(ORU).reply == "AR"
+    assert Responder(rules[:3]).hl7(ORU).reply == "CR"
+    assert Responder(rules[:2]).hl7(ORU).reply == "CE"
+    assert Responder(rules[:1]).hl7(ORU).reply == "CA"
+    assert Responder([rules[1]]).hl7(ORU.replace(b"ORU^R01^ORU_R01", b"QRY^A19")) is None
+
+
+def test_delay_and_none():
+    responder = Responder([
+        {"protocol": "ASTM", "event": "ENQ", "reply": "ACK", "delay_ms": 250},
+        {"protocol": "ASTM", "event": "EOT", "reply": "NONE"},
+        {"protocol": "HL7", "control_id": "CTL1", "reply": "NONE"},
+    ])
+    assert responder.astm(ENQ).delay == 0.25
+    assert responder.astm(EOT) is None
+    assert responder.hl7(ORU) is None
+
+
+@pytest.mark.parametrize("rule, message", [
+    ("ASTM", "expected an object"),
+    ({"protocol": "SERIAL", "reply": "ACK"}, "protocol"),
+    ({"protocol": "ASTM", "event": "STX", "reply": "ACK"}, "event"),
+    ({"protocol": "ASTM", "reply": "AA"}, "ASTM reply"),
+    ({"protocol": "ASTM", "event": "ENQ", "record": "R", "reply": "ACK"}, "record"),
+    ({"protocol": "ASTM", "record": "RR", "reply": "ACK"}, "record"),
+    ({"protocol": "HL7", "reply": "ACK"}, "HL7 reply"),
+    ({"protocol": "HL7", "reply": "AA", "delay_ms": "soon"}, "delay_ms"),
+    ({"protocol": "HL7", "reply": "AA", "delay_ms": -1}, "delay_ms"),
+])
+def test_invalid_rules(rule, message):
+    with pytest.raises(ResponderError, match=message):
+        Responder([{"protocol": "ASTM", "reply": "ACK"}, rule])
+
+
+def test_from_json():
+    assert Responder.from_json('[{"protocol": "HL7", "reply": "AE"}]').hl7(ORU).reply == "AE"
+    with pytest.raises(ResponderError, match="JSON list"):
+        Responder.from_json('{"protocol": "HL7"}')
+    with pytest.raises(ResponderError, match="valid JSON"):
+        Responder.from_json("[")
@@ -0,0 +1,22 @@
+import pytest
+from src.engine.results import ResultGenerator
+
+TESTS = [(1, "GLU", "mmol/l", 3.9, 6.1), (2, "CREA", "umol/l", 60.0, 110.0)]
+
+
+def test_values_are_within_range_and_reproducible():
+    values = ResultGenerator(seed=7).generate(50, TESTS)
+    assert len(values) == 50
+    for glu, crea in values:
+        assert 3.9 <= glu <= 6.1 and 60.0 <= crea <= 110.0
+    assert ResultGenerator(seed=7).generate(50, TESTS) == values
+
+
+def test_test_without_range_is_rejected():
+    with pytest.raises(ValueError, match="CREA"):
+        ResultGenerator().generate(1, [TESTS[0], (2, "CREA", "umol/l", None, 110.0)])
+
+
+def test_empty_batches():
+    assert ResultGenerator().generate(2, []) == [[], []]
+    assert ResultGenerator().generate(0, TESTS) == []
@@ -0,0 +1,47 @@
+from src.database.db_manger import DatabaseManager
+from src.database.sample_info import SampleInfoCache
+
+
+def test_unknown_samples_are_cached(db):
+    cache = SampleInfoCache(db)
+    try:
+        assert cache.get(["S1"]) == {"S1": None}
+        assert cache.get(["S1"]) == {"S1": None}
+        assert (cache.hits, cache.misses, cache.queries) == (1, 1, 1)
+    finally:
+        cache.close()
+
+
+def test_message_log_writes_keep_the_cache(db):
+    db.store_samples([("S1", "P1", "Doe^John")])
+    cache = SampleInfoCache(db)
+    try:
+        assert cache.get(["S1"]) == {"S1": ("P1", "Doe^John", [])}
+        # Committed from another connection, as the GUI's MessageLog does
+        other = DatabaseManager(db.db_path)
+        try:
+            other.store_messages([("2026-01-01 00:00:00", "A", "in", "ASTM", "", 0,
+                                   b"H|", "H|", ["S1"])])
+        finally:
+            other.close()
+        cache.get(["S1"])
+        assert (cache.hits, cache.invalidations) == (1, 0)
+    finally:
+        cache.close()
+
+
+def test_order_writes_from_another_connection_empty_the_cache(db):
+    db.store_samples([("S1", "P1", "Doe^John")])
+    cache = SampleInfoCache(db)
+    try:
+        cache.get(["S1"])
+        other = DatabaseManager(db.db_path)
+        try:
+            test = other.get_analyzer_config(1)["tests"][0]
+            other.store_results(["S1"], [test], [[5.0]])
+        finally:
+            other.close()
+        assert cache.get(["S1"]) == {"S1": ("P1", "Doe^John", [test[1]])}
+        assert (cache.hits, cache.invalidations) == (0, 1)
+    finally:
+        cache.close()
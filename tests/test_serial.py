@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+import pytest
+import serial
+from src.engine.link import open_link, open_serial, read_available
+from src.utils.astm import ASTMFrame, ACK, encode_records
+from src.utils.virtual_serial import VirtualSerialPair
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="virtual serial pairs need ptys")
+
+RECORDS = [b"H|\\^&|||SIM", b"R|1|^^^GLU|" + b"5" * 300, b"L|1|N"]
+
+
+@pytest.fixture
+def pair():
+    with VirtualSerialPair() as pair:
+        yield pair
+
+
+def settings(port, **extra):
+    return dict({"port": port, "baudrate": "9600"}, **extra)
+
+
+def read_exactly(port, size, timeout=5):
+    data = b""
+    deadline = time.monotonic() + timeout
+    while len(data) < size and time.monotonic() < deadline:
+        data += read_available(port)
+    return data
+
+
+def test_open_serial_applies_line_settings(pair):
+    port = open_serial(settings(pair.ports[0], data_bits="7", stop_bits="2", parity="Even"))
+    try:
+        assert (port.bytesize, port.stopbits, port.parity) == (serial.SEVENBITS, serial.STOPBITS_TWO,
+                                                                serial.PARITY_EVEN)
+    finally:
+        port.close()
+    port = open_serial(settings(pair.ports[0]))
+    try:
+        assert (port.bytesize, port.stopbits, port.parity) == (serial.EIGHTBITS, serial.STOPBITS_ONE,
+                                                                serial.PARITY_NONE)
+    finally:
+        port.close()
+
+
+def test_read_available_returns_partial_data(pair):
+    a, b = open_serial(settings(pair.ports[0])), open_serial(settings(pair.ports[1]))
+    try:
+        a.write(b"\x02" + b"1H|")
+        # Whatever has arrived, without waiting for the rest of the frame
+        assert read_exactly(b, 4) == b"\x021H|"
+        assert read_available(b) == b""
+    finally:
+        a.close()
+        b.close()
+
+
+def test_astm_frames_round_trip_through_serial_transport(pair):
+    frames = encode_records(RECORDS)
+
+    async def main():
+        link = await open_link("ASTM", "Serial", settings(pair.ports[0], data_bits="8", stop_bits="1",
+                                                           parity="No"))
+        peer = open_serial(settings(pair.ports[1]))
+        try:
+            # Frames written by the peer in pieces come out whole
+            for frame in frames:
+                middle = len(frame) // 2
+                peer.write(frame[:middle])
+                await asyncio.sleep(0.05)
+                peer.write(frame[middle:])
+            received = [await link.receive(5) for _ in frames]
+
+            link.write(b"".join(frames) + bytes([ACK]))
+            sent = await asyncio.to_thread(read_exactly, peer, sum(map(len, frames)) + 1)
+            return received, sent
+        finally:
+            link.close()
+            peer.close()
+
+    received, sent = asyncio.run(asyncio.wait_for(main(), 10))
+    assert all(isinstance(frame, ASTMFrame) and frame.valid for frame in received)
+    assert b"".join(frame.text for frame in received) == b"\r".join(RECORDS) + b"\r"
+    assert [frame.number for frame in received] == [1, 2, 3, 4]
+    assert sent == b"".join(frames) + bytes([ACK])
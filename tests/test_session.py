@@ -0,0 +1,133 @@
+import asyncio
+import time
+import pytest
+from src.engine import session as session_module
+from src.engine.session import AnalyzerSession, SessionError
+from src.utils.astm import ENQ, ACK, NAK, EOT, encode_frame
+from src.utils.hl7 import wrap, build_ack
+from tests.links import link_pair, fake_lis
+
+ORU = b"MSH|^~\\&|SIM||LIS||20250101||ORU^R01|CTL1|P|2.5\rPID|1||P1\r"
+ORM = b"MSH|^~\\&|LIS||SIM||20250101||ORM^O01|CTL2|P|2.5\rORC|NW|S1\r"
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+def test_send_astm_frames_every_record():
+    async def main():
+        analyzer, lis = link_pair("ASTM")
+        session = AnalyzerSession(analyzer, "ASTM")
+        frames = []
+        task = asyncio.create_task(fake_lis(lis, frames))
+        await session.send_astm([b"H|\\^&", b"R|1|^^^GLU|" + b"9" * 300, b"L|1|N"])
+        await session.close()
+        await task
+        return session, frames
+
+    session, frames = run(main())
+    assert [frame.number for frame in frames] == [1, 2, 3, 4]
+    assert [frame.final for frame in frames] == [True, False, True, True]
+    assert all(frame.valid for frame in frames)
+    assert session.frames_sent == 4 and session.messages_sent == 1
+
+
+def test_send_astm_retransmits_after_nak():
+    async def main():
+        analyzer, lis = link_pair("ASTM")
+        session = AnalyzerSession(analyzer, "ASTM", max_retries=2)
+        frames = []
+        task = asyncio.create_task(fake_lis(lis, frames, {"frame": b"\x15"}))
+        with pytest.raises(SessionError):
+            await session.send_astm([b"H|\\^&"])
+        await session.close()
+        await task
+        return session, frames
+
+    session, frames = run(main())
+    assert len(frames) == 2
+    assert session.retransmissions == 2
+
+
+def test_enq_is_repeated_after_the_busy_delay(monkeypatch):
+    monkeypatch.setattr(session_module, "ENQ_BUSY_DELAY", 0.2)
+
+    async def main():
+        analyzer, lis = link_pair("ASTM")
+        session = AnalyzerSession(analyzer, "ASTM", max_retries=3)
+        task = asyncio.create_task(fake_lis(lis, [], {ENQ: bytes([NAK])}))
+        started = time.monotonic()
+        with pytest.raises(SessionError, match="did not accept"):
+            await session.send_astm([b"H|\\^&"])
+        elapsed = time.monotonic() - started
+        await session.close()
+        await task
+        return session, elapsed
+
+    session, elapsed = run(main())
+    # Two waits between three ENQs, none after the last
+    assert 0.4 <= elapsed < 0.6
+    assert session.metrics.naks_received.value >= 3
+
+
+def test_receive_astm_skips_repeated_frames():
+    received = []
+
+    async def main():
+        analyzer, lis = link_pair("ASTM")
+        session = AnalyzerSession(analyzer, "ASTM", on_message=received.append)
+        lis.write(bytes([ENQ]))
+        assert await lis.receive() == ACK
+        for frame in (encode_frame(1, b"H|\\^&\r"), encode_frame(1, b"H|\\^&\r"),
+                      encode_frame(2, b"Q|1|^S1\r"), encode_frame(3, b"L|1|N\r")):
+            lis.write(frame)
+            assert await lis.receive() == ACK
+        lis.write(bytes([EOT]))
+        await asyncio.sleep(0.01)
+        await session.close()
+
+    run(main())
+    assert received == [[b"H|\\^&", b"Q|1|^S1", b"L|1|N"]]
+
+
+def test_send_hl7_checks_the_ack_code():
+    async def main():
+        analyzer, lis = link_pair("HL7")
+        session = AnalyzerSession(analyzer, "HL7")
+
+        async def answer(code):
+            lis.write(wrap(build_ack(await lis.receive(), code)))
+
+        task = asyncio.create_task(answer("AA"))
+        reply = await session.send_hl7(ORU)
+        await task
+        task = asyncio.create_task(answer("AE"))
+        with pytest.raises(SessionError):
+            await session.send_hl7(ORU)
+        await task
+        await session.close()
+        return reply
+
+    assert b"MSA|AA|CTL1" in run(main())
+
+
+def test_failing_handler_fails_the_pending_reply():
+    def broken(message):
+        raise RuntimeError("handler bug")
+
+    async def main():
+        analyzer, lis = link_pair("HL7")
+        session = AnalyzerSession(analyzer, "HL7", on_message=broken)
+        sending = asyncio.create_task(session.send_hl7(ORU))
+        await lis.receive()
+        # An order arrives before the ACK; its handler raises
+        lis.write(wrap(ORM))
+        with pytest.raises(SessionError):
+            await sending
+        with pytest.raises(SessionError):
+            await session.send_hl7(ORU)
+        assert not session.connected
+        await session.close()
+
+    run(main())
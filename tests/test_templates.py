@@ -0,0 +1,59 @@
+import pytest
+from src.utils.templates import compile_template, TemplateCache, TemplateError
+
+TEMPLATE = """Send: <ENQ>
+Read: <ACK>
+Send: <STX>1H|\\^&|||{analyzer}|||||||P||{timestamp}<CR><ETX>4F<CR><LF>
+Read: <ACK>
+send: < stx >P|1|{patient_id}|||{patient_name}<CR><ETX>
+Read: <ACK>
+Send: <STX>R|{index}|^^^{test_code}|{result}|{unit}|{lower}-{upper}|{flag}<CR><ETX>
+Read: <ACK>
+Send: <STX>L|1|N<CR><ETX>
+Read:
+Send: <EOT>
+"""
+
+CONTEXT = {"analyzer": "SIM", "timestamp": "20250101120000", "sample_id": "S1",
+           "patient_id": "P1", "patient_name": "Ann"}
+RESULTS = [((1, "GLU", "mmol/l", 3.9, 6.1), 7.2), ((2, "UREA", "mmol/l", 2.5, 7.8), 4.0)]
+
+
+def test_records_substitute_sample_and_test_fields():
+    records = compile_template(TEMPLATE).records(CONTEXT, RESULTS)
+    assert records == [
+        b"H|\\^&|||SIM|||||||P||20250101120000",
+        b"P|1|P1|||Ann",
+        b"R|1|^^^GLU|7.2|mmol/l|3.9-6.1|H",
+        b"R|2|^^^UREA|4.0|mmol/l|2.5-7.8|N",
+        b"L|1|N",
+    ]
+
+
+def test_timestamp_defaults_to_now():
+    records = compile_template(TEMPLATE).records(dict(CONTEXT, timestamp=None), [])
+    assert len(records[0].split(b"|")[-1]) == 14
+
+
+def test_etb_frames_continue_the_record():
+    plan = compile_template("Send: <STX>O|1|{sample_id}<ETB>\nRead: <ACK>\nSend: <STX>|R<CR><ETX>")
+    assert plan.records(CONTEXT, []) == [b"O|1|S1|R"]
+
+
+@pytest.mark.parametrize("content, message", [
+    ("Send: <STX>P|1|{nope}<CR><ETX>", "unknown field"),
+    ("Send: <STX>P|1<ETX>", "must end with <CR>"),
+    ("Wait: <ACK>", "expected 'Send:' or 'Read:'"),
+    ("Send: hello", "expected control characters"),
+    ("Send: <STX>P|1<ETB>", "ends inside a record"),
+])
+def test_errors(content, message):
+    with pytest.raises(TemplateError, match=message):
+        compile_template(content)
+
+
+def test_cache_recompiles_only_changed_templates():
+    cache = TemplateCache()
+    plan = cache.get(1, "result_send", TEMPLATE)
+    assert cache.get(1, "result_send", TEMPLATE) is plan
+    assert cache.get(1, "result_send", TEMPLATE + "Read: <ACK>\n") is not plan
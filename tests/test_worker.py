@@ -0,0 +1,87 @@
+import threading
+import pytest
+from src.database.worker import DatabaseWorker, JobCancelled
+
+
+@pytest.fixture
+def worker(db):
+    worker = DatabaseWorker(db)
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+def test_jobs_run_in_submission_order_on_one_thread(worker):
+    calls = []
+
+    def call(number):
+        calls.append((number, threading.current_thread().name))
+        return number
+
+    jobs = [worker.submit(call, number) for number in range(20)]
+    assert [job.future.result(5) for job in jobs] == list(range(20))
+    assert calls == [(number, "database-worker") for number in range(20)]
+
+
+def test_results_and_errors_reach_the_callbacks(worker):
+    done = []
+    errors = []
+    worker.submit(lambda: 42, on_done=done.append, on_error=errors.append).future.result(5)
+
+    def fail():
+        raise ValueError("no such sample")
+
+    job = worker.submit(fail, on_done=done.append, on_error=errors.append)
+    with pytest.raises(ValueError):
+        job.future.result(5)
+    assert done == [42]
+    assert [str(error) for error in errors] == ["no such sample"]
+
+
+def test_queued_jobs_can_be_cancelled(worker):
+    release = threading.Event()
+    blocker = worker.submit(release.wait, 5)
+    cancelled = worker.submit(lambda: "ran")
+    cancelled.cancel()
+    by_future = worker.submit(lambda: "ran")
+    assert by_future.future.cancel()
+    after = worker.submit(lambda: "after")
+    release.set()
+    assert blocker.future.result(5) is True
+    with pytest.raises(JobCancelled):
+        cancelled.future.result(5)
+    assert after.future.result(5) == "after"
+    assert by_future.future.cancelled()
+
+
+def test_running_job_stops_at_its_next_progress_report(worker):
+    started = threading.Event()
+    release = threading.Event()
+    reports = []
+
+    def long_call(progress):
+        for done in range(1, 4):
+            progress(done, 3)
+            if done == 1:
+                started.set()
+                release.wait(5)
+        return "finished"
+
+    job = worker.submit_job(long_call, on_progress=lambda done, total: reports.append(done))
+    started.wait(5)
+    job.cancel()
+    release.set()
+    with pytest.raises(JobCancelled):
+        job.future.result(5)
+    assert reports == [1]
+
+
+def test_cancelled_bulk_write_rolls_back(db, worker):
+    def cancel_after_first_chunk(done, total):
+        job.cancel()
+
+    samples = [(f"S{n}", "", "") for n in range(10)]
+    job = worker.submit_job(db.store_samples, samples, chunk_size=5, on_progress=cancel_after_first_chunk)
+    with pytest.raises(JobCancelled):
+        job.future.result(5)
+    assert db.query_one("SELECT COUNT(*) FROM samples")[0] == 0
@@ -0,0 +1,89 @@
+import asyncio
+from src.engine.workload import Workload, VirtualClock, percentile
+
+
+def samples_done(workload):
+    return [(sample, now) for kind, now, sample, _ in workload.events() if kind == "sample"]
+
+
+def test_stat_sample_loaded_together_goes_first():
+    workload = Workload(channels=1, default_turnaround=10)
+    for number in ("R1", "R2", "S1"):
+        workload.add_sample(number, ["GLU"], stat=number == "S1")
+    assert samples_done(workload) == [("S1", 10), ("R1", 20), ("R2", 30)]
+
+
+def test_stat_sample_overtakes_waiting_routine_tests():
+    workload = Workload(channels=1, default_turnaround=10)
+    workload.add_sample("R1", ["GLU"])
+    workload.add_sample("R2", ["GLU"])
+    workload.add_sample("S1", ["GLU"], at=5, stat=True)
+    # R1 is already running when S1 arrives; R2 is still waiting
+    assert samples_done(workload) == [("R1", 10), ("S1", 20), ("R2", 30)]
+    assert workload.stats.summary(True)["max"] == 15
+
+
+def test_channels_run_tests_in_parallel():
+    workload = Workload(channels=3, default_turnaround=10)
+    workload.add_sample("S1", ["GLU", "UREA", "CREA"])
+    events = list(workload.events())
+    assert [event[1] for event in events] == [10, 10, 10, 10]
+    assert events[-1] == ("sample", 10, "S1", None)
+    assert workload.stats.utilization() == 1.0
+
+
+def test_cycle_pipelines_a_channel():
+    workload = Workload(channels=1, cycle=2, turnarounds={"GLU": 10})
+    workload.add_sample("S1", ["GLU", "GLU", "GLU"])
+    results = [now for kind, now, _, _ in workload.events() if kind == "result"]
+    assert results == [10, 12, 14]
+    assert workload.stats.busy == 6
+
+
+def test_sample_without_tests_is_done_on_arrival():
+    workload = Workload()
+    workload.add_sample("S1", [], at=3)
+    assert list(workload.events()) == [("sample", 3, "S1", None)]
+
+
+def test_one_step_per_sample_paces_at_turnaround():
+    workload = Workload(default_turnaround=1.5)
+    for number in ("S1", "S2", "S3"):
+        workload.add_sample(number, [None])
+    assert samples_done(workload) == [("S1", 1.5), ("S2", 3.0), ("S3", 4.5)]
+
+
+def test_run_follows_the_clock():
+    workload = Workload(default_turnaround=5)
+    workload.add_sample("S1", ["GLU"])
+    clock = VirtualClock(0)
+
+    async def main():
+        return [event async for event in workload.run(clock)]
+
+    events = asyncio.run(main())
+    assert [kind for kind, _, _, _ in events] == ["result", "sample"]
+    assert clock.now == 5
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.95) == 95
+    assert percentile([7], 0.95) == 7
+
+
+def test_sample_without_tests_in_a_mixed_rack():
+    workload = Workload(default_turnaround=10)
+    workload.add_sample("A", ["GLU"])
+    workload.add_sample("B", [])
+    assert list(workload.events()) == [("sample", 0, "B", None), ("result", 10, "A", "GLU"),
+                                       ("sample", 10, "A", None)]
+
+
+def test_workload_can_run_again():
+    workload = Workload(default_turnaround=10)
+    workload.add_sample("S1", ["GLU"])
+    first = list(workload.events())
+    assert list(workload.events()) == first
+    assert workload.stats.samples == 1